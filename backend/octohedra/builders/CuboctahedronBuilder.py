@@ -2,6 +2,7 @@ from dataclasses import dataclass
 
 from octohedra.builders.FlakeBuilder import FlakeBuilder
 from octohedra.builders.OctoBuilder import OctoBuilder
+from octohedra.grid import GridExpression
 from octohedra.grid.OctoGrid import OctoGrid
 from octohedra.grid.OctoVector import OctoVector
 from octohedra.utils import OctoConfigs
@@ -13,19 +14,27 @@ class CuboctahedronBuilder(OctoBuilder):
     iteration: int = 0
     center: OctoVector = OctoVector()
 
-    def materialize_additive(self, bonus_iteration=0):
+    def flakes(self):
+        """The six flakes at the corners, before cropping to the cuboctahedron"""
         i = self.iteration
         d = p2(i, 1)
+        return [FlakeBuilder(i, center=center) for center in
+                (OctoVector(), Z * 2 * d, X * d + Z * d, -X * d + Z * d, Y * d + Z * d,
+                 -Y * d + Z * d)]
+
+    def expression(self):
+        d = p2(self.iteration, 1)
+        flakes = GridExpression.Union(*(flake.expression() for flake in self.flakes()))
+        return GridExpression.Crop(flakes, (-d, -d, 0), (d, d, 2 * d))
+
+    def materialize_into(self, target: OctoGrid, bonus_iteration=0, clip=None):
+        d = p2(self.iteration, 1)
         grid = OctoGrid()
-        grid += FlakeBuilder(i).materialize_additive()
-        grid += FlakeBuilder(i, center=Z * 2 * d).materialize_additive()
-        grid += FlakeBuilder(i, center=X * d + Z * d).materialize_additive()
-        grid += FlakeBuilder(i, center=-X * d + Z * d).materialize_additive()
-        grid += FlakeBuilder(i, center=Y * d + Z * d).materialize_additive()
-        grid += FlakeBuilder(i, center=-Y * d + Z * d).materialize_additive()
+        for flake in self.flakes():
+            flake.materialize_into(grid)
         grid = grid.crop(-d, d, -d, d, 0, 2 * d)
 
-        return grid
+        return target.merge(grid)
 
 
 def test():
@@ -1,10 +1,11 @@
 from dataclasses import dataclass
 
+from octohedra.builders import FlakeKernel
 from octohedra.builders.OctoBuilder import OctoBuilder
+from octohedra.grid import GridExpression
 from octohedra.grid.OctoGrid import OctoGrid
 from octohedra.grid.OctoVector import OctoVector
 from octohedra.utils import OctoConfigs, RenderUtils
-from octohedra.utils.OctoUtil import DOWN, UP, E, N, S, W, p2
 
 
 @dataclass
@@ -13,23 +14,16 @@ class FlakeBuilder(OctoBuilder):
     center: OctoVector = OctoVector()
     scale: int = 0  # And this one represents how big the individual octos are
 
-    def materialize_additive(self, bonus_iteration=0):
-        grid = OctoGrid()
-        self.materialize_flake(grid, self.iteration, self.center)
+    def materialize_into(self, grid: OctoGrid, bonus_iteration=0, clip=None):
+        self.materialize_flake(grid, self.iteration, self.center, clip)
         return grid
 
-    def materialize_flake(self, grid: OctoGrid, i: int, c: OctoVector):
-        if i == 0:
-            grid.insert_cell(c)
-            return
-        elif i <= self.scale:
-            radius = p2(i + 1)
-            grid.fill(radius, c)
-            return
-
-        for direction in (E, N, W, S, UP, DOWN):
-            # print(c +p2(i - 1) * 2 * direction)
-            self.materialize_flake(grid, i - 1, c + p2(i - 1) * 2 * direction)
+    def expression(self):
+        flake = GridExpression.Flake.of(self.iteration, scale=self.scale)
+        return GridExpression.Translate(flake, [self.center])
+
+    def materialize_flake(self, grid: OctoGrid, i: int, c: OctoVector, clip=None):
+        FlakeKernel.insert_flake(grid, c, i, scale=self.scale, clip=clip)
 
 
 def generate_test_shapes():
@@ -0,0 +1,86 @@
+"""
+The basic octahedron flake as arrays of cell centers.
+
+A flake of depth i is six flakes of depth i - 1, moved 2^i along each axis. Rather than recursing
+once per sub-flake, the kernel expands an (n, 3) array of centers to (6n, 3) per level with one
+broadcast add. The centers of a flake only depend on its depth, shape and scale, so each
+combination is expanded once, cached, and translated to wherever a flake is needed.
+
+Given a clip box, the kernel expands level by level from the flake's center instead, and drops
+every branch whose sub-flake lies entirely outside the box before expanding it further.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from octohedra.grid import Lattice
+from octohedra.utils.OctoUtil import DOWN, UP, E, N, S, W, p2
+
+# Same order as the builders recursed in
+DIRECTIONS = np.array([E, N, W, S, UP, DOWN], dtype=np.int64)
+
+
+@lru_cache(maxsize=None)
+def flake_offsets(depth, shape="fractal", scale=0) -> np.ndarray:
+    """
+    The cell centers of a flake around the origin, as a read-only (N, 3) array in key order.
+
+    Levels at or below scale are filled solid instead of branching further, like FlakeBuilder's
+    scale. A "solid" flake is a single fill as big as the whole fractal, like a solid recipe
+    layer.
+    """
+    if depth > 0 and shape == "solid":
+        centers = Lattice.ball(p2(depth + 1) - 1)
+    else:
+        centers = np.zeros((1, 3), dtype=np.int64)
+        level = depth
+        while level > max(scale, 0):
+            centers = (centers[:, None] + p2(level) * DIRECTIONS[None]).reshape(-1, 3)
+            level -= 1
+        if level > 0:
+            centers = (centers[:, None] + Lattice.ball(p2(level + 1))[None]).reshape(-1, 3)
+
+    centers = Lattice.unpack(Lattice.sorted_keys(centers))
+    centers.setflags(write=False)
+    return centers
+
+
+def reach(depth) -> int:
+    """How far the cells of a flake of any shape or scale can be from its center along an axis"""
+    return p2(depth + 1) - 1 if depth > 0 else 0
+
+
+def in_box(centers, low, high, margin=0) -> np.ndarray:
+    """Which centers are within margin of the box from low to high, bounds included"""
+    return ((centers >= np.subtract(low, margin)) & (centers <= np.add(high, margin))).all(axis=1)
+
+
+def flake_centers(centers, depth, shape="fractal", scale=0, clip=None) -> np.ndarray:
+    """
+    The cells of a flake at each of an (M, 3) array of centers, as one (M * N, 3) array.
+
+    clip is an optional (low, high) box, with infinite bounds where it's open. Only the cells
+    inside it are returned, and branches that are entirely outside it are never expanded.
+    """
+    centers = Lattice.as_centers(centers)
+    if clip is None:
+        return (centers[:, None] + flake_offsets(depth, shape, scale)[None]).reshape(-1, 3)
+
+    low, high = clip
+    level = depth
+    centers = centers[in_box(centers, low, high, reach(level))]
+    if shape != "solid":
+        while level > max(scale, 0) and len(centers):
+            centers = (centers[:, None] + p2(level) * DIRECTIONS[None]).reshape(-1, 3)
+            level -= 1
+            centers = centers[in_box(centers, low, high, reach(level))]
+
+    centers = (centers[:, None] + flake_offsets(level, shape, scale)[None]).reshape(-1, 3)
+    return centers[in_box(centers, low, high)]
+
+
+def insert_flake(grid, center, depth, shape="fractal", scale=0, clip=None):
+    """Inserts a flake into grid the way recursing down to insert_cell and fill would, leaving
+    out the cells outside the clip box if there is one"""
+    grid.insert_cells(flake_centers([tuple(center)], depth, shape, scale, clip))
+    return grid
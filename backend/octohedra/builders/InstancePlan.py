@@ -0,0 +1,306 @@
+"""
+Builder trees compiled into flat plans of flake instances.
+
+However a builder arranges its children, what it places in the end is flakes: a flake template
+(depth, shape, scale) at some translation. A plan is just that, every template with a
+de-duplicated (M, 3) array of translations, plus the crop box of a builder that crops its result.
+Building from a plan skips constructing and walking the tree: each template is expanded once and
+broadcast to all of its translations.
+
+Plans are compiled from a builder's GridExpression. Translations and unions flatten, and mirrored
+flakes are flakes at the mirrored centers, since flakes are symmetric under every axis swap and
+flip. Plans are cached on disk, keyed by the builder's class and constructor arguments and by
+the source of the modules that decide where flakes go (PLAN_SOURCES), so a builder that has been
+compiled once is never constructed again until that code changes.
+"""
+import hashlib
+import math
+import os
+from functools import cache
+from pathlib import Path
+
+import numpy as np
+
+from octohedra.builders import FlakeKernel
+from octohedra.grid import GridExpression, InstanceMesh, Lattice, Symmetry
+from octohedra.grid.GridExpression import NO_OFFSET
+from octohedra.utils import OctoConfigs
+from octohedra.utils.LruCache import LruCache
+
+# Part of every plan key, so that plans cached in an older format are never loaded
+PLAN_VERSION = 1
+
+# The modules whose source is part of every plan key, relative to the octohedra package: every
+# builder and the flake kernel, the expressions and symmetries plans are compiled from, and the
+# vectors and helpers builders place flakes with
+PLAN_SOURCES = ("builders/*.py", "grid/GridExpression.py", "grid/Symmetry.py", "grid/OctoVector.py",
+                "utils/OctoUtil.py")
+
+# The most recently used plans by plan_key, on top of the ones saved to disk
+PLANS = LruCache(16)
+
+# The cells two templates share, by (template, other, where other is relative to template); see
+# overlap
+OVERLAPS = LruCache(4096)
+
+
+class NotCompilable(NotImplementedError):
+    """Raised for builders and expressions that place more than translated flakes"""
+
+
+def _plain(value):
+    """value with its vectors as plain tuples and its sets and dicts in sorted order, so its repr
+    only depends on what it holds"""
+    if isinstance(value, (tuple, list)):
+        return tuple(map(_plain, value))
+    if isinstance(value, (set, frozenset)):
+        return "set", tuple(sorted(map(_plain, value)))
+    if isinstance(value, dict):
+        return "dict", tuple(sorted((key, _plain(item)) for key, item in value.items()))
+    return value
+
+
+@cache
+def source_hash() -> str:
+    """A hash of the source of the PLAN_SOURCES modules"""
+    package = Path(__file__).parent.parent
+    digest = hashlib.sha1()
+    for path in sorted(path for pattern in PLAN_SOURCES for path in package.glob(pattern)):
+        digest.update(path.relative_to(package).as_posix().encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def plan_key(cls, *args, **kwargs) -> str:
+    """The cache key of the plan of cls(*args, **kwargs)"""
+    parameters = (PLAN_VERSION, source_hash(), cls.__module__, cls.__qualname__, _plain(args),
+                  _plain(kwargs))
+    return hashlib.sha1(repr(parameters).encode()).hexdigest()
+
+
+def overlap(template, other, offset) -> np.ndarray:
+    """The centers of template that other, moved by offset, also has"""
+    key = (template, other, offset)
+    cells = OVERLAPS.get(key)
+    if cells is None:
+        theirs = FlakeKernel.flake_offsets(*other) + offset
+        mine = Lattice.pack(FlakeKernel.flake_offsets(*template))
+        cells = theirs[Lattice.contains(mine, Lattice.pack(theirs))]
+        OVERLAPS[key] = cells
+    return cells
+
+
+class InstancePlan:
+    """Every flake a builder places, as {(depth, shape, scale): (M, 3) translations}, and the
+    (low, high) box its cells are cropped to, if any"""
+
+    def __init__(self, instances=None, clip=None):
+        self.instances = {template: Lattice.unpack(Lattice.sorted_keys(translations))
+                          for template, translations in (instances or {}).items()
+                          if len(translations)}
+        self.clip = clip
+
+    def __len__(self):
+        return sum(len(translations) for translations in self.instances.values())
+
+    def count(self) -> int:
+        """
+        The number of cells in the plan's grid, worked out from its templates without building
+        it. Instances count the cells they have inside the clip box, less the ones an earlier
+        instance has too. Those are found for each pair of instances whose boxes meet, once per
+        pair of templates and offset between them (see overlap).
+        """
+        if not self.instances:
+            return 0
+        templates = sorted(self.instances)
+        cells = [FlakeKernel.flake_offsets(*template) for template in templates]
+        kinds = np.repeat(np.arange(len(templates)),
+                          [len(self.instances[template]) for template in templates])
+        translations = np.concatenate([self.instances[template] for template in templates])
+        low = np.array([c.min(axis=0) for c in cells])[kinds] + translations
+        high = np.array([c.max(axis=0) for c in cells])[kinds] + translations
+
+        clip_low, clip_high = self.clip or ((-math.inf,) * 3, (math.inf,) * 3)
+        kept = ((high >= clip_low) & (low <= clip_high)).all(axis=1)
+        kinds, translations, low, high = kinds[kept], translations[kept], low[kept], high[kept]
+
+        # Cells inside the box, only counted one by one for instances across its faces
+        total = 0
+        inside = ((low >= clip_low) & (high <= clip_high)).all(axis=1)
+        sizes = np.array([len(c) for c in cells])
+        total += int(sizes[kinds[inside]].sum())
+        across = dict()
+        for kind, translation in zip(kinds[~inside].tolist(), translations[~inside].tolist()):
+            box = (kind, tuple(np.subtract(clip_low, translation).tolist()),
+                   tuple(np.subtract(clip_high, translation).tolist()))
+            if box not in across:
+                across[box] = int(((cells[kind] >= box[1]) & (cells[kind] <= box[2]))
+                                  .all(axis=1).sum())
+            total += across[box]
+
+        # Pairs of instances whose boxes meet: sorted by their lowest x, each instance can only
+        # meet the ones after it that start before it ends along x
+        order = np.argsort(low[:, 0], kind="stable")
+        ends = np.searchsorted(low[order, 0], high[order, 0], side="right")
+        starts = np.arange(1, len(order) + 1)
+        counts = np.maximum(ends - starts, 0)
+        first = np.repeat(np.arange(len(order)), counts)
+        second = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) \
+            + np.repeat(starts, counts)
+        first, second = order[first], order[second]
+        meet = ((low[first, 1:] <= high[second, 1:]) & (high[first, 1:] >= low[second, 1:]))
+        first, second = first[meet.all(axis=1)], second[meet.all(axis=1)]
+        if len(first) == 0:
+            return total
+
+        # Grouped by templates and offset, so each overlap is only looked up once
+        pairs = np.column_stack((kinds[first], kinds[second],
+                                 translations[second] - translations[first]))
+        groups, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        by_group = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[by_group], np.arange(len(groups) + 1))
+        shared, owners = [], []
+        for group, (kind, other, *offset) in enumerate(groups.tolist()):
+            rows = by_group[bounds[group]:bounds[group + 1]]
+            common = overlap(templates[kind], templates[other], tuple(offset))
+            if len(common):
+                shared.append((common[None] + translations[first[rows]][:, None]).reshape(-1, 3))
+                owners.append(np.repeat(second[rows], len(common)))
+        if not shared:
+            return total
+
+        # Every shared cell in the box is counted once less for each later instance that has it
+        shared, owners = np.concatenate(shared), np.concatenate(owners)
+        in_box = ((shared >= clip_low) & (shared <= clip_high)).all(axis=1)
+        repeats = np.unique(np.column_stack((owners[in_box], Lattice.pack(shared[in_box]))),
+                            axis=0)
+        return total - len(repeats)
+
+    def expression(self) -> GridExpression.Expression:
+        """The plan as a GridExpression: one broadcast translation per template"""
+        expression = GridExpression.Union(*(
+            GridExpression.Translate(GridExpression.Flake.of(*template), translations)
+            for template, translations in sorted(self.instances.items())))
+        if self.clip is not None:
+            expression = GridExpression.Crop(expression, *self.clip)
+        return expression
+
+    def materialize_into(self, grid):
+        """Inserts the plan's cells into grid, like materializing the builder would"""
+        return self.expression().materialize_into(grid)
+
+    def render(self, config=OctoConfigs.default, rotate=True):
+        """
+        The trimmed mesh of the plan's grid. Each template's mesh is rendered once and translated
+        to its instances; only the cells at seams between instances or at the crop box are
+        trimmed and rendered against the whole grid (see InstanceMesh).
+        """
+        centers, flags = self.expression().evaluate()
+        templates = [(template, FlakeKernel.flake_offsets(*template), translations)
+                     for template, translations in sorted(self.instances.items())]
+        return InstanceMesh.render(templates, centers, flags, self.clip, config, rotate)
+
+    def save(self, path):
+        """Writes the plan to an .npz file, replacing whatever is there in one step"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        templates = sorted(self.instances)
+        arrays = {
+            "depths": np.array([depth for depth, _, _ in templates], dtype=np.int64),
+            "shapes": np.array([shape for _, shape, _ in templates], dtype=str),
+            "scales": np.array([scale for _, _, scale in templates], dtype=np.int64),
+            "counts": np.array([len(self.instances[t]) for t in templates], dtype=np.int64),
+            "translations": np.concatenate([self.instances[t] for t in templates])
+            if templates else np.empty((0, 3), dtype=np.int64),
+        }
+        if self.clip is not None:
+            arrays["clip"] = np.array(self.clip, dtype=float)
+
+        partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(partial, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path) -> "InstancePlan":
+        with np.load(path, allow_pickle=False) as arrays:
+            templates = zip(arrays["depths"].tolist(), arrays["shapes"].tolist(),
+                            arrays["scales"].tolist())
+            translations = np.split(arrays["translations"], np.cumsum(arrays["counts"])[:-1])
+            clip = tuple(map(tuple, arrays["clip"].tolist())) if "clip" in arrays else None
+            return cls(dict(zip(templates, translations)), clip)
+
+
+def compile_builder(builder) -> InstancePlan:
+    """Flattens a builder tree into a plan"""
+    expression = builder.expression()
+    if expression is None:
+        raise NotCompilable(f"{builder} can't be compiled without building it.")
+    return compile_expression(expression)
+
+
+def compile_expression(expression) -> InstancePlan:
+    """
+    Flattens an expression into a plan. It may only be made of flakes, translations, unions and
+    symmetries of unflagged cells, under at most one crop at the top; anything else raises
+    NotCompilable.
+    """
+    clip = None
+    if isinstance(expression, GridExpression.Crop):
+        clip = (expression.low, expression.high)
+        expression = expression.child
+    return InstancePlan(_instances(expression, dict()), clip)
+
+
+def _instances(node, memo) -> dict:
+    """The flakes node places, as {template: translations}. Shared sub-trees are only flattened
+    once, memoized by id."""
+    if id(node) in memo:
+        return memo[id(node)]
+
+    if isinstance(node, GridExpression.Flake):
+        instances = {(node.depth, node.shape, node.scale): NO_OFFSET}
+    elif isinstance(node, GridExpression.Empty):
+        instances = dict()
+    elif isinstance(node, GridExpression.Translate):
+        instances = {template: (translations[None] + node.offsets[:, None]).reshape(-1, 3)
+                     for template, translations in _instances(node.child, memo).items()}
+    elif isinstance(node, GridExpression.Union):
+        gathered = dict()
+        for child in node.children:
+            for template, translations in _instances(child, memo).items():
+                gathered.setdefault(template, []).append(translations)
+        instances = {template: np.concatenate(translations)
+                     for template, translations in gathered.items()}
+    elif isinstance(node, GridExpression.Symmetric) and not node.child.flagged:
+        # Without flags to carry over, the image of a flake is the flake at the image of its center
+        instances = {template: Symmetry.apply(translations, node.stages)[0]
+                     for template, translations in _instances(node.child, memo).items()}
+    else:
+        raise NotCompilable(f"{type(node).__name__} can't be compiled into flake instances.")
+
+    instances = {template: Lattice.unpack(Lattice.sorted_keys(translations))
+                 for template, translations in instances.items()}
+    memo[id(node)] = instances
+    return instances
+
+
+def cached_plan(cls, *args, plan_dir=None, **kwargs) -> InstancePlan:
+    """
+    The plan of cls(*args, **kwargs), from memory or from plan_dir (config.PLAN_DIR by default) if
+    it was compiled before. Otherwise the builder is constructed and compiled, and the plan saved.
+    """
+    from octohedra.config import PLAN_DIR
+
+    key = plan_key(cls, *args, **kwargs)
+    plan = PLANS.get(key)
+    if plan is None:
+        path = Path(plan_dir or PLAN_DIR) / f"{key}.npz"
+        if path.exists():
+            plan = InstancePlan.load(path)
+        else:
+            plan = compile_builder(cls(*args, **kwargs))
+            plan.save(path)
+        plan = PLANS.setdefault(key, plan)
+    return plan
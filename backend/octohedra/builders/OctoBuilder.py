@@ -1,10 +1,17 @@
+import math
 from dataclasses import dataclass, field
-from functools import reduce
 
+from octohedra.grid import Analysis, GridExpression
 from octohedra.grid.OctoGrid import OctoGrid
 from octohedra.utils import OctoConfigs, RenderUtils
 
 
+def clip_box(x_min=-math.inf, x_max=math.inf, y_min=-math.inf, y_max=math.inf,
+             z_min=-math.inf, z_max=math.inf):
+    """The (low, high) corners of a clip box, from the same bounds OctoGrid.crop takes"""
+    return (x_min, y_min, z_min), (x_max, y_max, z_max)
+
+
 @dataclass
 class OctoBuilder:
     """Represents a generalized flake-like thing that knows how to materialize itself to an
@@ -60,17 +67,57 @@ class OctoBuilder:
         """
         pass
 
-    def materialize(self):
+    def materialize(self, clip=None):
         """
         Generate a grid containing this flake alone.
 
         Call this on the root of your tree of OctoBuilders. You shouldn't need to override this.
+
+        clip is an optional (low, high) box (see clip_box) to crop the grid to, as OctoGrid.crop
+        would. Builders skip whatever lies entirely outside it, so cropping this way is cheaper
+        than cropping afterwards.
         """
-        grid = self.materialize_additive()
+        expression = self.expression()
+        if expression is None:
+            grid = self.materialize_additive(clip=clip)
+            if clip is not None:
+                (x_min, y_min, z_min), (x_max, y_max, z_max) = clip
+                grid.crop(x_min, x_max, y_min, y_max, z_min, z_max)
+        else:
+            if clip is not None:
+                expression = GridExpression.Crop(expression, *clip)
+            grid = expression.materialize_into(OctoGrid())
         self.materialize_subtractive(grid)
         return grid
 
-    def materialize_additive(self, bonus_iteration=0):
+    def expression(self):
+        """
+        This flake as a lazy GridExpression, which materialize simplifies and evaluates instead of
+        calling materialize_into, or None if the flake can only be built cell by cell.
+
+        By default that's the union of the children's expressions, unless materialize_into is
+        overridden or some child has none.
+        """
+        if type(self).materialize_into is not OctoBuilder.materialize_into:
+            return None
+        children = [child.expression() for child in self.children]
+        if any(child is None for child in children):
+            return None
+        return GridExpression.Union(*children)
+
+    def analyze(self, config=OctoConfigs.default, clip=None) -> dict:
+        """
+        Predicts the size of this flake's grid and mesh without building either; see
+        Analysis.analyze. clip crops the grid like it does in materialize.
+        """
+        expression = self.expression()
+        if expression is None:
+            raise NotImplementedError(f"{self} can't be analyzed without building it.")
+        if clip is not None:
+            expression = GridExpression.Crop(expression, *clip)
+        return Analysis.analyze(expression, config)
+
+    def materialize_additive(self, bonus_iteration=0, clip=None):
         """
         Add to the given grid every cell that this flake could conceivably need.
 
@@ -81,13 +128,28 @@ class OctoBuilder:
         rectangular and
         octahedral regions. Any functionality beyond that should be in an Octohedra subclass.
         """
+        grid = OctoGrid()
+        self.materialize_into(grid, bonus_iteration, clip)
+        return grid
+
+    def materialize_into(self, grid: OctoGrid, bonus_iteration=0, clip=None):
+        """
+        Insert this flake's cells straight into grid, which may already hold other flakes' cells.
+
+        Children write into the same grid, so building a tree never creates intermediate grids or
+        copies cells from one grid to another. Override this rather than materialize_additive; a
+        builder that has to work on its own cells (six_way, crop) can build a private grid and
+        merge it in.
+
+        Cells outside the clip box, if there is one, may be left out. They don't have to be, so
+        a builder that can't tell where its cells will end up can ignore it.
+        """
         self.populate()
 
-        if len(self.children) == 0:
-            return OctoGrid()
-        sub_grids = [child.materialize_additive() for child in self.children]
+        for child in self.children:
+            child.materialize_into(grid, clip=clip)
 
-        return reduce(OctoGrid.merge, sub_grids)
+        return grid
 
     def materialize_subtractive(self, grid: OctoGrid, bonus_iteration=0):
         """
@@ -1,10 +1,20 @@
-from dataclasses import dataclass
-from typing import NamedTuple
+"""
+Tetrahedral sectors of an octahedron, and the fractals they make.
 
-from bidict import bidict
-from euclid3 import Vector3
+An orientation is a 3x3 integer matrix whose rows are a sector's x, y and z axes. A sector of size
+i is made of six sectors of size i - 1: three core sectors moved 2^i along each of its axes and
+turned the same way, and three more at the same places turned by flip_z, turn_right and turn_left.
+Turning is multiplying by a fixed matrix on the left, so a whole level of sectors turns at once:
+the layout is expanded level by level as arrays of centers and orientations, and every sector at
+the bottom is filled with one insert.
+"""
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
 
 from octohedra.builders.OctoBuilder import OctoBuilder
+from octohedra.grid import Lattice
 from octohedra.grid.OctoGrid import OctoGrid
 from octohedra.grid.OctoVector import OctoVector
 from octohedra.utils import OctoConfigs, RenderUtils
@@ -19,152 +29,126 @@ from octohedra.utils.OctoUtil import p2
 # DNW = (-1, 1, -1)
 # DSW = (-1, -1, -1)
 # DSE = (1, -1, -1)
-# UNE = (OctoVector(1, 0, 0), OctoVector(0, 1, 0), OctoVector(0, 0, 1))
-# UNW = (OctoVector(0, 1, 0), OctoVector(-1, 0, 0), OctoVector(0, 0, 1))
-# USW = (OctoVector(-1, 0, 0), OctoVector(0, -1, 0), OctoVector(0, 0, 1))
-# USE = (OctoVector(0, -1, 0), OctoVector(1, 0, 0), OctoVector(0, 0, 1))
-# DNE = (OctoVector(0, 1, 0), OctoVector(1, 0, 0), OctoVector(0, 0, -1))
-# DNW = (OctoVector(-1, 0, 0), OctoVector(0, 1, 0), OctoVector(0, 0, -1))
-# DSW = (OctoVector(0, -1, 0), OctoVector(-1, 0, 0), OctoVector(0, 0, -1))
-# DSE = (OctoVector(1, 0, 0), OctoVector(0, -1, 0), OctoVector(0, 0, -1))
 
 
-class Orientation(NamedTuple):
-    x: OctoVector
-    y: OctoVector
-    z: OctoVector
+def orientation(x, y, z) -> np.ndarray:
+    """A read-only orientation matrix with the given axes as rows"""
+    matrix = np.array([x, y, z], dtype=np.int64)
+    matrix.setflags(write=False)
+    return matrix
 
 
-UNE = Orientation(OctoVector(1, 0, 0), OctoVector(0, 1, 0), OctoVector(0, 0, 1))
-UNW = Orientation(OctoVector(0, 1, 0), OctoVector(-1, 0, 0), OctoVector(0, 0, 1))
-USW = Orientation(OctoVector(-1, 0, 0), OctoVector(0, -1, 0), OctoVector(0, 0, 1))
-USE = Orientation(OctoVector(0, -1, 0), OctoVector(1, 0, 0), OctoVector(0, 0, 1))
-DNE = Orientation(OctoVector(0, 1, 0), OctoVector(1, 0, 0), OctoVector(0, 0, -1))
-DNW = Orientation(OctoVector(-1, 0, 0), OctoVector(0, 1, 0), OctoVector(0, 0, -1))
-DSW = Orientation(OctoVector(0, -1, 0), OctoVector(-1, 0, 0), OctoVector(0, 0, -1))
-DSE = Orientation(OctoVector(1, 0, 0), OctoVector(0, -1, 0), OctoVector(0, 0, -1))
+UNE = orientation((1, 0, 0), (0, 1, 0), (0, 0, 1))
+UNW = orientation((0, 1, 0), (-1, 0, 0), (0, 0, 1))
+USW = orientation((-1, 0, 0), (0, -1, 0), (0, 0, 1))
+USE = orientation((0, -1, 0), (1, 0, 0), (0, 0, 1))
+DNE = orientation((0, 1, 0), (1, 0, 0), (0, 0, -1))
+DNW = orientation((-1, 0, 0), (0, 1, 0), (0, 0, -1))
+DSW = orientation((0, -1, 0), (-1, 0, 0), (0, 0, -1))
+DSE = orientation((1, 0, 0), (0, -1, 0), (0, 0, -1))
 
-LEFT_LOOKUP = bidict({
-    UNE: UNW,
-    UNW: USW,
-    USW: USE,
-    USE: UNE,
-    DNE: DSE,
-    DNW: DNE,
-    DSW: DNW,
-    DSE: DSW
-})
+# Turns in a sector's own axes: left takes UNE to UNW to USW to USE and DNE to DSE to DSW to DNW,
+# flipping swaps x and y and mirrors z, taking each U orientation to its D one and back
+LEFT = orientation((0, 1, 0), (-1, 0, 0), (0, 0, 1))
+RIGHT = orientation(*LEFT.T)
+FLIP = orientation((0, 1, 0), (1, 0, 0), (0, 0, -1))
 
-FLIP_LOOKUP = bidict({
-    UNE: DNE,
-    UNW: DNW,
-    USW: DSW,
-    USE: DSE,
-})
+# The six sub-sectors of a sector: the axis each is moved along, and the turn it's given
+CHILD_AXES = np.array([0, 1, 2, 2, 1, 0])
+CHILD_TURNS = np.stack([np.eye(3, dtype=np.int64)] * 3 + [FLIP, RIGHT, LEFT])
 
 
-def flip_z(self):
-    if self in FLIP_LOOKUP:
-        return FLIP_LOOKUP[self]
-    else:
-        return FLIP_LOOKUP.inverse[self]
+def flip_z(orientation):
+    return FLIP @ orientation
 
 
-def turn_right(self):
-    return LEFT_LOOKUP.inverse[self]
+def turn_right(orientation):
+    return RIGHT @ orientation
 
 
-def turn_left(self):
-    return LEFT_LOOKUP[self]
+def turn_left(orientation):
+    return LEFT @ orientation
 
 
-@dataclass
-class OctoSectorBuilder(OctoBuilder):
-    center: OctoVector = OctoVector()
-    iteration: int = 1
-    interior_i: int = 0
-    surface_i: int = 0
-    orientation: Orientation = USE
+@lru_cache(maxsize=None)
+def sector_steps(iteration) -> np.ndarray:
+    """The octo cells of a sector of the given size in its own axes: every (x, y, z) with
+    non-negative coordinates adding up to less than 2^iteration"""
+    r = np.arange(0, p2(iteration) + 1)
+    steps = np.stack(np.meshgrid(r, r, r, indexing="ij"), axis=-1).reshape(-1, 3)
+    steps = steps[steps.sum(axis=1) < p2(iteration)]
+    steps.setflags(write=False)
+    return steps
 
-    # def __post_init__(self):
-    #     if
 
-    # def __init__(self, iteration, base_i=0, orientation=UNE, center=None):
-    #     super().__init__()
-    #     self.orientation = orientation
-    #     self.iteration = iteration
-    #     self.center = Vector3(0, 0, 0) if center is None else center
+def as_sectors(center, orientation):
+    """One sector as a (1, 3) array of centers and a (1, 3, 3) array of orientations"""
+    return np.array([tuple(center)], dtype=np.int64), np.asarray(orientation, dtype=np.int64)[None]
 
-    def materialize_additive(self, bonus_iteration=0):
-        grid = OctoGrid()
-        self.materialize_sector(grid, self.iteration, self.interior_i)
-        return grid
 
-    def detailed_core_sector_v2(self, grid, i, center, orientation):
-        o = p2(i)
+def sub_sectors(centers, orientations, i):
+    """The six sectors of size i - 1 making up each of M sectors of size i, as (M, 6, 3) centers
+    and (M, 6, 3, 3) orientations. The first three of each are its core sectors."""
+    centers = centers[:, None] + p2(i) * orientations[:, CHILD_AXES]
+    orientations = CHILD_TURNS[None] @ orientations[:, None]
+    return centers, orientations
 
-        ox = Vector3(*orientation[0])
-        oy = Vector3(*orientation[1])
-        oz = Vector3(*orientation[2])
 
-        self.detailed_core_sector(grid, i - 1, center + o * ox, orientation)
-        self.detailed_core_sector(grid, i - 1, center + o * oy, orientation)
+def sector_layout(centers, orientations, i, base_i):
+    """The sectors of size base_i that M sectors of size i break down into, as (N, 3) centers and
+    (N, 3, 3) orientations"""
+    while i > base_i:
+        centers, orientations = sub_sectors(centers, orientations, i)
+        centers, orientations = centers.reshape(-1, 3), orientations.reshape(-1, 3, 3)
+        i -= 1
+    return centers, orientations
 
-        self.detailed_core_sector(grid, i - 1, center + o * oz, orientation)
-        self.materialize_sector(grid, i - 1, 0, center + o * oz, flip_z(orientation))
-        #
-        self.materialize_sector(grid, i - 1, 0, center + o * oy, turn_right(orientation))
-        self.materialize_sector(grid, i - 1, 0, center + o * ox, turn_left(orientation))
 
-    def detailed_core_sector(self, grid, i, center, orientation):
-        o = p2(i)
+def sector_cells(iteration, centers, orientations) -> np.ndarray:
+    """The points of M sectors of the same size, as one (N, 3) array in key order. Sectors overlap
+    a lot, so each point is only kept once."""
+    points = sector_steps(iteration)[None] @ orientations + centers[:, None]
+    return Lattice.unpack(Lattice.sorted_keys(points.reshape(-1, 3)))
 
-        ox = Vector3(*orientation[0])
-        oy = Vector3(*orientation[1])
-        oz = Vector3(*orientation[2])
 
-        self.materialize_sector(grid, i - 1, i - 1, center + o * ox, orientation)
-        self.materialize_sector(grid, i - 1, i - 1, center + o * oy, orientation)
+@dataclass
+class OctoSectorBuilder(OctoBuilder):
+    center: OctoVector = OctoVector()
+    iteration: int = 1
+    interior_i: int = 0
+    surface_i: int = 0
+    orientation: np.ndarray = field(default_factory=lambda: USE)
 
-        self.materialize_sector(grid, i - 1, i - 1, center + o * oz, orientation)
-        self.materialize_sector(grid, i - 1, 0, center + o * oz, flip_z(orientation))
-        #
-        self.materialize_sector(grid, i - 1, 0, center + o * oy, turn_right(orientation))
-        self.materialize_sector(grid, i - 1, 0, center + o * ox, turn_left(orientation))
+    def materialize_into(self, grid: OctoGrid, bonus_iteration=0, clip=None):
+        self.materialize_sector(grid, self.iteration, self.interior_i, self.center,
+                                self.orientation)
+        return grid
 
-    def materialize_sector(self, grid, i, base_i, center, orientation):
-        if i == base_i:
+    def detailed_core_sector_v2(self, grid, i, center, orientation):
+        centers, orientations = sub_sectors(*as_sectors(center, orientation), i)
 
-            self.fill_sector(grid, i, center, orientation)
-            return
+        for core_center, core_orientation in zip(centers[0, :3], orientations[0, :3]):
+            self.detailed_core_sector(grid, i - 1, core_center, core_orientation)
+        self.fill_sectors(grid, 0, *sector_layout(centers[0, 3:], orientations[0, 3:], i - 1, 0))
 
-        o = p2(i)
-        ox, oy, oz = orientation
+    def detailed_core_sector(self, grid, i, center, orientation):
+        centers, orientations = sub_sectors(*as_sectors(center, orientation), i)
 
-        self.materialize_sector(grid, i - 1, base_i, center + o * ox, orientation)
-        self.materialize_sector(grid, i - 1, base_i, center + o * oy, orientation)
+        self.fill_sectors(grid, i - 1, centers[0, :3], orientations[0, :3])
+        self.fill_sectors(grid, 0, *sector_layout(centers[0, 3:], orientations[0, 3:], i - 1, 0))
 
-        self.materialize_sector(grid, i - 1, base_i, center + o * oz, orientation)
-        self.materialize_sector(grid, i - 1, base_i, center + o * oz, flip_z(orientation))
-        #
-        self.materialize_sector(grid, i - 1, base_i, center + o * oy, turn_right(orientation))
-        self.materialize_sector(grid, i - 1, base_i, center + o * ox, turn_left(orientation))
+    def materialize_sector(self, grid, i, base_i, center, orientation):
+        centers, orientations = sector_layout(*as_sectors(center, orientation), i, base_i)
+        self.fill_sectors(grid, min(i, base_i), centers, orientations)
 
     def fill_sector(self, grid: OctoGrid, iteration, center, orientation):
+        self.fill_sectors(grid, iteration, *as_sectors(center, orientation))
 
-        ox, oy, oz = orientation
-
-        # iteration += 1
-
-        octo_points = [ox * x + oy * y + oz * z + center
-                       for x in range(0, p2(iteration) + 1)
-                       for y in range(0, p2(iteration) + 1)
-                       for z in range(0, p2(iteration) + 1)
-                       if x + y + z < p2(iteration) + 0
-                       ]
-
-        for point in octo_points:
-            grid.insert_cell(center=point, octo_only=True, strict=False)
+    def fill_sectors(self, grid: OctoGrid, iteration, centers, orientations):
+        """Fills M sectors of the same size at once, given (M, 3) centers and (M, 3, 3)
+        orientations"""
+        grid.insert_cells(sector_cells(iteration, centers, orientations), octo_only=True,
+                          strict=False)
 
         # TODO: Keep trying manual infill
         # tetra_points = [ox * x + oy * y + oz * z + center
@@ -186,7 +170,7 @@ class OctoSectorBuilder(OctoBuilder):
 def test_fill_sector():
     grid = OctoGrid()
     builder = OctoSectorBuilder()
-    grid1 = builder.materialize_sector(3, 0, OctoVector(), USE)
+    builder.materialize_sector(grid, 3, 0, OctoVector(), USE)
 
     # builder.detailed_core_sector(grid, i, Vector3(0, 0, 0), Orientation.UNE)
     # builder.detailed_core_sector(grid, i, Vector3(0, 0, 0), Orientation.UNW)
@@ -249,9 +233,9 @@ def make_multi_scale():
 def test_materialize_sector():
     pass
     grid = OctoGrid()
-    builder = OctoSectorBuilder(4, 2)
+    builder = OctoSectorBuilder(iteration=4, interior_i=2)
 
-    builder.materialize_sector(grid, i=1, base_i=1, center=Vector3(0, 0, 0),orientation= UNE)
+    builder.materialize_sector(grid, i=1, base_i=1, center=OctoVector(), orientation=UNE)
 
     RenderUtils.render_grid(grid)
 
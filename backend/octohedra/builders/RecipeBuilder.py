@@ -50,13 +50,21 @@ Temple Complex (spawns that echo the full recipe):
 ]}
 """
 
-from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, fields, replace
+from multiprocessing import get_context
 from typing import Literal
 
+import numpy as np
+
+from octohedra.builders import FlakeKernel
 from octohedra.builders.OctoBuilder import OctoBuilder
+from octohedra.grid import GridExpression
+from octohedra.grid.ColumnarGrid import ColumnarGrid
 from octohedra.grid.OctoGrid import OctoGrid
 from octohedra.grid.OctoVector import OctoVector
-from octohedra.utils.OctoUtil import DOWN, UP, E, N, S, W, X, Y, Z, p2, f_rad
+from octohedra.utils.LruCache import LruCache
+from octohedra.utils.OctoUtil import Z, p2, f_rad
 
 # Shape types for layers
 ShapeType = Literal["fractal", "solid"]
@@ -186,6 +194,27 @@ def get_preset_recipe(name: str, depth: int = 3, stack_height: int = 1) -> dict:
     }
 
 
+# Cell centers of the sub-structures RecipeBuilder has built most recently, relative to the
+# sub-structure's center and keyed by RecipeBuilder.structure_key. Cell kinds only depend on where
+# a cell ends up, so translating the centers and inserting them gives the same cells as building
+# again. One recipe has at most a few dozen sub-structures.
+SUB_STRUCTURES = LruCache(64)
+
+# The same sub-structures as expressions around their center, for RecipeBuilder.expression. The
+# API process fills it with every recipe it analyzes, and evaluated expressions keep their cells,
+# so it's bounded the same way.
+SUB_EXPRESSIONS = LruCache(64)
+
+
+def _frozen(value):
+    """Recipe values (dicts, lists, tuples of them) as nested tuples that can be hashed"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _frozen(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(item) for item in value)
+    return value
+
+
 @dataclass
 class RecipeBuilder(OctoBuilder):
     """
@@ -304,20 +333,52 @@ class RecipeBuilder(OctoBuilder):
 
         return result
 
-    def materialize_additive(self, bonus_iteration=0):
-        """Build the complete structure from layers.
+    def materialize_into(self, grid: OctoGrid, bonus_iteration=0, clip=None):
+        """Build the complete structure from layers, straight into grid, leaving out whatever is
+        outside the clip box if there is one."""
+        for part in self._parts():
+            if isinstance(part, RecipeBuilder):
+                part.materialize_translated(grid, clip)
+            else:
+                self._build_layer(grid, *part, clip=clip)
+        return grid
+
+    def materialize(self, clip=None, workers=1):
+        """
+        Generate a grid containing this structure alone, as OctoBuilder.materialize does.
+
+        With workers other than 1, the sub-structures are built in that many processes first (one
+        per core if None), see build_sub_structures.
+        """
+        if workers != 1:
+            self.build_sub_structures(workers)
+        return super().materialize(clip)
+
+    def expression(self) -> GridExpression.Expression:
+        """The same structure as materialize_into, as a lazy GridExpression"""
+        parts = []
+        for part in self._parts():
+            if isinstance(part, RecipeBuilder):
+                parts.append(GridExpression.Translate(part.sub_expression(), [part.center]))
+            else:
+                depth, shape, center = part
+                parts.append(GridExpression.Translate(GridExpression.Flake.of(depth, shape),
+                                                      [center]))
+        return GridExpression.Union(*parts)
+
+    def _parts(self):
+        """The pieces of the structure, in the order they're built: (depth, shape, center) for
+        each layer's flake and a RecipeBuilder for each sub-structure.
 
         Handles the new spawn/bloom/echo model:
         - spawn: Where to create sub-structures (out/in/side)
         - bloom: Do spawns continue branching? (like Flower)
         - echo: Do spawns contain full recipe at smaller scale? (like Temple Complex)
         """
-        combined_grid = OctoGrid()
-
         # Legacy: Handle grid_depth for backwards compatibility
         # New code should use 'echo' in layers instead
         if self.grid_depth is not None and self.grid_depth < self.grid_min_depth:
-            return combined_grid
+            return
 
         if self.grid_depth is not None and self.grid_depth >= self.grid_min_depth:
             # Build tower at this grid node using legacy logic
@@ -334,8 +395,7 @@ class RecipeBuilder(OctoBuilder):
                 center=self.center,
                 grid_depth=None,
             )
-            tower_grid = tower_builder.materialize_additive()
-            combined_grid = OctoGrid.merge(combined_grid, tower_grid)
+            yield tower_builder
 
             # Expand grid in 4 horizontal directions
             grid_offset = p2(self.grid_depth + 1)
@@ -347,10 +407,9 @@ class RecipeBuilder(OctoBuilder):
                     grid_depth=self.grid_depth - 1,
                     grid_min_depth=self.grid_min_depth,
                 )
-                sub_grid = sub_builder.materialize_additive()
-                combined_grid = OctoGrid.merge(combined_grid, sub_grid)
+                yield sub_builder
 
-            return combined_grid
+            return
 
         # Standard layer building with spawn/bloom/echo
         current_z = 0
@@ -385,9 +444,7 @@ class RecipeBuilder(OctoBuilder):
             layer_center = self.center + Z * layer_z
 
             # Build this layer's structure
-            layer_grid = OctoGrid()
-            self._build_layer_recursive(layer_grid, layer_depth, layer_shape, layer_center)
-            combined_grid = OctoGrid.merge(combined_grid, layer_grid)
+            yield layer_depth, layer_shape, layer_center
 
             # Handle spawns (new model)
             if has_spawns:
@@ -434,8 +491,7 @@ class RecipeBuilder(OctoBuilder):
                                         _echo_depth=self._echo_depth + 1,
                                         _echo_max_depth=self._echo_max_depth,
                                     )
-                                    echo_grid = echo_builder.materialize_additive()
-                                    combined_grid = OctoGrid.merge(combined_grid, echo_grid)
+                                    yield echo_builder
 
                     elif layer_bloom:
                         # Bloom: spawns continue the branching pattern (like Flower)
@@ -466,8 +522,7 @@ class RecipeBuilder(OctoBuilder):
                                     center=spawn_center,
                                     origin_dir=(dx, dy),
                                 )
-                                sub_grid = sub_builder.materialize_additive()
-                                combined_grid = OctoGrid.merge(combined_grid, sub_grid)
+                                yield sub_builder
 
                     else:
                         # No bloom, no echo: simple tower spawns (like Evil Tower)
@@ -495,8 +550,7 @@ class RecipeBuilder(OctoBuilder):
                                     center=spawn_center,
                                     origin_dir=(dx, dy),
                                 )
-                                sub_grid = sub_builder.materialize_additive()
-                                combined_grid = OctoGrid.merge(combined_grid, sub_grid)
+                                yield sub_builder
 
             # Legacy: Handle branch_directions for backwards compatibility
             elif has_legacy_branches:
@@ -530,8 +584,7 @@ class RecipeBuilder(OctoBuilder):
                                     center=branch_center,
                                     origin_dir=(dx, dy),
                                 )
-                                sub_grid = sub_builder.materialize_additive()
-                                combined_grid = OctoGrid.merge(combined_grid, sub_grid)
+                                yield sub_builder
 
                     elif branch_style == "edge":
                         horiz_offset = p2(i + 1)
@@ -560,8 +613,7 @@ class RecipeBuilder(OctoBuilder):
                                     center=branch_center,
                                     origin_dir=(dx, dy),
                                 )
-                                sub_grid = sub_builder.materialize_additive()
-                                combined_grid = OctoGrid.merge(combined_grid, sub_grid)
+                                yield sub_builder
 
                 if not include_upwards:
                     break
@@ -570,28 +622,92 @@ class RecipeBuilder(OctoBuilder):
             current_z = layer_z + p2(layer_depth + 1)
             prev_layer = layer
 
-        return combined_grid
-
-    def _build_layer_recursive(self, grid: OctoGrid, depth: int, shape: str, center: OctoVector):
-        """Recursively build a layer with the given shape applied uniformly."""
-        if depth <= 0:
-            grid.insert_cell(center)
-            return
+    def structure_key(self) -> tuple:
+        """Everything that decides this builder's cells except its center, normalized to a hashable
+        tuple. Builders with the same key build the same cells up to a translation."""
+        key = {f.name: _frozen(getattr(self, f.name)) for f in fields(self)
+               if f.name not in ("center", "children")}
+        # Directions only matter to layers that spawn or branch, and echo depths to echoing ones
+        if not any(layer.get("spawn") or layer.get("branch_directions") for layer in self.layers):
+            key["origin_dir"] = None
+        if not any(layer.get("echo") for layer in self.layers):
+            key["_echo_depth"] = key["_echo_max_depth"] = None
+        return tuple(key.items())
+
+    def materialize_translated(self, grid: OctoGrid, clip=None):
+        """materialize_into, built once per structure_key around the origin and reused by
+        translation (see SUB_STRUCTURES). Spawns, blooms and echoes go through here, since
+        siblings usually differ only in where they are. The memo holds the whole sub-structure,
+        so clipping keeps the translated cells inside the box."""
+        key = self.structure_key()
+        offsets = SUB_STRUCTURES.get(key)
+        if offsets is None:
+            offsets = SUB_STRUCTURES.setdefault(key, self.centers_at_origin())
+        centers = offsets + tuple(self.center)
+        if clip is not None:
+            centers = centers[FlakeKernel.in_box(centers, *clip)]
+        grid.insert_cells(centers)
+        return grid
+
+    def centers_at_origin(self) -> np.ndarray:
+        """The cell centers of this structure built around the origin, as a read-only (N, 3)
+        int64 array in key order"""
+        # Only the centers are kept, so collect them in a ColumnarGrid rather than build cells
+        at_origin = replace(self, center=OctoVector()).materialize_into(ColumnarGrid())
+        offsets = at_origin.centers.astype(np.int64)
+        offsets.setflags(write=False)
+        return offsets
+
+    def build_sub_structures(self, workers=None) -> int:
+        """
+        Builds this recipe's sub-structures in worker processes, ahead of materializing it.
 
-        # Handle solid shape - fill the entire region
-        # The radius should match the extent of an equivalent "full" fractal
-        # A depth-N fractal extends to p2(depth+1) - 2 from center
-        # But fill uses strict < so we need radius = p2(depth+1) - 1 to include that extent
-        if shape == "solid":
-            radius = p2(depth + 1) - 1
-            grid.fill(radius, center)
-            return
+        Each distinct spawn, bloom or echo (by structure_key) not already in SUB_STRUCTURES is
+        built around the origin in its own process and comes back as an array of centers, which
+        goes into SUB_STRUCTURES and SUB_EXPRESSIONS. Materializing afterwards, either way, only
+        translates them. workers is the number of processes, one per core if None; with 1 (or 0)
+        everything runs in this one.
 
-        # For 'fractal' shape, branch in all 6 cardinal directions
-        # (solid is already handled above)
-        for direction in [E, N, W, S, UP, DOWN]:
-            next_center = center + p2(depth - 1) * 2 * direction
-            self._build_layer_recursive(grid, depth - 1, shape, next_center)
+        Returns the number of sub-structures built.
+        """
+        pending = dict()
+        for part in self._parts():
+            if isinstance(part, RecipeBuilder) and part.structure_key() not in SUB_STRUCTURES:
+                pending.setdefault(part.structure_key(), replace(part, center=OctoVector()))
+
+        if workers is not None and workers <= 1:
+            built = map(RecipeBuilder.centers_at_origin, pending.values())
+            results = dict(zip(pending, built))
+        else:
+            with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool:
+                built = pool.map(RecipeBuilder.centers_at_origin, pending.values())
+                results = dict(zip(pending, built))
+
+        for key, offsets in results.items():
+            offsets.setflags(write=False)
+            SUB_STRUCTURES[key] = offsets
+            SUB_EXPRESSIONS.setdefault(key, GridExpression.Cells(offsets))
+        return len(results)
+
+    def sub_expression(self) -> GridExpression.Expression:
+        """expression() around the origin, shared by every builder with the same structure_key, so
+        that unions of siblings fold into one translation (see GridExpression.Union)"""
+        key = self.structure_key()
+        expression = SUB_EXPRESSIONS.get(key)
+        if expression is None:
+            expression = SUB_EXPRESSIONS.setdefault(
+                key, replace(self, center=OctoVector()).expression())
+        return expression
+
+    def _build_layer(self, grid: OctoGrid, depth: int, shape: str, center: OctoVector,
+                     clip=None):
+        """Build a layer with the given shape applied uniformly.
+
+        A 'fractal' layer branches in all 6 cardinal directions down to single cells. A 'solid'
+        one fills the region an equivalent full fractal spans: a depth-N fractal extends to
+        p2(depth+1) - 2 from center, and fill uses strict <, so its radius is p2(depth+1) - 1.
+        """
+        FlakeKernel.insert_flake(grid, center, depth, shape, clip=clip)
 
 
 def generate_from_recipe(
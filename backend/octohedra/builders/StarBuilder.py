@@ -3,6 +3,8 @@ from trimesh.exchange.export import export_mesh
 from octohedra.builders.FlakeBuilder import FlakeBuilder
 from octohedra.builders.OctoBuilder import OctoBuilder
 from octohedra.config import OUTPUT_DIR
+from octohedra.grid import GridExpression, Symmetry
+from octohedra.grid.OctoGrid import OctoGrid
 from octohedra.grid.OctoVector import OctoVector
 
 # from octohedra.grid.Renderer import Renderer
@@ -43,8 +45,14 @@ class StarBuilder(OctoBuilder):
     #     builder.children.add(outer_flake)
     #     return builder
 
-    def materialize_additive(self, bonus_iteration=0):
-        return super().materialize_additive(bonus_iteration).six_way(self.center)  # TODO: PUt
+    def expression(self):
+        children = GridExpression.Union(*(child.expression() for child in self.children))
+        return GridExpression.Symmetric(children, Symmetry.six_way(tuple(self.center)))
+
+    def materialize_into(self, grid, bonus_iteration=0, clip=None):
+        # six_way works on the whole grid, so the star gets a grid of its own
+        star = super().materialize_into(OctoGrid(), bonus_iteration)
+        return grid.merge(star.six_way(self.center))  # TODO: PUt
         # this back
 
 
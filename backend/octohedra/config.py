@@ -1,8 +1,19 @@
 """
-Output path configuration for the Octohedra project.
+Output path and backend configuration for the Octohedra project.
 
 Set the OCTOHEDRA_OUTPUT_DIR environment variable to customize output location,
 or it defaults to ./output/ relative to the octohedra package.
+
+Set OCTOHEDRA_GRID_BACKEND to "columnar" to have the generation service hold grids in the
+structure-of-arrays ColumnarGrid instead of the default dict-backed OctoGrid.
+
+Set OCTOHEDRA_BUILD_WORKERS to a number of processes, or "auto" for one per core, to have the
+generation service build each recipe's sub-structures and render its tiles in parallel. It defaults
+to 1, in-process.
+
+Set OCTOHEDRA_PLAN_DIR to where compiled builder plans (see InstancePlan) should be cached, or it
+defaults to ./plans/ inside the output directory. The generation service caches a plan there for
+each recipe it renders.
 """
 import os
 from pathlib import Path
@@ -27,3 +38,45 @@ def get_output_dir() -> Path:
 
 
 OUTPUT_DIR = get_output_dir()
+
+
+def get_grid_backend() -> str:
+    """
+    Returns the grid backend the generation service should use: "dict" or "columnar".
+    """
+    backend = os.environ.get("OCTOHEDRA_GRID_BACKEND", "dict")
+    if backend not in ("dict", "columnar"):
+        raise ValueError(f"Unknown OCTOHEDRA_GRID_BACKEND: {backend!r}")
+    return backend
+
+
+GRID_BACKEND = get_grid_backend()
+
+
+def get_build_workers() -> int | None:
+    """
+    Returns the number of processes the generation service builds sub-structures and renders
+    tiles in, or None for one per core.
+    """
+    workers = os.environ.get("OCTOHEDRA_BUILD_WORKERS", "1")
+    if workers == "auto":
+        return None
+    if not workers.isdigit() or int(workers) < 1:
+        raise ValueError(f"Invalid OCTOHEDRA_BUILD_WORKERS: {workers!r}")
+    return int(workers)
+
+
+BUILD_WORKERS = get_build_workers()
+
+
+def get_plan_dir() -> Path:
+    """
+    Returns the directory compiled builder plans are cached in. It's created when the first plan
+    is saved.
+    """
+    if env_path := os.environ.get("OCTOHEDRA_PLAN_DIR"):
+        return Path(env_path)
+    return OUTPUT_DIR / "plans"
+
+
+PLAN_DIR = get_plan_dir()
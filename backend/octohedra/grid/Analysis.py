@@ -0,0 +1,101 @@
+"""
+Predicts how big a grid and its mesh will be, without building either.
+
+Cell counts come from the expression's instance plan, which counts the cells flake instances share
+once, or else from its profile, which counts them once per part. Bounds come from its bounds.
+Mesh sizes scale with the cell count: every cell renders to about the same mesh once trimmed, so
+the vertices and faces per cell are measured once per render config on a reference flake and
+multiplied out. STL sizes follow
+exactly from the face count. OBJ sizes follow from the bytes per vertex line, measured on the
+reference, and the digits the face lines' vertex indices take.
+"""
+from trimesh.exchange.export import export_mesh
+
+from octohedra.builders import InstancePlan
+from octohedra.grid import GridExpression
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.Tiling import HALF_WIDTH
+
+# The reference flake the per-cell rates are measured on, cropped at z=0 like every recipe
+REFERENCE_DEPTH = 3
+
+# Binary STL: an 80 byte header and a face count, then 50 bytes per face
+STL_HEADER_BYTES = 84
+STL_FACE_BYTES = 50
+
+# Mesh rates per render config, see mesh_rates
+MESH_RATES = dict()
+
+
+def mesh_rates(config) -> dict:
+    """Vertices, faces and OBJ bytes per cell of a trimmed and rendered reference flake, measured
+    once per render config"""
+    render_config = config.derive_render_config()
+    if render_config not in MESH_RATES:
+        reference = GridExpression.Crop.box(GridExpression.Flake.of(REFERENCE_DEPTH), z_min=0)
+        grid = reference.materialize_into(OctoGrid())
+        grid.compute_trimming(mode="auto")
+        mesh = grid.render(config)
+        obj = export_mesh(mesh, file_obj=None, file_type="obj", include_normals=False, digits=6)
+
+        lines = obj.splitlines(keepends=True)
+        vertex_bytes = sum(len(line) for line in lines if line.startswith("v "))
+        face_bytes = sum(len(line) for line in lines if line.startswith("f "))
+        cells = len(grid.occ)
+        MESH_RATES[render_config] = {
+            "vertices": len(mesh.vertices) / cells,
+            "faces": len(mesh.faces) / cells,
+            "vertex_bytes": vertex_bytes / len(mesh.vertices),
+            # Besides its three vertex indices: the "f", the spaces and the newline
+            "face_bytes": face_bytes / len(mesh.faces) - 3 * index_digits(len(mesh.vertices)),
+            "header_bytes": len(obj) - vertex_bytes - face_bytes,
+        }
+    return MESH_RATES[render_config]
+
+
+def index_digits(vertices) -> float:
+    """The average number of digits of the OBJ vertex indices 1 to vertices"""
+    if vertices < 1:
+        return 0.0
+    digits = len(str(vertices))
+    below = sum(9 * 10 ** (d - 1) * d for d in range(1, digits))
+    return (below + (vertices - 10 ** (digits - 1) + 1) * digits) / vertices
+
+
+def analyze(expression, config) -> dict:
+    """
+    The predicted size of the grid an expression evaluates to and of its mesh, rendered with
+    config:
+
+        - cells: the number of cells. exact: whether that's the exact count. It is when the
+          expression compiles to an InstancePlan; otherwise cells that parts of the expression
+          share are counted once per part, and cells is an upper bound.
+        - low, high: [x, y, z] lattice coordinates of a box around the cell centers, or None for
+          no cells. size: the extent of the cells themselves, in mm, before the mesh's 45 degree
+          turn.
+        - obj, stl: the predicted vertices, faces and bytes of each format.
+    """
+    try:
+        cells, exact = InstancePlan.compile_expression(expression).count(), True
+    except InstancePlan.NotCompilable:
+        cells, exact = expression.count(), False
+    bounds = expression.bounds() if cells else None
+    rates = mesh_rates(config)
+    unit = config.derive_render_config().cell_size / 4
+
+    vertices = round(cells * rates["vertices"])
+    faces = round(cells * rates["faces"])
+    obj_bytes = (rates["header_bytes"] + vertices * rates["vertex_bytes"]
+                 + faces * (rates["face_bytes"] + 3 * index_digits(vertices)))
+
+    return {
+        "cells": cells,
+        "exact": exact,
+        "low": None if bounds is None else bounds[0].tolist(),
+        "high": None if bounds is None else bounds[1].tolist(),
+        "size": [0.0] * 3 if bounds is None else
+        ((bounds[1] - bounds[0] + 2 * HALF_WIDTH) * unit).round(3).tolist(),
+        "obj": {"vertices": vertices, "faces": faces, "bytes": round(obj_bytes) if cells else 0},
+        "stl": {"vertices": 3 * faces, "faces": faces,
+                "bytes": STL_HEADER_BYTES + STL_FACE_BYTES * faces},
+    }
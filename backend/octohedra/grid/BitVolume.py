@@ -0,0 +1,141 @@
+"""
+Dense, bit-packed occupancy volumes.
+
+A BitVolume covers an axis-aligned box of lattice points with one bit per point, packed 64 to a
+word along x. Whole-volume neighbour tests become a shift of the volume followed by a bitwise
+AND, which touches every word once instead of hashing every cell.
+"""
+import numpy as np
+
+WORD_BITS = 64
+WORD = np.dtype("<u8")
+
+# Keep a single volume to a size that comfortably fits in a worker's memory
+MAX_DENSE_BYTES = 64 * 2 ** 20
+
+
+def volume_bytes(lower, upper):
+    """Bytes needed for a BitVolume spanning the inclusive corners lower and upper"""
+    nx, ny, nz = (np.asarray(upper) - np.asarray(lower) + 1).tolist()
+    return nz * ny * -(-nx // WORD_BITS) * WORD.itemsize
+
+
+class BitVolume:
+    """
+    One bit per lattice point in the box starting at origin with the given (nx, ny, nz) shape.
+    Bits live in a (nz, ny, ceil(nx / 64)) array of little-endian uint64 words; bit b of word w
+    in row (z, y) is the point x = 64 * w + b.
+    """
+
+    def __init__(self, origin, shape, words=None):
+        self.origin = np.asarray(origin, dtype=np.int64)
+        self.shape = tuple(int(n) for n in shape)
+        nx, ny, nz = self.shape
+        if words is None:
+            words = np.zeros((nz, ny, -(-nx // WORD_BITS)), dtype=WORD)
+        self.words = words
+
+    @classmethod
+    def bounding(cls, centers):
+        """An empty volume just big enough to hold the given centers"""
+        centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+        if len(centers) == 0:
+            return cls((0, 0, 0), (0, 0, 0))
+        lower = centers.min(axis=0)
+        return cls(lower, centers.max(axis=0) - lower + 1)
+
+    def like(self, words=None):
+        """A volume over the same box, empty or holding the given words"""
+        return BitVolume(self.origin, self.shape, words)
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def _locate(self, centers):
+        local = np.asarray(centers, dtype=np.int64).reshape(-1, 3) - self.origin
+        inside = ((local >= 0) & (local < np.array(self.shape))).all(axis=1)
+        x, y, z = local.T
+        return inside, z, y, x >> 6, (x & (WORD_BITS - 1)).astype(WORD)
+
+    def add(self, centers):
+        """Sets the bits of the given centers, which must lie inside the volume"""
+        inside, z, y, word, bit = self._locate(centers)
+        if not inside.all():
+            raise ValueError("Tried to add a point outside of the BitVolume.")
+        np.bitwise_or.at(self.words, (z, y, word), WORD.type(1) << bit)
+        return self
+
+    def get(self, centers) -> np.ndarray:
+        """Whether each of the given centers is set; points outside the volume are not."""
+        return self.gather(self.index(centers))
+
+    def index(self, centers):
+        """Precomputed lookup positions for reading the same centers from volumes over this box"""
+        inside, z, y, word, bit = self._locate(centers)
+        flat = np.ravel_multi_index((z[inside], y[inside], word[inside]), self.words.shape)
+        return inside, flat, bit[inside]
+
+    def gather(self, index) -> np.ndarray:
+        inside, flat, bit = index
+        result = np.zeros(len(inside), dtype=bool)
+        result[inside] = (self.words.ravel()[flat] >> bit) & WORD.type(1) == 1
+        return result
+
+    def shifted(self, offset):
+        """
+        The volume seen from offset: the result has a bit set at p when this volume has p + offset
+        set. Bits shifted in from outside the box are clear.
+        """
+        dx, dy, dz = offset
+        nx, ny, nz = self.shape
+        out = np.zeros_like(self.words)
+        if abs(dy) >= ny or abs(dz) >= nz:
+            return self.like(out)
+
+        src = self.words[max(dz, 0):nz - max(-dz, 0), max(dy, 0):ny - max(-dy, 0)]
+        out[max(-dz, 0):nz - max(dz, 0), max(-dy, 0):ny - max(dy, 0)] = _shift_x(src, dx)
+
+        # Don't let bits shifted past x = nx linger in the padding of the last word
+        if nx % WORD_BITS:
+            out[..., -1] &= WORD.type((1 << (nx % WORD_BITS)) - 1)
+        return self.like(out)
+
+    def __and__(self, other):
+        return self.like(self.words & other.words)
+
+    def __or__(self, other):
+        return self.like(self.words | other.words)
+
+    def __sub__(self, other):
+        return self.like(self.words & ~other.words)
+
+    def count(self):
+        return int(np.bitwise_count(self.words).sum())
+
+
+def _shift_x(words, dx):
+    """Shifts packed rows so that bit x of the result is bit x + dx of the input"""
+    if dx == 0 or words.size == 0:
+        return words
+
+    n = words.shape[-1]
+    q, s = divmod(dx, WORD_BITS)
+
+    # Whole-word part of the shift
+    moved = np.zeros_like(words)
+    if abs(q) < n:
+        if q >= 0:
+            moved[..., :n - q] = words[..., q:]
+        else:
+            moved[..., -q:] = words[..., :n + q]
+    if s == 0:
+        return moved
+
+    # Bit part: pull the low bits of the next word into the top of each word
+    result = moved >> WORD.type(s)
+    result[..., :-1] |= moved[..., 1:] << WORD.type(WORD_BITS - s)
+    # The last word borrows from one past the end of the moved row, which is words[n + q]
+    if 0 <= n + q < n:
+        result[..., -1] |= words[..., n + q] << WORD.type(WORD_BITS - s)
+    return result
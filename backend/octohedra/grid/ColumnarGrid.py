@@ -0,0 +1,444 @@
+import math
+from collections.abc import Mapping
+
+import numpy as np
+import trimesh
+from trimesh import transformations
+
+from octohedra.grid import Lattice, Stamper, Symmetry, Trimming
+from octohedra.grid.GridCell import GridCell
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.grid.SpatialIndex import SpatialIndex
+from octohedra.utils import OctoConfigs
+from octohedra.utils.OctoConfig import RenderConfig
+
+DEFAULT_GRID = "default"
+
+
+class CellView(Mapping):
+    """Read-only, dict-like view of a ColumnarGrid, so code written against OctoGrid.occ keeps
+    working. Cells are built on demand from the flag columns; changing them does not change the
+    grid.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+
+    def __len__(self):
+        return len(self.grid)
+
+    def __iter__(self):
+        for x, y, z in self.grid.centers.tolist():
+            yield OctoVector(x, y, z)
+
+    def __contains__(self, center):
+        return self.grid.find(center) is not None
+
+    def __getitem__(self, center):
+        row = self.grid.find(center)
+        if row is None:
+            raise KeyError(center)
+        return Lattice.shared_cell(self.grid.kinds[row], self.grid.flags[row])
+
+
+class ColumnarGrid:
+    """
+    A structure-of-arrays alternative to OctoGrid.
+
+    Cell centers live in an (N, 3) int32 array, the cell kind in a uint8 column and the
+    crop/trim/weld flags in a uint16 bit column (see Lattice.FLAG_NAMES), so a cell costs a couple
+    dozen bytes instead of an OctoVector, a dataclass instance and a dict slot.
+
+    Writes are appended and only de-duplicated when the grid is next read, with the last write to
+    a center winning just like assigning into OctoGrid.occ. After that the rows are sorted by
+    their packed key.
+    """
+
+    def __init__(self, name="Body"):
+        self.name = name
+        self.subgrids = dict()
+        self.cache = dict()
+
+        self._centers = np.empty((0, 3), dtype=np.int32)
+        self._kinds = np.empty(0, dtype=np.uint8)
+        self._flags = np.empty(0, dtype=np.uint16)
+        self._size = 0
+        self._keys = np.empty(0, dtype=np.int64)
+        self._consolidated = True
+        self._index = None
+
+    @classmethod
+    def from_grid(cls, grid, name=None):
+        """Copies any grid with an OctoGrid-style occ mapping into a new ColumnarGrid"""
+        columnar = cls(grid.name if name is None else name)
+        columnar.merge(grid)
+        return columnar
+
+    @classmethod
+    def from_arrays(cls, centers, kinds, flags=None, name="Body"):
+        grid = cls(name)
+        grid._append(centers, kinds, flags)
+        return grid
+
+    # Storage
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._kinds)
+        if needed <= capacity:
+            return
+
+        capacity = max(needed, 2 * capacity, 64)
+        centers = np.empty((capacity, 3), dtype=np.int32)
+        kinds = np.empty(capacity, dtype=np.uint8)
+        flags = np.empty(capacity, dtype=np.uint16)
+        centers[:self._size] = self._centers[:self._size]
+        kinds[:self._size] = self._kinds[:self._size]
+        flags[:self._size] = self._flags[:self._size]
+        self._centers, self._kinds, self._flags = centers, kinds, flags
+
+    def _append(self, centers, kinds, flags=None):
+        centers = np.asarray(centers).reshape(-1, 3)
+        count = len(centers)
+        if count == 0:
+            return
+
+        self._reserve(count)
+        start, stop = self._size, self._size + count
+        self._centers[start:stop] = centers
+        self._kinds[start:stop] = kinds
+        self._flags[start:stop] = 0 if flags is None else flags
+        self._size = stop
+        self._consolidated = False
+
+    def _consolidate(self):
+        """Drops overwritten rows, sorts by key and trims the spare capacity"""
+        if self._consolidated:
+            return
+
+        n = self._size
+        keys = Lattice.pack(self._centers[:n])
+        # np.unique keeps the first occurrence, so search the rows backwards to keep the last write
+        self._keys, reversed_rows = np.unique(keys[::-1], return_index=True)
+        rows = n - 1 - reversed_rows
+
+        self._centers = self._centers[rows]
+        self._kinds = self._kinds[rows]
+        self._flags = self._flags[rows]
+        self._size = len(rows)
+        self._consolidated = True
+
+    def _keep(self, mask):
+        self._consolidate()
+        self._centers = self._centers[mask]
+        self._kinds = self._kinds[mask]
+        self._flags = self._flags[mask]
+        self._keys = self._keys[mask]
+        self._size = len(self._kinds)
+
+    @property
+    def centers(self) -> np.ndarray:
+        self._consolidate()
+        return self._centers
+
+    @property
+    def kinds(self) -> np.ndarray:
+        self._consolidate()
+        return self._kinds
+
+    @property
+    def flags(self) -> np.ndarray:
+        self._consolidate()
+        return self._flags
+
+    @property
+    def keys(self) -> np.ndarray:
+        self._consolidate()
+        return self._keys
+
+    @property
+    def index(self) -> SpatialIndex:
+        """A SpatialIndex over the key column, rebuilt whenever the column is"""
+        keys = self.keys
+        if self._index is None or self._index.keys is not keys:
+            self._index = SpatialIndex(keys)
+        return self._index
+
+    def box(self, x_min=-math.inf, x_max=math.inf, y_min=-math.inf, y_max=math.inf,
+            z_min=-math.inf, z_max=math.inf) -> np.ndarray:
+        """(N, 3) array of the centers inside the box, bounds included"""
+        return self.index.box((x_min, y_min, z_min), (x_max, y_max, z_max))
+
+    def within(self, center, m) -> np.ndarray:
+        """(N, 3) array of the centers at most m from center in L1 distance"""
+        return self.index.within(center, m)
+
+    def nearest(self, point, k=1) -> np.ndarray:
+        """(k, 3) array of the centers nearest to point in L1 distance, nearest first"""
+        return self.index.nearest(point, k)
+
+    @property
+    def occ(self):
+        return CellView(self)
+
+    @property
+    def nbytes(self):
+        return self._centers.nbytes + self._kinds.nbytes + self._flags.nbytes + self._keys.nbytes
+
+    def __len__(self):
+        self._consolidate()
+        return self._size
+
+    def find(self, center):
+        """Row index of the cell at center, or None"""
+        key = Lattice.pack([tuple(center)])[0]
+        keys = self.keys
+        row = np.searchsorted(keys, key)
+        if row < len(keys) and keys[row] == key:
+            return row
+        return None
+
+    def set_flag(self, name, mask=None):
+        """Raises a flag on every cell selected by the boolean mask (default: all of them)"""
+        self._consolidate()
+        if mask is None:
+            self._flags |= Lattice.FLAGS[name]
+        else:
+            self._flags[mask] |= Lattice.FLAGS[name]
+
+    # OctoGrid API
+
+    def add_subgrid(self, name):
+        self.subgrids[name] = ColumnarGrid(name)
+
+    def get_subgrid(self, name):
+        return self.subgrids[name]
+
+    def get_grids(self):
+        return {self.name: self} | self.subgrids
+
+    def merge(self, other):
+        if isinstance(other, ColumnarGrid):
+            self._append(other.centers, other.kinds, other.flags)
+        else:
+            cells = other.occ.items()
+            centers = np.array([tuple(center) for center, _ in cells], dtype=np.int64)
+            kinds = np.fromiter((Lattice.kind_of(cell) for _, cell in cells), dtype=np.uint8)
+            flags = np.fromiter((Lattice.flags_of(cell) for _, cell in cells), dtype=np.uint16)
+            self._append(centers, kinds, flags)
+        return self
+
+    def __add__(self, other):
+        return self.merge(other)
+
+    # Set algebra, in place like merge (see OctoGrid)
+
+    def contains(self, points) -> np.ndarray:
+        """Whether each row of an (N, 3) point array holds a cell"""
+        return Lattice.contains(self.keys, Lattice.pack(points))
+
+    def union(self, other):
+        return self.merge(other)
+
+    def intersection(self, other):
+        """Keeps only the cells whose centers other also has"""
+        self._keep(other.contains(self.centers))
+        return self
+
+    def difference(self, other):
+        """Removes the cells whose centers other has"""
+        self._keep(~other.contains(self.centers))
+        return self
+
+    def symmetric_difference(self, other):
+        """Keeps the cells only one of the grids has, taking other's cells from other"""
+        if not isinstance(other, ColumnarGrid):
+            other = ColumnarGrid.from_grid(other)
+        added = ~Lattice.contains(self.keys, other.keys)
+        self._keep(~Lattice.contains(other.keys, self.keys))
+        self._append(other.centers[added], other.kinds[added], other.flags[added])
+        return self
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __xor__(self, other):
+        return self.symmetric_difference(other)
+
+    def keep_octo(self, m, center):
+        i, j, k = (self.centers - np.asarray(tuple(center))).T
+        yz = np.abs(j) + np.abs(k) <= m
+        zx = np.abs(k) + np.abs(i) <= m
+        self._keep(yz & zx)
+
+    def render(self, config=OctoConfigs.default, rotate=True, grid=DEFAULT_GRID, symmetric=False):
+        """Renders every distinct cell state once and stamps copies of it at each center that has
+        that state, rather than copying and translating a mesh per cell.
+
+        With symmetric set, only a fundamental domain of the grid's symmetry group is trimmed and
+        stamped, and its mesh is copied around by the group's operations (see
+        Stamper.stamp_symmetric). Trim flags are computed as part of that.
+        """
+        render_config = config.derive_render_config()
+
+        if len(self) > 0 and symmetric:
+            cell_meshes = Stamper.stamp_symmetric(self.centers, self.kinds, self.flags,
+                                                  self._render_state, render_config)
+        elif len(self) > 0:
+            vertices, faces, _ = Stamper.stamp(self.centers, self.kinds, self.flags,
+                                               self._render_state, render_config)
+            cell_meshes = trimesh.Trimesh(vertices, faces, process=False)
+        else:
+            cell_meshes = trimesh.Trimesh()
+
+        if rotate:
+            angle = math.radians(45)
+            rot = transformations.rotation_matrix(angle, (0, 0, 1))
+            cell_meshes.apply_transform(rot)
+
+        return cell_meshes.process()
+
+    def _render_state(self, kind, flags, config: RenderConfig):
+        if (kind, flags, config) not in self.cache:
+            self.cache[(kind, flags, config)] = Lattice.make_cell(kind, flags).render(config)
+        return self.cache[(kind, flags, config)]
+
+    def render_cell(self, cell: GridCell, center: OctoVector, config: RenderConfig):
+        cell_mesh = self._render_state(Lattice.kind_of(cell), Lattice.flags_of(cell), config).copy()
+        return cell_mesh.apply_translation(center.as_np() * (config.cell_size / 4))
+
+    def insert_cell(self,
+                    center: OctoVector = None,
+                    x=0,
+                    y=0,
+                    z=0,
+                    strict=False,
+                    octo_only=False,
+                    tetra_only=False):
+
+        if center is None:
+            center = OctoVector(x, y, z)
+        if strict:
+            center.validate()
+
+        kind = Lattice.cell_kind(center.x, center.y, center.z, strict, octo_only, tetra_only)
+        if kind != Lattice.NO_CELL:
+            self._append((center.x, center.y, center.z), kind)
+
+    def insert_cells(self, centers, strict=False, octo_only=False, tetra_only=False, flags=None):
+        """insert_cell for a whole (N, 3) array of integer centers at once, optionally giving the
+        cells flags"""
+        centers = Lattice.as_centers(centers)
+        kinds = Lattice.classify(centers, strict, octo_only, tetra_only)
+        keep = kinds != Lattice.NO_CELL
+        self._append(centers[keep], kinds[keep], None if flags is None else flags[keep])
+
+    def fill(self, radius, center, clear=False):
+        points = Lattice.ball(radius, center)
+
+        if not clear:
+            self.insert_cells(points)
+        else:
+            present = np.isin(Lattice.pack(points), self.keys)
+            if not present.all():
+                raise KeyError(OctoVector(*points[~present][0].tolist()))
+            self._keep(~np.isin(self.keys, Lattice.pack(points)))
+
+    def crop_bottom(self):
+        self.crop(z_min=0)
+
+    def split(self, z_split):
+        above = self.centers[:, 2] >= z_split
+        above_grid = ColumnarGrid()
+        above_grid._append(self.centers[above], Lattice.classify(self.centers[above]))
+
+        above_grid.crop(z_min=z_split)
+        self.crop(z_max=z_split)
+
+        return above_grid, self
+
+    def crop(self,
+             x_min=-math.inf,
+             x_max=math.inf,
+             y_min=-math.inf,
+             y_max=math.inf,
+             z_min=-math.inf,
+             z_max=math.inf
+             ):
+        x, y, z = self.centers.T
+
+        self.set_flag("crop_bottom", z == z_min)
+        self.set_flag("crop_top", z == z_max)
+        self.set_flag("crop_west", x == x_min)
+        self.set_flag("crop_east", x == x_max)
+        self.set_flag("crop_south", y == y_min)
+        self.set_flag("crop_north", y == y_max)
+
+        self._keep((x >= x_min) & (x <= x_max)
+                   & (y >= y_min) & (y <= y_max)
+                   & (z >= z_min) & (z <= z_max))
+
+        return self
+
+    def compute_trimming(self, mode="sparse"):
+        if mode == "sparse":
+            trimmed = Trimming.trim_flags(self.centers, self.kinds, self.keys, self.keys)
+        else:
+            trimmed = Trimming.trim_flags(self.centers, self.kinds, self.keys, mode=mode)
+        self._flags = (self._flags & Lattice.CROP_MASK) | trimmed
+
+    def carve(self, x_min, x_max, y_min, y_max, z_min, z_max):
+        """Removes all cells in a rectangular prism"""
+        x, y, z = self.centers.T
+        inside = ((x_min <= x) & (x <= x_max)
+                  & (y_min <= y) & (y <= y_max)
+                  & (z_min <= z) & (z <= z_max))
+        self._keep(~inside)
+
+    def _symmetrize(self, stages, copies=False):
+        """
+        Applies Symmetry stages to the grid. Images are fresh cells, or copies of the cells they
+        came from if copies is set.
+        """
+        centers, rows, moved = Symmetry.apply(self.centers, stages)
+        kinds, flags = self.kinds[rows], self.flags[rows]
+        if not copies:
+            kinds = np.where(moved, Lattice.classify(centers), kinds)
+            flags = np.where(moved, 0, flags)
+
+        self._size = 0
+        self._append(centers, kinds, flags)
+        return self
+
+    def full_symmetry(self, center=None):
+        return self._symmetrize([(Symmetry.FULL_SYMMETRY, Symmetry.ORIGIN)], copies=True)
+
+    def reflect_x(self):
+        self.reflect(x=-1)
+
+    def reflect_y(self):
+        self.reflect(y=-1)
+
+    def reflect_z(self):
+        self.reflect(z=-1)
+
+    def reflect(self, x=1, y=1, z=1, center_of_reflection=OctoVector()):
+        self._symmetrize([(Symmetry.reflection(x, y, z), tuple(center_of_reflection))])
+
+    def four_way(self, center_of_rotation=OctoVector()):
+        return self._symmetrize(Symmetry.four_way(tuple(center_of_rotation)))
+
+    def six_way(self, center_of_rotation=OctoVector()):
+        return self._symmetrize(Symmetry.six_way(tuple(center_of_rotation)))
+
+    def __repr__(self):
+        return f"ColumnarGrid({self.name})({str(list(self.occ.keys()))})"
+
+    def __str__(self):
+        return "ColumnarGrid " + str(list(self.occ.keys()))
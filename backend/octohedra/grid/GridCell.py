@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import FrozenInstanceError, dataclass
 
 import numpy as np
 from trimesh import Trimesh
@@ -87,6 +87,18 @@ def belts_to_trimesh(belts):
 @dataclass
 class GridCell:
 
+    def __setattr__(self, name, value):
+        # Cells with a state are shared by every grid (see Lattice.shared_cell): changing one
+        # would change every center holding it, in every grid
+        if getattr(self, "state", None) is not None:
+            raise FrozenInstanceError(f"Shared cells can't be changed, tried to set {name}.")
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name):
+        if getattr(self, "state", None) is not None:
+            raise FrozenInstanceError(f"Shared cells can't be changed, tried to delete {name}.")
+        super().__delattr__(name)
+
     def trim(self, center: OctoVector, occ=set[OctoVector]):
         raise NotImplementedError()
 
@@ -0,0 +1,426 @@
+"""
+Lazy grids: expression trees that describe a grid's cells without building them.
+
+Builders materialize every cell they describe, and crops and symmetries only run afterwards, on
+the finished grid. An expression instead records how the cells come about (flakes, fills,
+translations, unions, symmetries, crops), so it can be simplified before anything is built:
+
+    - Translations of translations fold into one, and a union of one sub-tree at many offsets
+      becomes a single translation by all of them, evaluated once and broadcast.
+    - Crops move down through unions, translations and the symmetries that keep the crop box in
+      place. A sub-tree entirely outside the box is dropped, and one entirely inside it loses the
+      crop.
+
+Evaluating gives sorted, de-duplicated center and flag arrays. Cell kinds follow from the centers
+(see Lattice.classify), and flags only come from crops, so that is everything a grid needs.
+
+Expressions can also be measured without evaluating them: bounds gives a box around the cells and
+profile how many cells there are at each height, worked out from the children's.
+"""
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from octohedra.builders import FlakeKernel
+from octohedra.grid import Lattice, Symmetry
+
+# (axis, side, flag) of each face a crop box can have, in the order OctoGrid.crop sets them
+CROP_FACES = (
+    (2, 0, "crop_bottom"),
+    (2, 1, "crop_top"),
+    (0, 0, "crop_west"),
+    (0, 1, "crop_east"),
+    (1, 0, "crop_south"),
+    (1, 1, "crop_north"),
+)
+
+NO_CELLS = np.empty((0, 3), dtype=np.int64)
+NO_OFFSET = np.zeros((1, 3), dtype=np.int64)
+
+
+def height_profile(centers):
+    """(z, counts): the lowest z of the centers and how many are at each height from there up"""
+    if len(centers) == 0:
+        return 0, np.zeros(0, dtype=np.int64)
+    z = centers[:, 2]
+    return int(z.min()), np.bincount(z - z.min())
+
+
+def add_profiles(profiles):
+    """The sum of several (z, counts) height profiles"""
+    profiles = [(z, counts) for z, counts in profiles if len(counts)]
+    if not profiles:
+        return 0, np.zeros(0, dtype=np.int64)
+    low = min(z for z, _ in profiles)
+    total = np.zeros(max(z + len(counts) for z, counts in profiles) - low, dtype=np.int64)
+    for z, counts in profiles:
+        total[z - low:z - low + len(counts)] += counts
+    return low, total
+
+
+def deduplicate(centers, flags):
+    """Sorts the centers by key and merges duplicates, OR-ing their flags"""
+    keys, inverse = np.unique(Lattice.pack(centers), return_inverse=True)
+    merged = np.zeros(len(keys), dtype=np.uint16)
+    np.bitwise_or.at(merged, inverse.reshape(-1), flags)
+    return Lattice.unpack(keys), merged
+
+
+class Expression:
+    """A grid that hasn't been built yet. Expressions are immutable and evaluate at most once."""
+
+    # Whether any cell can have flags, which only crops give them
+    flagged = False
+
+    def evaluate(self):
+        """(centers, flags): sorted (N, 3) int64 centers and their uint16 flags"""
+        if not hasattr(self, "_value"):
+            self._value = self._evaluate()
+        return self._value
+
+    def _evaluate(self):
+        raise NotImplementedError
+
+    def bounds(self):
+        """(low, high) int64 corners of a box holding every center, or None if there are none"""
+        if not hasattr(self, "_box"):
+            self._box = self._bounds()
+        return self._box
+
+    def _bounds(self):
+        raise NotImplementedError
+
+    def profile(self):
+        """
+        (z, counts): how many cells there are at each height from z up.
+
+        Translations and unions add up their children's profiles without evaluating anything,
+        so cells that several children share are counted once for each of them. Symmetries and
+        leaves are counted from their evaluated centers.
+        """
+        if not hasattr(self, "_profile"):
+            self._profile = self._height_profile()
+        return self._profile
+
+    def _height_profile(self):
+        return height_profile(self.evaluate()[0])
+
+    def count(self) -> int:
+        """The number of cells, from profile"""
+        return int(self.profile()[1].sum())
+
+    def simplified(self) -> "Expression":
+        """An equivalent expression that's cheaper to evaluate. Kept, so that sub-trees shared
+        between several parents simplify to one shared sub-tree too."""
+        if not hasattr(self, "_simplified"):
+            self._simplified = self._simplify()
+        return self._simplified
+
+    def _simplify(self) -> "Expression":
+        return self
+
+    def materialize_into(self, grid):
+        """Simplifies and evaluates the expression, and inserts the cells into grid"""
+        centers, flags = self.simplified().evaluate()
+        grid.insert_cells(centers, flags=flags)
+        return grid
+
+    def __len__(self):
+        return len(self.evaluate()[0])
+
+
+class Empty(Expression):
+    def _evaluate(self):
+        return NO_CELLS, np.empty(0, dtype=np.uint16)
+
+    def _bounds(self):
+        return None
+
+
+EMPTY = Empty()
+
+
+class Cells(Expression):
+    """Explicit centers, such as a sub-structure built some other way"""
+
+    def __init__(self, centers):
+        self.centers = Lattice.as_centers(centers)
+
+    def _evaluate(self):
+        return deduplicate(self.centers, np.zeros(len(self.centers), dtype=np.uint16))
+
+    def _bounds(self):
+        if len(self.centers) == 0:
+            return None
+        return self.centers.min(axis=0), self.centers.max(axis=0)
+
+
+class Flake(Expression):
+    """A flake around the origin; see FlakeKernel.flake_offsets. Use Flake.of to share nodes."""
+
+    def __init__(self, depth, shape="fractal", scale=0):
+        self.depth, self.shape, self.scale = depth, shape, scale
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def of(depth, shape="fractal", scale=0) -> "Flake":
+        return Flake(depth, shape, scale)
+
+    def _evaluate(self):
+        centers = FlakeKernel.flake_offsets(self.depth, self.shape, self.scale)
+        return centers, np.zeros(len(centers), dtype=np.uint16)
+
+    def _bounds(self):
+        centers = FlakeKernel.flake_offsets(self.depth, self.shape, self.scale)
+        return centers.min(axis=0), centers.max(axis=0)
+
+
+class Fill(Expression):
+    """OctoGrid.fill around the origin: centers less than radius away in L1 distance"""
+
+    def __init__(self, radius):
+        self.radius = radius
+
+    def _evaluate(self):
+        centers = Lattice.ball(self.radius)
+        return deduplicate(centers, np.zeros(len(centers), dtype=np.uint16))
+
+    def _bounds(self):
+        if self.radius < 1:
+            return None
+        extent = np.full(3, self.radius - 1, dtype=np.int64)
+        return -extent, extent
+
+
+class Translate(Expression):
+    """The child moved by each of an (M, 3) array of offsets"""
+
+    def __init__(self, child, offsets):
+        self.child = child
+        offsets = Lattice.as_centers(offsets)
+        if len(offsets) > 1:
+            offsets = Lattice.unpack(np.unique(Lattice.pack(offsets)))
+        self.offsets = offsets
+        self.flagged = child.flagged
+
+    def _evaluate(self):
+        centers, flags = self.child.evaluate()
+        if len(self.offsets) == 1:
+            return centers + self.offsets[0], flags
+        moved = (centers[None] + self.offsets[:, None]).reshape(-1, 3)
+        return deduplicate(moved, np.tile(flags, len(self.offsets)))
+
+    def _bounds(self):
+        bounds = self.child.bounds()
+        if bounds is None or len(self.offsets) == 0:
+            return None
+        return bounds[0] + self.offsets.min(axis=0), bounds[1] + self.offsets.max(axis=0)
+
+    def _height_profile(self):
+        z, counts = self.child.profile()
+        shifts, repeats = np.unique(self.offsets[:, 2], return_counts=True)
+        if len(counts) == 0 or len(shifts) == 0:
+            return 0, np.zeros(0, dtype=np.int64)
+        total = np.zeros(len(counts) + shifts[-1] - shifts[0], dtype=np.int64)
+        for shift, repeat in zip((shifts - shifts[0]).tolist(), repeats.tolist()):
+            total[shift:shift + len(counts)] += repeat * counts
+        return z + int(shifts[0]), total
+
+    def _simplify(self):
+        child = self.child.simplified()
+        if isinstance(child, Empty) or len(self.offsets) == 0:
+            return EMPTY
+        if isinstance(child, Translate):
+            offsets = (child.offsets[None] + self.offsets[:, None]).reshape(-1, 3)
+            return Translate(child.child, offsets)
+        if len(self.offsets) == 1 and not self.offsets.any():
+            return child
+        return self if child is self.child else Translate(child, self.offsets)
+
+
+class Union(Expression):
+    """Every child's cells. A center in several children gets all of their flags."""
+
+    def __init__(self, *children):
+        self.children = children
+        self.flagged = any(child.flagged for child in children)
+
+    def _evaluate(self):
+        values = [child.evaluate() for child in self.children]
+        if not values:
+            return EMPTY.evaluate()
+        return deduplicate(np.concatenate([centers for centers, _ in values]),
+                           np.concatenate([flags for _, flags in values]))
+
+    def _bounds(self):
+        bounds = [b for b in (child.bounds() for child in self.children) if b is not None]
+        if not bounds:
+            return None
+        return (np.min([low for low, _ in bounds], axis=0),
+                np.max([high for _, high in bounds], axis=0))
+
+    def _height_profile(self):
+        return add_profiles(child.profile() for child in self.children)
+
+    def _simplify(self):
+        # Flatten, then gather the translations of each distinct sub-tree into one
+        children, pending = [], list(self.children)
+        while pending:
+            child = pending.pop(0).simplified()
+            if isinstance(child, Union):
+                pending[:0] = child.children
+            elif not isinstance(child, Empty):
+                children.append(child)
+
+        translations = dict()
+        for child in children:
+            node = child.child if isinstance(child, Translate) else child
+            translations.setdefault(id(node), (node, []))[1].append(child)
+
+        folded = []
+        for node, moves in translations.values():
+            if len(moves) == 1:
+                folded.append(moves[0])
+            else:
+                offsets = [m.offsets if isinstance(m, Translate) else NO_OFFSET for m in moves]
+                folded.append(Translate(node, np.concatenate(offsets)))
+        if not folded:
+            return EMPTY
+        return folded[0] if len(folded) == 1 else Union(*folded)
+
+
+class Symmetric(Expression):
+    """Symmetry.apply stages applied to the child. Images are fresh cells, or copies of the cells
+    they come from (flags included) if copies is set; see OctoGrid._symmetrize."""
+
+    def __init__(self, child, stages, copies=False):
+        self.child, self.stages, self.copies = child, stages, copies
+        self.flagged = child.flagged and copies
+
+    def _evaluate(self):
+        centers, flags = self.child.evaluate()
+        centers, rows, moved = Symmetry.apply(centers, self.stages)
+        flags = flags[rows] if self.copies else np.where(moved, 0, flags[rows]).astype(np.uint16)
+        return deduplicate(centers, flags)
+
+    def _bounds(self):
+        bounds = self.child.bounds()
+        if bounds is None:
+            return None
+        corners = np.stack(np.meshgrid(*zip(*bounds), indexing="ij"), axis=-1).reshape(-1, 3)
+        for ops, origin in self.stages:
+            corners = np.concatenate((corners, Symmetry.images(corners, ops, origin)))
+        return corners.min(axis=0), corners.max(axis=0)
+
+    def _simplify(self):
+        child = self.child.simplified()
+        if isinstance(child, Empty):
+            return EMPTY
+        return Symmetric(child, self.stages, self.copies)
+
+    def keeps_box(self, low, high) -> bool:
+        """Whether every operation leaves the coordinate of each finite face of the box alone,
+        so that it maps each face onto itself"""
+        axes = {axis for axis, side, _ in CROP_FACES if not math.isinf((low, high)[side][axis])}
+        return all(op[axis, axis] == 1 for ops, _ in self.stages for op in ops for axis in axes)
+
+
+class Crop(Expression):
+    """OctoGrid.crop: keeps the centers inside the box, bounds included, and flags the ones on
+    each finite face"""
+
+    def __init__(self, child, low=(-math.inf,) * 3, high=(math.inf,) * 3):
+        self.child = child
+        self.low, self.high = tuple(low), tuple(high)
+        self.flagged = True
+
+    @classmethod
+    def box(cls, child, x_min=-math.inf, x_max=math.inf, y_min=-math.inf, y_max=math.inf,
+            z_min=-math.inf, z_max=math.inf):
+        return cls(child, (x_min, y_min, z_min), (x_max, y_max, z_max))
+
+    def _evaluate(self):
+        centers, flags = self.child.evaluate()
+        flags = flags.copy()
+        for axis, side, name in CROP_FACES:
+            flags[centers[:, axis] == (self.low, self.high)[side][axis]] |= Lattice.FLAGS[name]
+        inside = ((centers >= self.low) & (centers <= self.high)).all(axis=1)
+        return centers[inside], flags[inside]
+
+    def _bounds(self):
+        bounds = self.child.bounds()
+        if bounds is None:
+            return None
+        low = np.maximum(bounds[0], np.clip(self.low, -2 ** 62, 2 ** 62)).astype(np.int64)
+        high = np.minimum(bounds[1], np.clip(self.high, -2 ** 62, 2 ** 62)).astype(np.int64)
+        return None if (low > high).any() else (low, high)
+
+    def _height_profile(self):
+        relation = self.relation(self.child.bounds())
+        if relation == "outside":
+            return 0, np.zeros(0, dtype=np.int64)
+        if relation == "across" and isinstance(self.child, (Cells, Flake, Fill)):
+            return height_profile(self.evaluate()[0])
+
+        # Only the heights are cropped, so cells outside the box's sides still count
+        z, counts = self.child.profile()
+        low = max(self.low[2], z)
+        high = min(self.high[2], z + len(counts) - 1)
+        if low > high:
+            return 0, np.zeros(0, dtype=np.int64)
+        return int(low), counts[int(low) - z:int(high) - z + 1]
+
+    def relation(self, bounds, offset=(0, 0, 0)) -> str:
+        """Where a box of centers moved by offset lies: "outside", "inside" (clear of the faces)
+        or "across" the crop box"""
+        if bounds is None:
+            return "outside"
+        low, high = bounds[0] + offset, bounds[1] + offset
+        if (high < self.low).any() or (low > self.high).any():
+            return "outside"
+        if (low > self.low).all() and (high < self.high).all():
+            return "inside"
+        return "across"
+
+    def moved(self, child, offset):
+        """This crop, moved back by offset, applied to child"""
+        return Crop(child, np.subtract(self.low, offset), np.subtract(self.high, offset))
+
+    def _simplify(self):
+        child = self.child.simplified()
+        relation = self.relation(child.bounds())
+        if relation == "outside":
+            return EMPTY
+        if relation == "inside":
+            return child
+
+        if isinstance(child, Union):
+            return Union(*(Crop(c, self.low, self.high) for c in child.children)).simplified()
+
+        if isinstance(child, Translate):
+            # Sort the offsets by where they put the child, keep the inside ones together and
+            # crop the rest with the box moved back by each offset
+            bounds = child.child.bounds()
+            inside, across = [], dict()
+            for offset in child.offsets.tolist():
+                relation = self.relation(bounds, offset)
+                if relation == "inside":
+                    inside.append(offset)
+                elif relation == "across":
+                    moved = self.moved(child.child, offset)
+                    across.setdefault((moved.low, moved.high), []).append(offset)
+
+            parts = [Translate(child.child, inside)] if inside else []
+            for (low, high), offsets in across.items():
+                cropped = Crop(child.child, low, high).simplified()
+                parts.append(Translate(cropped, offsets))
+            return Union(*parts).simplified()
+
+        if isinstance(child, Symmetric) and not child.child.flagged \
+                and child.keeps_box(self.low, self.high):
+            # Images land on the face their cell is on, so they can copy its crop flags
+            cropped = Crop(child.child, self.low, self.high).simplified()
+            return Symmetric(cropped, child.stages, copies=True).simplified()
+
+        return Crop(child, self.low, self.high)
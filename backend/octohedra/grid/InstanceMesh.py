@@ -0,0 +1,199 @@
+"""
+Meshes of grids made of translated templates, rendered once per template and reused.
+
+Most cells of a grid built from an InstancePlan are deep inside one instance of a template, where
+the cells around them are the template's own. Their trim flags and mesh are the same as in the
+template on its own, so each template is trimmed, stamped and merged once and its mesh is
+translated to every instance. Cell kinds and tetra parities depend on coordinates mod 4, so this
+is done once per template and translation mod 4.
+
+Only seam cells are re-trimmed and re-stamped, against the whole grid: cells within SEAM_REACH of
+another instance's cells or of a crop face, where what the stencils look at or what touches the
+cell's mesh may differ. Cells within twice that reach keep their mesh, but their vertices are
+merged with the seams' like Trimesh.process would. Anything further in can't touch a seam, so the
+rest of each instance's mesh goes in as is.
+
+Flakes composed into towers and temples touch each other nearly everywhere, leaving little that
+isn't seam. Past MAX_SEAM_SHARE, the grid is rendered whole the usual way instead, which is then
+cheaper.
+"""
+import math
+
+import numpy as np
+import trimesh
+from trimesh import grouping, transformations
+
+from octohedra.grid import Lattice, Stamper, Trimming
+from octohedra.grid.ColumnarGrid import ColumnarGrid
+
+# How far apart along every axis two cells can be and still change each other's flags or touch:
+# stencils look up to 4 away, and cell meshes reach a little over 2 from their centers
+SEAM_REACH = max(int(np.abs(Trimming.NEIGHBOUR_OFFSETS).max()), 4)
+
+# The share of cells at seams above which rendering the whole grid is cheaper
+MAX_SEAM_SHARE = 0.9
+
+# Vertices closer than this many decimals apart are merged, as Trimesh.process merges them
+MERGE_DIGITS = 8
+
+# Stamped and merged template meshes by (template, residue, render config), see template_mesh
+TEMPLATE_MESHES = dict()
+
+# Rendered cells by (kind, flags, render config)
+CELL_MESHES = dict()
+
+
+def render_state(kind, flags, config):
+    if (kind, flags, config) not in CELL_MESHES:
+        CELL_MESHES[(kind, flags, config)] = Lattice.make_cell(kind, flags).render(config)
+    return CELL_MESHES[(kind, flags, config)]
+
+
+def merge_groups(vertices):
+    """(first, inverse): the first of each set of vertices that are the same to MERGE_DIGITS
+    decimals, and which set each vertex is in"""
+    keys = np.round(vertices * 10 ** MERGE_DIGITS).astype(np.int64)
+    first, inverse = grouping.unique_rows(keys)
+    return first, inverse.reshape(-1)
+
+
+def merge_vertices(vertices, faces):
+    """Merges vertices that are the same to MERGE_DIGITS decimals, keeping the first of each"""
+    first, inverse = merge_groups(vertices)
+    return vertices[first], inverse[faces]
+
+
+def template_mesh(template, offsets, residue, config):
+    """
+    The mesh of a template's cells moved by residue and trimmed against each other alone, with
+    its vertices merged: (vertices, faces, face_rows), face_rows being the cell of each face.
+    """
+    key = (template, residue, config)
+    if key not in TEMPLATE_MESHES:
+        centers = offsets + np.array(residue, dtype=np.int64)
+        kinds = Lattice.classify(centers)
+        flags = Trimming.trim_flags(centers, kinds)
+        vertices, faces, face_rows = Stamper.stamp(centers, kinds, flags, render_state, config)
+        vertices, faces = merge_vertices(vertices, faces)
+        TEMPLATE_MESHES[key] = vertices, faces, face_rows
+    return TEMPLATE_MESHES[key]
+
+
+def near_blocks(blocks, values):
+    """
+    For cells in blocks of SEAM_REACH along each axis, the lowest and highest of the values of
+    the cells in each cell's block and the 26 around it. Any cell within SEAM_REACH of a cell is
+    in one of those.
+    """
+    block_keys, inverse = np.unique(Lattice.pack(blocks), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+    low = np.minimum.reduceat(values[order], starts)
+    high = np.maximum.reduceat(values[order], starts)
+
+    near_low, near_high = low.copy(), high.copy()
+    block_centers = Lattice.unpack(block_keys)
+    for offset in np.ndindex(3, 3, 3):
+        neighbours = Lattice.pack(block_centers + np.subtract(offset, 1))
+        found = np.searchsorted(block_keys, neighbours).clip(max=len(block_keys) - 1)
+        exists = block_keys[found] == neighbours
+        near_low[exists] = np.minimum(near_low[exists], low[found[exists]])
+        near_high[exists] = np.maximum(near_high[exists], high[found[exists]])
+    return near_low[inverse], near_high[inverse]
+
+
+def distance_to_faces(centers, clip) -> np.ndarray:
+    """How far each center is inside the clip box from its nearest finite face, or a negative
+    distance if it's outside"""
+    low, high = (np.asarray(bound, dtype=float) for bound in clip)
+    return np.minimum(centers - low, high - centers).min(axis=1)
+
+
+def render(templates, centers, flags, clip, config, rotate=True):
+    """
+    The mesh of a grid made of translated templates, as the grid's own render would make it once
+    trimmed.
+
+    templates: (template, offsets, translations) for each template, offsets being its (S, 3)
+        cells and translations the (M, 3) places it's at. template is any hashable name for it.
+    centers, flags: the grid's cells, sorted by key, and their crop flags
+    clip: the (low, high) box the grid was cropped to, or None
+    """
+    keys = Lattice.pack(centers)
+    render_config = config.derive_render_config()
+    unit = render_config.cell_size / 4
+    if len(keys) == 0:
+        return trimesh.Trimesh()
+
+    instances = [(template, offsets, translation) for template, offsets, translations in templates
+                 for translation in translations]
+    sizes = [len(offsets) for _, offsets, _ in instances]
+    cells = np.concatenate([offsets + t for _, offsets, t in instances]).reshape(-1, 3)
+    owners = np.repeat(np.arange(len(instances)), sizes)
+
+    # Seams: cells with another instance's cells or a crop face within reach. Fringes: cells that
+    # may touch a seam cell, whose vertices get merged with the seams'.
+    blocks = cells // SEAM_REACH
+    low, high = near_blocks(blocks, owners)
+    seam = (low != owners) | (high != owners)
+    if clip is not None:
+        seam |= distance_to_faces(cells, clip) <= SEAM_REACH
+    if seam.mean() > MAX_SEAM_SHARE:
+        grid = ColumnarGrid()
+        grid.insert_cells(centers, flags=flags)
+        grid.compute_trimming(mode="auto")
+        return grid.render(config, rotate)
+    fringe = near_blocks(blocks, seam.astype(np.int64))[1].astype(bool)
+
+    vertices, faces, mergeable = [], [], []
+    vertex_count = 0
+    for (template, offsets, translation), rows in zip(instances, np.split(np.arange(len(cells)),
+                                                                          np.cumsum(sizes)[:-1])):
+        residue = tuple((translation % 4).tolist())
+        mesh_vertices, mesh_faces, face_rows = template_mesh(template, offsets, residue,
+                                                             render_config)
+        moved = mesh_vertices + (translation - np.array(residue)) * unit
+
+        touching = np.zeros(len(moved), dtype=bool)
+        if fringe[rows].any():
+            touching[mesh_faces[fringe[rows][face_rows]]] = True
+            mesh_faces = mesh_faces[~seam[rows][face_rows]]
+
+        vertices.append(moved)
+        faces.append(mesh_faces + vertex_count)
+        mergeable.append(touching)
+        vertex_count += len(moved)
+
+    # Seam cells: once each, only if they survived the crop, trimmed against the whole grid
+    seam_keys = np.unique(Lattice.pack(cells[seam]))
+    seam_keys = seam_keys[Lattice.contains(keys, seam_keys)]
+    if len(seam_keys):
+        seam_centers = Lattice.unpack(seam_keys)
+        seam_kinds = Lattice.classify(seam_centers)
+        seam_flags = ((flags[np.searchsorted(keys, seam_keys)] & Lattice.CROP_MASK)
+                      | Trimming.trim_flags(seam_centers, seam_kinds, seam_keys, keys))
+        seam_vertices, seam_faces, _ = Stamper.stamp(seam_centers, seam_kinds, seam_flags,
+                                                     render_state, render_config)
+        vertices.append(seam_vertices)
+        faces.append(seam_faces + vertex_count)
+        mergeable.append(np.ones(len(seam_vertices), dtype=bool))
+
+    vertices, faces = np.concatenate(vertices), np.concatenate(faces)
+    mergeable = np.flatnonzero(np.concatenate(mergeable))
+
+    # Merge the vertices around seams, then drop the ones only seam cells' old meshes used
+    remap = np.arange(len(vertices))
+    first, inverse = merge_groups(vertices[mergeable])
+    remap[mergeable] = mergeable[first][inverse]
+    faces = remap[faces]
+
+    used = np.zeros(len(vertices), dtype=bool)
+    used[faces] = True
+    faces = (np.cumsum(used) - 1)[faces]
+    vertices = vertices[used]
+
+    if rotate:
+        rotation = transformations.rotation_matrix(math.radians(45), (0, 0, 1))[:3, :3]
+        vertices = vertices @ rotation.T
+    return trimesh.Trimesh(vertices, faces, process=False)
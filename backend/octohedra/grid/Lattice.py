@@ -0,0 +1,235 @@
+"""
+Array helpers for the tetra-octa honeycomb lattice.
+
+The array-backed grids describe a cell by three small numbers instead of an OctoVector and a
+GridCell instance: a packed integer key for its center, a kind (octo or tetra) and a bit field
+holding the crop/trim/weld flags. This module owns those encodings so every backend agrees on
+them.
+"""
+import numpy as np
+
+from octohedra.grid.OctoCell import OctoCell
+from octohedra.grid.TetraCell import TetraCell
+
+# Each coordinate gets KEY_BITS bits of the packed key, z in the most significant slot so that
+# sorting by key sorts by z first.
+KEY_BITS = 21
+KEY_OFFSET = 1 << (KEY_BITS - 1)
+KEY_MASK = (1 << KEY_BITS) - 1
+COORD_MIN = -KEY_OFFSET
+COORD_MAX = KEY_OFFSET - 1
+
+# Cell kinds
+NO_CELL = 0
+OCTO = 1
+TETRA = 2
+
+# One bit per boolean field, in declaration order. TetraCell's fields are a subset of these, plus
+# 'flip', which only tetras have.
+FLAG_NAMES = ("weld_up", "weld_down", "clip_point_up",
+              "crop_top", "crop_bottom", "crop_east", "crop_west", "crop_north", "crop_south",
+              "trim_ne", "trim_nw", "trim_sw", "trim_se",
+              "flip")
+FLAGS = {name: 1 << bit for bit, name in enumerate(FLAG_NAMES)}
+
+OCTO_FIELDS = tuple(OctoCell.__dataclass_fields__)
+TETRA_FIELDS = tuple(TetraCell.__dataclass_fields__)
+
+OCTO_MASK = sum(FLAGS[name] for name in OCTO_FIELDS)
+TETRA_MASK = sum(FLAGS[name] for name in TETRA_FIELDS)
+CROP_MASK = sum(FLAGS[name] for name in FLAG_NAMES if name.startswith("crop_"))
+# Everything compute_trimming is allowed to overwrite
+TRIM_MASK = (OCTO_MASK | TETRA_MASK) & ~CROP_MASK
+
+CELL_TYPES = {OCTO: OctoCell, TETRA: TetraCell}
+KIND_MASKS = {OCTO: OCTO_MASK, TETRA: TETRA_MASK}
+TRIM_FIELDS = {kind: tuple(name for name in cell_type.__dataclass_fields__
+                           if FLAGS[name] & TRIM_MASK)
+               for kind, cell_type in CELL_TYPES.items()}
+
+
+def pack(centers) -> np.ndarray:
+    """Packs an (N, 3) array of integer centers into an (N,) array of sortable int64 keys."""
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+    if len(centers) and (centers.min() < COORD_MIN or centers.max() > COORD_MAX):
+        raise ValueError(f"Grid coordinates must lie within [{COORD_MIN}, {COORD_MAX}].")
+
+    shifted = centers + KEY_OFFSET
+    return (shifted[:, 2] << (2 * KEY_BITS)) | (shifted[:, 1] << KEY_BITS) | shifted[:, 0]
+
+
+def pack_offset(offset) -> int:
+    """The amount pack() of a center changes by when the center is moved by offset. Only valid
+    while the moved center stays inside the packable range.
+    """
+    dx, dy, dz = offset
+    return (dz << (2 * KEY_BITS)) + (dy << KEY_BITS) + dx
+
+
+def contains(sorted_keys, keys) -> np.ndarray:
+    """Membership test of keys against a sorted, de-duplicated key array"""
+    keys = np.asarray(keys, dtype=np.int64)
+    if len(sorted_keys) == 0:
+        return np.zeros(keys.shape, dtype=bool)
+    rows = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[rows] == keys
+
+
+def sorted_keys(centers) -> np.ndarray:
+    """The sorted, de-duplicated keys of an (N, 3) center array, for contains()"""
+    return np.unique(pack(centers))
+
+
+def unpack(keys) -> np.ndarray:
+    """Inverse of pack()"""
+    keys = np.asarray(keys, dtype=np.int64)
+    centers = np.empty((len(keys), 3), dtype=np.int64)
+    centers[:, 0] = keys & KEY_MASK
+    centers[:, 1] = (keys >> KEY_BITS) & KEY_MASK
+    centers[:, 2] = keys >> (2 * KEY_BITS)
+    return centers - KEY_OFFSET
+
+
+def cell_kind(x, y, z, strict=False, octo_only=False, tetra_only=False) -> int:
+    """Which kind of cell OctoGrid.insert_cell would put at (x, y, z), or NO_CELL if it would leave
+    the grid alone.
+
+    Outside of strict mode, insert_cell writes an OctoCell first and then decides whether a more
+    specific cell belongs there, so every point ends up occupied by something.
+    """
+    kind = NO_CELL if strict else OCTO
+
+    valid_even_z = (x % 4 == 2 and y % 4 == 0) or (x % 4 == 0 and y % 4 == 2)
+    valid_odd_z = (x % 4 == 0 and y % 4 == 0) or (x % 4 == 2 and y % 4 == 2)
+
+    if z % 4 == 0 and valid_even_z or z % 4 == 2 and valid_odd_z:
+        if not tetra_only:
+            kind = OCTO
+    elif z % 2 == 1 and abs(x) % 2 == 1 and abs(y) % 2 == 1:
+        if not octo_only:
+            kind = TETRA
+
+    return kind
+
+
+# Filled in by kind_table, one table per combination of insert_cell options
+KIND_TABLES = dict()
+
+
+def kind_table(strict=False, octo_only=False, tetra_only=False) -> np.ndarray:
+    """cell_kind() for every residue of (x, y, z) mod 4, as a (4, 4, 4) lookup table. The parity
+    rules only depend on coordinates mod 4, so this is all classify() needs.
+    """
+    key = (strict, octo_only, tetra_only)
+    if key not in KIND_TABLES:
+        table = np.empty((4, 4, 4), dtype=np.uint8)
+        for x, y, z in np.ndindex(4, 4, 4):
+            table[x, y, z] = cell_kind(x, y, z, strict, octo_only, tetra_only)
+        KIND_TABLES[key] = table
+    return KIND_TABLES[key]
+
+
+def classify(centers, strict=False, octo_only=False, tetra_only=False) -> np.ndarray:
+    """Vectorized cell_kind() over an (N, 3) array of centers"""
+    centers = as_centers(centers) % 4
+    return kind_table(strict, octo_only, tetra_only)[centers[:, 0], centers[:, 1], centers[:, 2]]
+
+
+def as_centers(centers) -> np.ndarray:
+    """Converts centers to an (N, 3) int64 array, refusing coordinates that aren't integers"""
+    centers = np.asarray(centers)
+    if centers.size and not np.issubdtype(centers.dtype, np.integer):
+        if not np.array_equal(centers, np.round(centers)):
+            raise ValueError("OctoVector coordinates may only be integers.")
+    return centers.astype(np.int64).reshape(-1, 3)
+
+
+def ball(radius, center=(0, 0, 0)) -> np.ndarray:
+    """The centers OctoGrid.fill covers: points less than radius from center in L1 distance"""
+    r = np.arange(-radius + 1, radius)
+    points = np.stack(np.meshgrid(r, r, r, indexing="ij"), axis=-1).reshape(-1, 3)
+    return points[np.abs(points).sum(axis=1) < radius] + as_centers(tuple(center))
+
+
+def kind_of(cell) -> int:
+    return TETRA if isinstance(cell, TetraCell) else OCTO
+
+
+def flags_of(cell) -> int:
+    """Packs the boolean fields of a cell into a flag bit field"""
+    state = getattr(cell, "state", None)
+    if state is not None:
+        return state & STATE_FLAGS
+    flags = 0
+    for name in FLAG_NAMES:
+        if getattr(cell, name, False):
+            flags |= FLAGS[name]
+    return flags
+
+
+def make_cell(kind, flags):
+    """Builds a fresh cell object of the given kind with its fields set from a flag bit field"""
+    cell_type = CELL_TYPES[int(kind)]
+    fields = OCTO_FIELDS if cell_type is OctoCell else TETRA_FIELDS
+    return cell_type(**{name: bool(int(flags) & FLAGS[name]) for name in fields})
+
+
+# A cell's state is its kind and flags packed into one integer: kind << STATE_BITS | flags
+STATE_BITS = 16
+STATE_FLAGS = (1 << STATE_BITS) - 1
+
+# One shared cell per state, see shared_cell
+SHARED_CELLS = dict()
+
+
+def state(kind, flags) -> int:
+    return int(kind) << STATE_BITS | int(flags)
+
+
+def state_of(cell) -> int:
+    """The state of a shared cell, or the one a fresh cell's fields describe"""
+    cell_state = getattr(cell, "state", None)
+    return cell_state if cell_state is not None else state(kind_of(cell), flags_of(cell))
+
+
+def render_state(cell_state) -> int:
+    """The state without the flags its kind doesn't have, which don't change how it renders"""
+    kind = cell_state >> STATE_BITS
+    return cell_state & ~STATE_FLAGS | cell_state & KIND_MASKS[kind]
+
+
+def shared_cell(kind, flags=0):
+    """
+    The one cell object for this kind and flags. Grids hold these instead of a cell per center, so
+    they can't be modified once they have their state (see GridCell.__setattr__): to change a
+    cell, put the shared cell of its new state in its place. Flags the kind has no field for are
+    kept as plain attributes.
+    """
+    cell_state = state(kind, flags)
+    cell = SHARED_CELLS.get(cell_state)
+    if cell is None:
+        cell = make_cell(kind, flags)
+        fields = OCTO_FIELDS if isinstance(cell, OctoCell) else TETRA_FIELDS
+        for name in FLAG_NAMES:
+            if name not in fields and int(flags) & FLAGS[name]:
+                setattr(cell, name, True)
+        cell.state = cell_state
+        cell = SHARED_CELLS.setdefault(cell_state, cell)
+    return cell
+
+
+def shared_cells(kinds, flags=None) -> list:
+    """shared_cell for each of an array of kinds and flags, looking each state up only once"""
+    kinds = np.asarray(kinds, dtype=np.int64)
+    states = kinds << STATE_BITS
+    if flags is not None:
+        states |= np.asarray(flags, dtype=np.int64)
+    unique, inverse = np.unique(states, return_inverse=True)
+    cells = [shared_cell(cell_state >> STATE_BITS, cell_state & STATE_FLAGS)
+             for cell_state in unique.tolist()]
+    return [cells[i] for i in inverse.reshape(-1).tolist()]
+
+
+def with_flags(cell, flags, mask=STATE_FLAGS):
+    """The shared cell for cell's kind with the flags under mask replaced by the given ones"""
+    return shared_cell(kind_of(cell), flags_of(cell) & ~mask | flags & mask)
@@ -158,6 +158,20 @@ class OctoCell(GridCell):
         belts = np.array(upper_belts + [equator_belt] + lower_belts)
         # print(belts)
 
+        self.crop_belts(belts)
+
+        mesh = belts_to_trimesh(belts)
+        if self.crop_bottom and flange > 0:
+            # mesh += belts_to_trimesh(np.array([lower_flange_belt, pyramid_bottom_belt]))
+            flange_belts = np.array([lower_flange_belt, static_equator_belt, pyramid_bottom_belt])
+            # The flange stops at the side crops too, or it would stick out past a cut
+            self.crop_belts(flange_belts)
+            mesh += belts_to_trimesh(flange_belts)
+
+        return mesh
+
+    def crop_belts(self, belts):
+        """Flattens the corners of each belt that point at a cropped side onto the center"""
         for belt in belts:
             if self.crop_east:
                 belt[0][0] = 0
@@ -172,13 +186,4 @@ class OctoCell(GridCell):
                 belt[3][0] = 0
                 belt[3][1] = 0
 
-        mesh = belts_to_trimesh(belts)
-        if self.crop_bottom and flange > 0:
-            # mesh += belts_to_trimesh(np.array([lower_flange_belt, pyramid_bottom_belt]))
-            mesh += belts_to_trimesh(np.array([lower_flange_belt, static_equator_belt,
-                                               pyramid_bottom_belt]))
-            pass
-
-        return mesh
-
 
@@ -1,16 +1,15 @@
 import math
-from copy import copy
-from dataclasses import astuple
 from functools import wraps
+from itertools import compress
 
+import numpy as np
 import trimesh
-from euclid3 import Vector3
 from trimesh import transformations, util
 
+from octohedra.grid import Lattice, Stamper, Symmetry, Trimming
 from octohedra.grid.GridCell import GridCell
-from octohedra.grid.OctoCell import OctoCell
-from octohedra.grid.OctoVector import OctoVector
-from octohedra.grid.TetraCell import TetraCell
+from octohedra.grid.OctoVector import OctoVector, vectors
+from octohedra.grid.SpatialIndex import SpatialIndex
 from octohedra.utils import OctoConfigs
 from octohedra.utils.OctoConfig import RenderConfig
 
@@ -41,6 +40,12 @@ class OctoGrid:
         self.occ = dict()
         self.subgrids = dict()
         self.cache = dict()
+        # Centers inserted, removed or cropped since the last trimming pass, or None before the
+        # first one (see update_trimming)
+        self.changed = None
+        # Bumped by every change to the set of centers made through the grid's methods
+        self.mutations = 0
+        self._index = None
 
     def add_subgrid(self, name):
         self.subgrids[name] = OctoGrid(name)
@@ -52,30 +57,127 @@ class OctoGrid:
         return {self.name: self} | self.subgrids
 
     def merge(self, other):
-        self.occ = {**self.occ, **other.occ}
+        """Adds other's cells in place, replacing any of ours at the same centers"""
+        self._touch(other.occ)
+        self.occ.update(other.occ)
         return self
 
     def __add__(self, other):
         return self.merge(other)
 
-    def keep_octo(self, m, center):
+    # Set algebra. These work on packed keys, take any grid with centers and contains(), and change
+    # this grid in place like merge does. Cells that stay keep their state.
+
+    def contains(self, points) -> np.ndarray:
+        """Whether each row of an (N, 3) point array holds a cell"""
+        return Lattice.contains(Lattice.sorted_keys(self.centers), Lattice.pack(points))
 
-        to_keep = dict()
-        for x, y, z in self.occ:
-            i, j, k = tuple(Vector3(x, y, z) - center)
-            yz = abs(j) + abs(k) <= m
-            zx = abs(k) + abs(i) <= m
-            if yz and zx:
-                to_keep[(x, y, z)] = self.occ[(x, y, z)]
+    def union(self, other):
+        return self.merge(other)
+
+    def intersection(self, other):
+        """Keeps only the cells whose centers other also has"""
+        self._keep(other.contains(self.centers))
+        return self
+
+    def difference(self, other):
+        """Removes the cells whose centers other has"""
+        self._keep(~other.contains(self.centers))
+        return self
+
+    def symmetric_difference(self, other):
+        """Keeps the cells only one of the grids has, taking other's cells from other"""
+        ours, theirs = Lattice.pack(self.centers), Lattice.pack(other.centers)
+        added = dict(compress(other.occ.items(),
+                              (~Lattice.contains(np.unique(ours), theirs)).tolist()))
+        self._keep(~Lattice.contains(np.unique(theirs), ours))
+        self._touch(added)
+        self.occ.update(added)
+        return self
 
-        self.occ = to_keep
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __xor__(self, other):
+        return self.symmetric_difference(other)
+
+    @property
+    def centers(self) -> np.ndarray:
+        """(N, 3) array of the cell centers, in the same order as occ"""
+        return np.fromiter((v for c in self.occ for v in (c.x, c.y, c.z)), dtype=np.int64,
+                           count=3 * len(self.occ)).reshape(-1, 3)
+
+    def _keep(self, mask):
+        """Keeps only the cells where mask, which is in occ order, is set"""
+        self._touch(compress(self.occ, (~mask).tolist()))
+        self.occ = dict(compress(self.occ.items(), mask.tolist()))
+
+    def _set_flag(self, name, mask):
+        flag = Lattice.FLAGS[name]
+        centers = list(compress(self.occ, mask.tolist()))
+        self._touch(centers)
+        for center in centers:
+            self.occ[center] = Lattice.with_flags(self.occ[center], flag, flag)
+
+    def _touch(self, centers):
+        """Counts a change to the grid, and records the changed centers for update_trimming once
+        flags are being kept up to date"""
+        self.mutations += 1
+        if self.changed is not None:
+            self.changed.update(centers)
+
+    @property
+    def index(self) -> SpatialIndex:
+        """A SpatialIndex of the centers, rebuilt when the grid has changed through its methods
+        (see _touch) or occ was replaced since it was built"""
+        indexed, mutations, index = self._index or (None, None, None)
+        if indexed is not self.occ or mutations != self.mutations:
+            index = SpatialIndex.from_centers(self.centers)
+            self._index = (self.occ, self.mutations, index)
+        return index
+
+    def box(self, x_min=-math.inf, x_max=math.inf, y_min=-math.inf, y_max=math.inf,
+            z_min=-math.inf, z_max=math.inf) -> np.ndarray:
+        """(N, 3) array of the centers inside the box, bounds included"""
+        return self.index.box((x_min, y_min, z_min), (x_max, y_max, z_max))
+
+    def within(self, center, m) -> np.ndarray:
+        """(N, 3) array of the centers at most m from center in L1 distance"""
+        return self.index.within(center, m)
+
+    def nearest(self, point, k=1) -> np.ndarray:
+        """(k, 3) array of the centers nearest to point in L1 distance, nearest first"""
+        return self.index.nearest(point, k)
 
-    def render(self, config=OctoConfigs.default, rotate=True, grid=DEFAULT_GRID):
+    def keep_octo(self, m, center):
+        i, j, k = (self.centers - np.asarray(tuple(center))).T
+        yz = np.abs(j) + np.abs(k) <= m
+        zx = np.abs(k) + np.abs(i) <= m
+        self._keep(yz & zx)
+
+    def render(self, config=OctoConfigs.default, rotate=True, grid=DEFAULT_GRID, symmetric=False):
+        """
+        With symmetric set, only a fundamental domain of the grid's symmetry group is trimmed and
+        rendered, and its mesh is copied around by the group's operations (see
+        Stamper.stamp_symmetric). Trim flags are computed as part of that.
+        """
         render_config = config.derive_render_config()
-        cells = [self.render_cell(cell, center, render_config) for center, cell in self.occ.items()]
 
-        if len(cells) > 0:
-            cell_meshes = util.concatenate(cells)
+        if len(self.occ) > 0 and symmetric:
+            cells = list(self.occ.values())
+            kinds = np.fromiter(map(Lattice.kind_of, cells), dtype=np.uint8, count=len(cells))
+            flags = np.fromiter(map(Lattice.flags_of, cells), dtype=np.uint16, count=len(cells))
+            cell_meshes = Stamper.stamp_symmetric(self.centers, kinds, flags, self._render_state,
+                                                  render_config)
+        elif len(self.occ) > 0:
+            cell_meshes = util.concatenate([self.render_cell(cell, center, render_config)
+                                            for center, cell in self.occ.items()])
         else:
             cell_meshes = trimesh.Trimesh()
 
@@ -87,13 +189,20 @@ class OctoGrid:
         return cell_meshes.process()
 
     def render_cell(self, cell: GridCell, center: OctoVector, config: RenderConfig):
-        if astuple(cell) not in self.cache:
-            self.cache[astuple(cell)] = cell.render(config)
+        cell_state = Lattice.render_state(Lattice.state_of(cell))
+        if cell_state not in self.cache:
+            self.cache[cell_state] = cell.render(config)
 
-        cell_mesh = self.cache[astuple(cell)].copy()
+        cell_mesh = self.cache[cell_state].copy()
 
         return cell_mesh.apply_translation(center.as_np() * (config.cell_size / 4))
 
+    def _render_state(self, kind, flags, config: RenderConfig):
+        cell_state = Lattice.render_state(Lattice.state(kind, flags))
+        if cell_state not in self.cache:
+            self.cache[cell_state] = Lattice.shared_cell(kind, flags).render(config)
+        return self.cache[cell_state]
+
     # @dispatch
     def insert_cell(self,
                     center: OctoVector = None,
@@ -107,10 +216,11 @@ class OctoGrid:
         if center is None:
             center = OctoVector(x, y, z)
         # print("Inserting a cell at:", center)
+        self._touch((center,))
         if strict:
             center.validate()
         else:
-            self.occ[center] = OctoCell()
+            self.occ[center] = Lattice.shared_cell(Lattice.OCTO)
 
         valid_even_z = (center.x % 4 == 2 and center.y % 4 == 0) \
                        or (center.x % 4 == 0 and center.y % 4 == 2)
@@ -120,37 +230,40 @@ class OctoGrid:
 
         if center.z % 4 == 0 and valid_even_z or center.z % 4 == 2 and valid_odd_z:
             if not tetra_only:
-                self.occ[center] = OctoCell()
+                self.occ[center] = Lattice.shared_cell(Lattice.OCTO)
         elif center.z % 2 == 1 and abs(center.x) % 2 == 1 and abs(center.y) % 2 == 1:
             if not octo_only:
-                self.occ[center] = TetraCell()
+                self.occ[center] = Lattice.shared_cell(Lattice.TETRA)
 
-    # TODO: Move this to an OctoBuilders utility file?
-    def fill(self, radius, center, clear=False):
+    def insert_cells(self, centers, strict=False, octo_only=False, tetra_only=False, flags=None):
+        """insert_cell for a whole (N, 3) array of integer centers at once, optionally giving the
+        cells flags"""
+        centers = Lattice.as_centers(centers)
+        kinds = Lattice.classify(centers, strict, octo_only, tetra_only)
+        keep = kinds != Lattice.NO_CELL
 
-        # print("Radius:", radius)
+        cells = Lattice.shared_cells(kinds[keep], None if flags is None else flags[keep])
+        points = vectors(centers[keep])
+        self._touch(points)
+        self.occ.update(zip(points, cells))
 
-        points = [center + OctoVector(x, y, z)
-                  for x in range(-radius, radius + 1)
-                  for y in range(-radius, radius + 1)
-                  for z in range(-radius, radius + 1)
-                  if abs(x) + abs(y) + abs(z) < radius
-                  ]
+    # TODO: Move this to an OctoBuilders utility file?
+    def fill(self, radius, center, clear=False):
+        points = Lattice.ball(radius, center)
 
-        for point in points:
-            if not clear:
-                self.insert_cell(center=point)
-            else:
+        if not clear:
+            self.insert_cells(points)
+        else:
+            for point in map(OctoVector, *points.T.tolist()):
                 self.occ.pop(point)
+                self._touch((point,))
 
     def crop_bottom(self):
         self.crop(z_min=0)
 
     def split(self, z_split):
         above_grid = OctoGrid()
-        for center in self.occ:
-            if center.z >= z_split:
-                above_grid.insert_cell(center)
+        above_grid.insert_cells(self.box(z_min=z_split))
 
         above_grid.crop(z_min=z_split)
         self.crop(z_max=z_split)
@@ -165,72 +278,115 @@ class OctoGrid:
              z_min=-math.inf,
              z_max=math.inf
              ):
-        to_remove = set()
-        for center, cell in self.occ.items():
-
-            if center.z == z_min:
-                cell.crop_bottom = True
-            if center.z < z_min:
-                to_remove.add(center)
-
-            # tODO: Make this work again
-            if center.z == z_max:
-                cell.crop_top = True
-            if center.z > z_max:
-                to_remove.add(center)
-
-            if center.x == x_min:
-                cell.crop_west = True
-            elif center.x < x_min:
-                to_remove.add(center)
-            #
-            if center.x == x_max:
-                cell.crop_east = True
-            elif center.x > x_max:
-                to_remove.add(center)
-            #
-            if center.y == y_min:
-                cell.crop_south = True
-            elif center.y < y_min:
-                to_remove.add(center)
-            #
-            if center.y == y_max:
-                cell.crop_north = True
-            elif center.y > y_max:
-                to_remove.add(center)
-
-        for center in to_remove:
-            self.occ.pop(center)
+        x, y, z = self.centers.T
 
-        return self
+        self._set_flag("crop_bottom", z == z_min)
+        self._set_flag("crop_top", z == z_max)
+        self._set_flag("crop_west", x == x_min)
+        self._set_flag("crop_east", x == x_max)
+        self._set_flag("crop_south", y == y_min)
+        self._set_flag("crop_north", y == y_max)
 
-    def compute_trimming(self):
-        centers = set(self.occ.keys())
-        for center, cell in self.occ.items():
-            cell.trim(center, centers)
+        self._keep((x >= x_min) & (x <= x_max)
+                   & (y >= y_min) & (y <= y_max)
+                   & (z >= z_min) & (z <= z_max))
 
-    def carve(self, x_min, x_max, y_min, y_max, z_min, z_max):
-        """Removes all cells in a rectangular prism"""
-        to_purge = set()
-        for x, y, z in self.occ:
-            if x_min <= x <= x_max and y_min <= y <= y_max and z_min <= z <= z_max:
-                to_purge.add((x, y, z))
+        return self
+
+    def compute_trimming(self, mode="sparse"):
+        """Sets every cell's trim/weld/clip flags from its neighbours, all cells in one batch.
+        This gives the same result as calling cell.trim(center, occ) on each cell.
+
+        mode picks how neighbours are looked up (see Trimming.trim_flags): "sparse" key lookups,
+        "dense" bit volumes, or "auto".
+        """
+        cells = list(self.occ.values())
+        centers = self.centers
+        kinds = np.fromiter(map(Lattice.kind_of, cells), dtype=np.uint8, count=len(cells))
+
+        flags = Trimming.trim_flags(centers, kinds, mode=mode)
+
+        self.occ = {center: Lattice.with_flags(cell, cell_flags, Lattice.TRIM_MASK)
+                    for center, cell, cell_flags in zip(self.occ, cells, flags.tolist())}
+        self.changed = set()
+
+    def update_trimming(self):
+        """
+        Brings trim flags up to date after cells were inserted or removed since the last trimming
+        pass, retrimming only the cells whose stencils reach one of the changed centers. Before any
+        full pass this just runs compute_trimming.
+
+        Returns the centers whose cells need rendering again: the inserted and cropped cells, and
+        the ones whose trim flags changed. Removed centers aren't included.
+
+        Only changes made through the grid's methods are seen, not direct edits of occ.
+        """
+        if self.changed is None:
+            self.compute_trimming()
+            return set(self.occ)
+
+        touched, self.changed = self.changed, set()
+        if not touched:
+            return set()
+
+        # Past a point, looking up every neighbour costs more than retrimming the whole grid
+        if len(touched) * len(Trimming.NEIGHBOUR_OFFSETS) < len(self.occ):
+            touched_centers = np.array(list(map(tuple, touched)), dtype=np.int64)
+            nearby = self._occupied(np.concatenate(
+                (touched_centers, Trimming.neighbours(touched_centers, direction=-1))))
+            nearby = Lattice.unpack(np.unique(Lattice.pack(nearby)))
+            centers = list(map(OctoVector, *nearby.T.tolist()))
+            # Occupancy only matters where the retrimmed cells' stencils reach
+            occupied = np.unique(Lattice.pack(self._occupied(Trimming.neighbours(nearby))))
+        else:
+            nearby, centers, occupied = self.centers, list(self.occ), None
 
-        for tup in to_purge:
-            self.occ[tup].is_solid = True
+        cells = [self.occ[c] for c in centers]
+        kinds = np.fromiter(map(Lattice.kind_of, cells), dtype=np.uint8, count=len(cells))
+        flags = Trimming.trim_flags(nearby, kinds, occupied=occupied)
 
-    def full_symmetry(self, center=None):
-        to_add = dict()
+        updated = touched.intersection(self.occ)
+        for center, cell, cell_flags in zip(centers, cells, flags.tolist()):
+            if Lattice.flags_of(cell) & Lattice.TRIM_MASK != cell_flags:
+                self.occ[center] = Lattice.with_flags(cell, cell_flags, Lattice.TRIM_MASK)
+                updated.add(center)
+        return updated
 
-        for center, cell in self.occ.items():
-            x, y, z = center
-            to_add[(y, x, z)] = copy(cell)
-            to_add[(-x, y, z)] = copy(cell)
-            to_add[(y, -x, z)] = copy(cell)
+    def _occupied(self, points) -> np.ndarray:
+        """The rows of an (N, 3) point array that hold cells"""
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 3)
+        mask = [OctoVector(x, y, z) in self.occ for x, y, z in points.tolist()]
+        return points[np.array(mask, dtype=bool)]
 
-        self.occ = {**self.occ, **to_add}
+    def carve(self, x_min, x_max, y_min, y_max, z_min, z_max):
+        """Removes all cells in a rectangular prism"""
+        inside = self.box(x_min, x_max, y_min, y_max, z_min, z_max)
+        inside = list(map(OctoVector, *inside.T.tolist()))
+        for center in inside:
+            del self.occ[center]
+        self._touch(inside)
+
+    def _symmetrize(self, stages, copies=False):
+        """
+        Applies Symmetry stages to the grid. Images are empty cells, or have the state of the
+        cells they came from if copies is set.
+        """
+        centers, rows, moved = Symmetry.apply(self.centers, stages)
+        kinds = Lattice.classify(centers)
+        cells = list(self.occ.values())
+
+        self.occ = {
+            OctoVector(x, y, z): (cells[row] if not is_moved or copies
+                                  else Lattice.shared_cell(kind))
+            for (x, y, z), row, is_moved, kind
+            in zip(centers.tolist(), rows.tolist(), moved.tolist(), kinds.tolist())
+        }
+        self._touch(compress(self.occ, moved.tolist()))
         return self
 
+    def full_symmetry(self, center=None):
+        return self._symmetrize([(Symmetry.FULL_SYMMETRY, Symmetry.ORIGIN)], copies=True)
+
     def reflect_x(self):
         self.reflect(x=-1)
 
@@ -241,49 +397,13 @@ class OctoGrid:
         self.reflect(z=-1)
 
     def reflect(self, x=1, y=1, z=1, center_of_reflection=OctoVector()):
-        rv = OctoVector(x, y, z)
-        new_grid = OctoGrid()
-        for center in self.occ:
-            new_center = (center - center_of_reflection) * rv + center_of_reflection
-
-            print(center, center - center_of_reflection, (center - center_of_reflection) * rv,
-                  (center - center_of_reflection) * rv + center_of_reflection, new_center)
-
-            new_grid.insert_cell(new_center)
-
-        self.merge(new_grid)
+        self._symmetrize([(Symmetry.reflection(x, y, z), tuple(center_of_reflection))])
 
     def four_way(self, center_of_rotation=OctoVector()):
-        new_grid = OctoGrid()
-        for center in self.occ:
-            x, y, z = astuple(center - center_of_rotation)
-            new_grid.insert_cell(OctoVector(y, x, z) + center_of_rotation)
-
-        self.merge(new_grid)
-        self.reflect_x()
-        self.reflect_y()
-
-        return self
+        return self._symmetrize(Symmetry.four_way(tuple(center_of_rotation)))
 
     def six_way(self, center_of_rotation=OctoVector()):
-        new_grid = OctoGrid()
-        for center, cell in self.occ.items():
-            x, y, z = (center - center_of_rotation).as_tuple()
-            new_grid.insert_cell(OctoVector(x, z, y) + center_of_rotation)
-            new_grid.insert_cell(OctoVector(z, y, x) + center_of_rotation)
-            new_grid.insert_cell(OctoVector(x, y, -z) + center_of_rotation)
-            # to_add[(x, z, y)] = copy(cell)
-            # to_add[(z, y, x)] = copy(cell)
-
-            # TODO: Can we do this in one step, rather than using four_way?
-            # to_add[(y, z, x)] = copy(cell)
-            # to_add[(z, x, y)] = copy(cell)
-            # to_add[(z, y, x)] = copy(cell)
-            # to_add[(y, x, z)] = cell
-
-        self.merge(new_grid)
-
-        return self.four_way(center_of_rotation)
+        return self._symmetrize(Symmetry.six_way(tuple(center_of_rotation)))
 
     def __repr__(self):
         return f"OctoGrid({self.name})({str(list(self.occ.keys()))})"
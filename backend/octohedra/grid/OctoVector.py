@@ -1,6 +1,7 @@
 import math
 import numbers
-from dataclasses import astuple, dataclass
+from functools import partial
+from operator import itemgetter
 
 import numpy as np
 
@@ -16,11 +17,24 @@ def validate(i):
         return int_i
 
 
-@dataclass(frozen=True)
-class OctoVector:
-    x: numbers.Integral = 0
-    y: numbers.Integral = 0
-    z: numbers.Integral = 0
+class OctoVector(tuple):
+    """
+    An (x, y, z) grid coordinate.
+
+    A tuple underneath, so hashing, equality, iteration and indexing are the tuple's own C
+    implementations. Builders and trimming do little else with vectors in their inner loops.
+    """
+    __slots__ = ()
+
+    def __new__(cls, x=0, y=0, z=0):
+        return tuple.__new__(cls, (x, y, z))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    x = property(itemgetter(0))
+    y = property(itemgetter(1))
+    z = property(itemgetter(2))
 
     def validate(self):
         for coordinate in self:
@@ -29,92 +43,78 @@ class OctoVector:
 
     def distance(self, other):
         return (self - other).norm()
-        # return math.sqrt(delta.x ** 2 + delta.y ** 2 + delta.z ** 2)
 
     def norm(self):
-        return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
+        x, y, z = self
+        return math.sqrt(x ** 2 + y ** 2 + z ** 2)
 
     def __repr__(self):
-        return f"OctoVector({float(self.x):g}, {float(self.y):g}, {float(self.z):g})"
+        return f"OctoVector({float(self[0]):g}, {float(self[1]):g}, {float(self[2]):g})"
 
     def __str__(self):
-        return f"({float(self.x):g}, {float(self.y):g}, {float(self.z):g})"
+        return f"({float(self[0]):g}, {float(self[1]):g}, {float(self[2]):g})"
 
     def __add__(self, other):
-        if isinstance(other, OctoVector):
-            return OctoVector(self.x + other.x, self.y + other.y, self.z + other.z)
-        elif hasattr(other, '__len__') and len(other) == 3:
-            return OctoVector(self.x + other[0], self.y + other[1], self.z + other[2])
-        else:
+        x, y, z = self
+        try:
+            ox, oy, oz = other
+        except (TypeError, ValueError):
             raise TypeError(f"Tried to add {other} to an OctoVector but I don't know how.")
+        return tuple.__new__(OctoVector, (x + ox, y + oy, z + oz))
 
     __radd__ = __add__
 
     def __sub__(self, other):
-        if isinstance(other, OctoVector):
-            return OctoVector(self.x - other.x, self.y - other.y, self.z - other.z)
-        elif hasattr(other, '__len__') and len(other) == 3:
-            return OctoVector(self.x - other[0], self.y - other[1], self.z - other[2])
-        else:
+        x, y, z = self
+        try:
+            ox, oy, oz = other
+        except (TypeError, ValueError):
             raise TypeError(f"Tried to subtract {other} from an OctoVector, but I don't know "
                             f"how.")
+        return tuple.__new__(OctoVector, (x - ox, y - oy, z - oz))
 
     def __rsub__(self, other):
-        if isinstance(other, OctoVector):
-            return OctoVector(self.x - other.x, self.y - other.y, self.z - other.z)
-        elif hasattr(other, '__len__') and len(other) == 3:
-            return OctoVector(self.x - other[0], self.y - other[1], self.z - other[2])
-        else:
-            raise AttributeError(f"Tried to subtract {other} from an OctoVector, but I don't know "
-                                 f"how.")
+        x, y, z = self
+        try:
+            ox, oy, oz = other
+        except (TypeError, ValueError):
+            raise TypeError(f"Tried to subtract an OctoVector from {other}, but I don't know "
+                            f"how.")
+        return tuple.__new__(OctoVector, (ox - x, oy - y, oz - z))
 
     def __neg__(self):
-        return OctoVector(-self.x, -self.y, -self.z)
+        x, y, z = self
+        return tuple.__new__(OctoVector, (-x, -y, -z))
 
     def __mul__(self, other):
-        if isinstance(other, OctoVector):
-            return OctoVector(self.x * other.x, self.y * other.y, self.z * other.z)
-        elif hasattr(other, '__len__') and len(other) == 3:
-            return OctoVector(self.x * other[0], self.y * other[1], self.z * other[2])
-        elif isinstance(other, numbers.Number):
-            return OctoVector(self.x * other, self.y * other, self.z * other)
-        # elif isinstance(other, numbers.Number):
-        #     raise ValueError("OctoVector coordinates may only be integers.")
-        else:
+        x, y, z = self
+        if type(other) is int or isinstance(other, numbers.Number):
+            return tuple.__new__(OctoVector, (x * other, y * other, z * other))
+        try:
+            ox, oy, oz = other
+        except (TypeError, ValueError):
             raise TypeError(f"Tried to multiply an OctoVector by {other} but I don't know how.")
+        return tuple.__new__(OctoVector, (x * ox, y * oy, z * oz))
 
     __rmul__ = __mul__
 
     def as_np(self):
-        return np.array((self.x, self.y, self.z))
+        return np.array(self)
 
     def as_tuple(self):
-        return astuple(self)
-
-    def __iter__(self):
-        return self.as_tuple().__iter__()
+        return tuple(self)
 
-    def __getitem__(self, item):
-        return self.as_tuple()[item]
 
-    def __len__(self):
-        return len(self.as_tuple())
+def vectors(centers) -> list:
+    """An OctoVector for each row of an (N, 3) integer array"""
+    return list(map(partial(tuple.__new__, OctoVector), map(tuple, centers.tolist())))
 
 
 if __name__ == "__main__":
-    vec = OctoVector(1, 2, 3)
-    vec2 = OctoVector(-1, 2, 3)
-    print(vec * 5)
-    print(vec)
-    # print(vec + vec2)
-
-    print(OctoVector(x=100, y=0, z=0) + OctoVector(0, 0, 0))
-
-    x, y, z, = vec
-    print(x, y, z)
-    print(vec[2])
+    # Times FlakeBuilder(5), whose inner loops are mostly vector arithmetic and dict lookups
+    import timeit
 
-    d = dict()
-    d[vec2] = False
+    from octohedra.builders.FlakeBuilder import FlakeBuilder
 
-    print(vec)
+    runs = timeit.repeat(lambda: FlakeBuilder(5).materialize(), number=1, repeat=7)
+    print(f"FlakeBuilder(5).materialize(): best of 7 {min(runs) * 1000:.1f} ms")
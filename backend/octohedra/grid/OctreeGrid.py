@@ -0,0 +1,459 @@
+"""
+A hash-consed sparse octree (a sparse voxel DAG) over the lattice.
+
+Every node is interned in a NodeStore, so identical sub-volumes are stored once no matter how
+many times they occur. Flakes are six translated copies of the next smaller flake, which makes
+them almost entirely made of repeated sub-volumes: a depth-8 flake has 6^8 cells but only a few
+thousand unique nodes.
+
+Nodes are cubes of side 2^level. A node is either EMPTY, a leaf (level 0, one cell, identified
+by its kind and flags), or a tuple of eight child node ids. Child i covers the octant whose x, y
+and z halves are given by bits 0, 1 and 2 of i. Cubes are aligned to multiples of their size in a
+frame shifted by BIAS, which keeps the origin well away from the boundaries of large cubes, so a
+shape centered on the origin fits in a cube not much bigger than itself.
+"""
+from collections.abc import Mapping
+
+import numpy as np
+
+from octohedra.grid import Lattice
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.utils.OctoUtil import DOWN, UP, E, N, S, W, p2
+
+EMPTY = 0
+BIAS = (1 << 21) // 3  # 0b1010...10: every cube boundary is at least a third of a cube away
+
+
+def _bits(i):
+    return i & 1, (i >> 1) & 1, (i >> 2) & 1
+
+
+OCTANTS = [_bits(i) for i in range(8)]
+
+FLAKE_DIRECTIONS = [tuple(int(c) for c in direction) for direction in (E, N, W, S, UP, DOWN)]
+
+# (axis, flag raised when a cell sits on the lower bound, flag for the upper bound)
+CROP_PLANES = ((0, "crop_west", "crop_east"),
+               (1, "crop_south", "crop_north"),
+               (2, "crop_bottom", "crop_top"))
+
+
+class NodeStore:
+    """
+    Interning table shared by every OctreeGrid built from it. Nodes never change once created,
+    so cell counts, unions and shifts are memoized here for as long as the store lives. Grids
+    get a store of their own unless given one, and grids made from them share it, so a build's
+    nodes go away with its grids.
+    """
+
+    def __init__(self):
+        self.nodes = [None]
+        self.counts = [0]
+        self.index = dict()
+        self.unions = dict()
+        self.shifts = dict()
+        self.templates = dict()
+
+    def __len__(self):
+        return len(self.nodes) - 1
+
+    def intern(self, key):
+        """Id of the node with the given key: a tuple of 8 child ids, or a leaf state int"""
+        if isinstance(key, tuple) and not any(key):
+            return EMPTY
+
+        node = self.index.get(key)
+        if node is None:
+            node = len(self.nodes)
+            self.nodes.append(key)
+            self.counts.append(1 if isinstance(key, int) else sum(self.counts[c] for c in key))
+            self.index[key] = node
+        return node
+
+    def leaf(self, kind, flags=0):
+        return self.intern((int(kind) << 16) | int(flags))
+
+    def is_leaf(self, node):
+        return isinstance(self.nodes[node], int)
+
+    def union(self, a, b):
+        """Union of two nodes of the same level. Where both have a cell, b's cell wins."""
+        if a == EMPTY or a == b:
+            return b
+        if b == EMPTY:
+            return a
+
+        key = (a, b)
+        if key not in self.unions:
+            if self.is_leaf(b):
+                self.unions[key] = b
+            else:
+                self.unions[key] = self.intern(tuple(self.union(x, y) for x, y in
+                                                     zip(self.nodes[a], self.nodes[b])))
+        return self.unions[key]
+
+    def shift(self, node, level, r):
+        """
+        Moves the contents of a node by r (each component in [0, 2^level)) relative to its corner.
+        The result spills into the 2x2x2 block of same-level cubes starting at the original one,
+        and is returned as those 8 nodes, indexed like children.
+        """
+        if node == EMPTY or not any(r):
+            return (node,) + (EMPTY,) * 7
+
+        key = (node, r)
+        if key not in self.shifts:
+            half = 1 << (level - 1)
+            slots = dict()
+            for octant, child in zip(OCTANTS, self.nodes[node]):
+                if child == EMPTY:
+                    continue
+                moved = [o * half + d for o, d in zip(octant, r)]
+                quotient = [m // half for m in moved]
+                pieces = self.shift(child, level - 1, tuple(m % half for m in moved))
+                for piece_octant, piece in zip(OCTANTS, pieces):
+                    if piece != EMPTY:
+                        slot = tuple(q + p for q, p in zip(quotient, piece_octant))
+                        slots[slot] = self.union(slots.get(slot, EMPTY), piece)
+
+            self.shifts[key] = tuple(
+                self.intern(tuple(slots.get((2 * dx + cx, 2 * dy + cy, 2 * dz + cz), EMPTY)
+                                  for cx, cy, cz in OCTANTS))
+                for dx, dy, dz in OCTANTS)
+        return self.shifts[key]
+
+
+class OctreeView(Mapping):
+    """Read-only, dict-like view of an OctreeGrid's cells, keyed by OctoVector"""
+
+    def __init__(self, grid):
+        self.grid = grid
+
+    def __len__(self):
+        return len(self.grid)
+
+    def __iter__(self):
+        for center, _ in self.grid.cells():
+            yield OctoVector(*center)
+
+    def __getitem__(self, center):
+        state = self.grid.state_at(center)
+        if state is None:
+            raise KeyError(center)
+        return Lattice.shared_cell(state >> 16, state & 0xFFFF)
+
+
+class OctreeGrid:
+    """
+    An OctoGrid-like container that stores its cells in a hash-consed sparse octree.
+
+    Supports union (merge), crop, translation, cell counting and iteration. Counting is O(1) since
+    every node knows its count. Trimming and rendering go through to_columnar().
+    """
+
+    def __init__(self, name="Body", store=None):
+        self.name = name
+        self.store = NodeStore() if store is None else store
+        self.root = EMPTY
+        self.level = 0
+        self.corner = (0, 0, 0)  # In the BIAS-shifted frame
+
+    def _empty_like(self):
+        return OctreeGrid(self.name, self.store)
+
+    # Construction
+
+    @classmethod
+    def from_arrays(cls, centers, kinds, flags=None, name="Body", store=None):
+        """Builds a grid bottom-up from arrays of cells. Later rows win over earlier duplicates."""
+        grid = cls(name, store)
+        centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+        if len(centers) == 0:
+            return grid
+
+        flags = np.zeros(len(centers), dtype=np.int64) if flags is None else flags
+        nodes = {}
+        for center, kind, flag in zip((centers + BIAS).tolist(), np.asarray(kinds).tolist(),
+                                      np.asarray(flags).tolist()):
+            nodes[tuple(center)] = grid.store.leaf(kind, flag)
+
+        level = 0
+        while len(nodes) > 1:
+            parents = dict()
+            for (x, y, z), node in nodes.items():
+                children = parents.setdefault((x >> 1, y >> 1, z >> 1), [EMPTY] * 8)
+                children[(x & 1) | (y & 1) << 1 | (z & 1) << 2] = node
+            nodes = {corner: grid.store.intern(tuple(children))
+                     for corner, children in parents.items()}
+            level += 1
+
+        (corner, node), = nodes.items()
+        grid._place(node, level, tuple(c << level for c in corner))
+        return grid
+
+    @classmethod
+    def from_grid(cls, grid, name=None, store=None):
+        """Copies an OctoGrid or ColumnarGrid into a new OctreeGrid"""
+        cells = grid.occ.items()
+        centers = [(center.x, center.y, center.z) for center, _ in cells]
+        kinds = [Lattice.kind_of(cell) for _, cell in cells]
+        flags = [Lattice.flags_of(cell) for _, cell in cells]
+        return cls.from_arrays(centers, kinds, flags, grid.name if name is None else name, store)
+
+    @classmethod
+    def flake(cls, iteration, center=OctoVector(), scale=0, store=None):
+        """
+        The same cells as FlakeBuilder(iteration, center, scale).materialize(), built as six
+        translated copies of the next smaller flake at each level instead of cell by cell.
+        """
+        store = NodeStore() if store is None else store
+        parity = tuple(c % 2 for c in center)
+        template = cls._flake_template(iteration, scale, parity, store)
+        return template.translate(tuple(c - p for c, p in zip(center, parity)))
+
+    @classmethod
+    def _flake_template(cls, i, scale, parity, store):
+        """A flake centered on the given parity corner. Cell kinds only depend on coordinate
+        parity, so moving it by an even offset gives a correct flake anywhere else.
+        """
+        key = (i, scale, parity)
+        if key not in store.templates:
+            if i == 0:
+                template = cls(store=store)
+                template.insert_cell(OctoVector(*parity))
+            elif i <= scale:
+                template = cls(store=store)
+                template.fill(p2(i + 1), OctoVector(*parity))
+            else:
+                smaller = cls._flake_template(i - 1, scale, parity, store)
+                template = cls(store=store)
+                for direction in FLAKE_DIRECTIONS:
+                    template.merge(smaller.translate(tuple(p2(i) * d for d in direction)))
+            store.templates[key] = template
+        return store.templates[key]
+
+    # Tree surgery
+
+    def _contains_cube(self, corner, level):
+        return self.level >= level and all(c >> self.level == s >> self.level
+                                           for c, s in zip(corner, self.corner))
+
+    def _cover(self, corner, level):
+        """Grows the root until it contains the aligned cube of the given level at corner"""
+        if self.root == EMPTY:
+            self.corner, self.level = corner, level
+            return
+
+        while not self._contains_cube(corner, level):
+            parent_level = self.level + 1
+            parent_corner = tuple(s >> parent_level << parent_level for s in self.corner)
+            octant = [(s - p) >> self.level for s, p in zip(self.corner, parent_corner)]
+            children = [EMPTY] * 8
+            children[octant[0] | octant[1] << 1 | octant[2] << 2] = self.root
+            self.root = self.store.intern(tuple(children))
+            self.corner, self.level = parent_corner, parent_level
+
+    def _place(self, piece, level, corner):
+        """Unions a node into the aligned cube of the given level at corner"""
+        if piece == EMPTY:
+            return
+        self._cover(corner, level)
+        self.root = self._place_below(self.root, self.level, self.corner, piece, level, corner)
+
+    def _place_below(self, node, node_level, node_corner, piece, level, corner):
+        if node_level == level:
+            return self.store.union(node, piece)
+
+        child_level = node_level - 1
+        octant = [(c - n) >> child_level & 1 for c, n in zip(corner, node_corner)]
+        slot = octant[0] | octant[1] << 1 | octant[2] << 2
+        child_corner = tuple(n + (o << child_level) for n, o in zip(node_corner, octant))
+
+        children = list(self.store.nodes[node]) if node != EMPTY else [EMPTY] * 8
+        children[slot] = self._place_below(children[slot], child_level, child_corner,
+                                           piece, level, corner)
+        return self.store.intern(tuple(children))
+
+    # OctoGrid API
+
+    def __len__(self):
+        return self.store.counts[self.root]
+
+    @property
+    def occ(self):
+        return OctreeView(self)
+
+    def insert_cell(self,
+                    center: OctoVector = None,
+                    x=0,
+                    y=0,
+                    z=0,
+                    strict=False,
+                    octo_only=False,
+                    tetra_only=False):
+
+        if center is None:
+            center = OctoVector(x, y, z)
+        if strict:
+            center.validate()
+
+        kind = Lattice.cell_kind(center.x, center.y, center.z, strict, octo_only, tetra_only)
+        if kind != Lattice.NO_CELL:
+            corner = (center.x + BIAS, center.y + BIAS, center.z + BIAS)
+            self._place(self.store.leaf(kind), 0, corner)
+
+    def insert_cells(self, centers, strict=False, octo_only=False, tetra_only=False):
+        """insert_cell for a whole (N, 3) array of integer centers at once"""
+        centers = Lattice.as_centers(centers)
+        kinds = Lattice.classify(centers, strict, octo_only, tetra_only)
+        keep = kinds != Lattice.NO_CELL
+        self.merge(OctreeGrid.from_arrays(centers[keep], kinds[keep], store=self.store))
+
+    def fill(self, radius, center):
+        self.insert_cells(Lattice.ball(radius, center))
+
+    def merge(self, other):
+        if not isinstance(other, OctreeGrid) or other.store is not self.store:
+            other = OctreeGrid.from_grid(other, store=self.store)
+        self._place(other.root, other.level, other.corner)
+        return self
+
+    def __add__(self, other):
+        return self.merge(other)
+
+    def translate(self, offset):
+        """A new grid holding this grid's cells moved by offset. Cell kinds move with the cells,
+        so offsets should be even to stay consistent with insert_cell.
+        """
+        moved = self._empty_like()
+        if self.root == EMPTY:
+            return moved
+
+        size = 1 << self.level
+        target = [c + o for c, o in zip(self.corner, offset)]
+        base = [t >> self.level << self.level for t in target]
+        pieces = self.store.shift(self.root, self.level, tuple(t - b for t, b in zip(target, base)))
+        for octant, piece in zip(OCTANTS, pieces):
+            moved._place(piece, self.level, tuple(b + o * size for b, o in zip(base, octant)))
+        return moved
+
+    def crop(self,
+             x_min=-np.inf,
+             x_max=np.inf,
+             y_min=-np.inf,
+             y_max=np.inf,
+             z_min=-np.inf,
+             z_max=np.inf
+             ):
+        """Same as OctoGrid.crop: drops cells outside the box and flags cells on its faces"""
+        if self.root != EMPTY:
+            lower = [bound + BIAS for bound in (x_min, y_min, z_min)]
+            upper = [bound + BIAS for bound in (x_max, y_max, z_max)]
+            self.root = self._crop(self.root, self.level, self.corner, lower, upper, dict())
+        return self
+
+    def _crop(self, node, level, corner, lower, upper, memo):
+        size = 1 << level
+        # Bounds relative to this cube. Anything beyond the cube acts the same, so clamp them
+        # to improve memo hits.
+        lo = tuple(int(max(-1, min(size, b - c))) for b, c in zip(lower, corner))
+        hi = tuple(int(max(-1, min(size, b - c))) for b, c in zip(upper, corner))
+
+        if any(h < 0 or l > size - 1 for l, h in zip(lo, hi)):
+            return EMPTY
+        if all(l < 0 and h > size - 1 for l, h in zip(lo, hi)):
+            return node
+
+        key = (node, lo, hi)
+        if key not in memo:
+            if self.store.is_leaf(node):
+                state = self.store.nodes[node]
+                for axis, lower_flag, upper_flag in CROP_PLANES:
+                    if lo[axis] == 0:
+                        state |= Lattice.FLAGS[lower_flag]
+                    if hi[axis] == 0:
+                        state |= Lattice.FLAGS[upper_flag]
+                memo[key] = self.store.intern(state)
+            else:
+                half = size >> 1
+                memo[key] = self.store.intern(tuple(
+                    self._crop(child, level - 1,
+                               tuple(c + o * half for c, o in zip(corner, octant)),
+                               lower, upper, memo)
+                    if child != EMPTY else EMPTY
+                    for octant, child in zip(OCTANTS, self.store.nodes[node])))
+        return memo[key]
+
+    def crop_bottom(self):
+        self.crop(z_min=0)
+
+    # Iteration
+
+    def cells(self):
+        """Yields ((x, y, z), state) for every cell, where state is kind << 16 | flags"""
+        if self.root == EMPTY:
+            return
+        stack = [(self.root, self.level, self.corner)]
+        nodes = self.store.nodes
+        while stack:
+            node, level, corner = stack.pop()
+            key = nodes[node]
+            if isinstance(key, int):
+                yield tuple(c - BIAS for c in corner), key
+                continue
+            half = 1 << (level - 1)
+            for octant, child in zip(OCTANTS, key):
+                if child != EMPTY:
+                    stack.append((child, level - 1,
+                                  tuple(c + o * half for c, o in zip(corner, octant))))
+
+    @property
+    def centers(self) -> np.ndarray:
+        return self.to_arrays()[0]
+
+    def contains(self, points) -> np.ndarray:
+        """Whether each row of an (N, 3) point array holds a cell"""
+        return Lattice.contains(Lattice.sorted_keys(self.centers), Lattice.pack(points))
+
+    def to_arrays(self):
+        """(centers, kinds, flags) arrays of every cell"""
+        cells = list(self.cells())
+        centers = np.array([center for center, _ in cells], dtype=np.int64).reshape(-1, 3)
+        states = np.array([state for _, state in cells], dtype=np.int64)
+        return centers, (states >> 16).astype(np.uint8), (states & 0xFFFF).astype(np.uint16)
+
+    def to_columnar(self):
+        from octohedra.grid.ColumnarGrid import ColumnarGrid
+        return ColumnarGrid.from_arrays(*self.to_arrays(), name=self.name)
+
+    def state_at(self, center):
+        """kind << 16 | flags of the cell at center, or None"""
+        point = [c + BIAS for c in center]
+        if self.root == EMPTY or not self._contains_cube(point, 0):
+            return None
+
+        node, level = self.root, self.level
+        while not self.store.is_leaf(node):
+            level -= 1
+            octant = [p >> level & 1 for p in point]
+            node = self.store.nodes[node][octant[0] | octant[1] << 1 | octant[2] << 2]
+            if node == EMPTY:
+                return None
+        return self.store.nodes[node]
+
+    @property
+    def unique_nodes(self):
+        """How many distinct nodes make up this grid"""
+        seen = {EMPTY}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            if not self.store.is_leaf(node):
+                stack.extend(self.store.nodes[node])
+        return len(seen) - 1
+
+    def __repr__(self):
+        return f"OctreeGrid({self.name})({len(self)} cells, level {self.level})"
@@ -0,0 +1,97 @@
+"""
+Range, radius and nearest-cell queries over a set of grid centers.
+
+Packed keys sort by z, then y, then x, so in the sorted key array every (z, y) row of the lattice
+is one contiguous run. A box query is a pair of binary searches per row it crosses, and an L1
+ball is a box query whose x extent shrinks with the row's distance from the center. Queries cost
+O(rows * log n + result) instead of a scan over every cell.
+"""
+import numpy as np
+
+from octohedra.grid import Lattice
+
+
+class SpatialIndex:
+    """Sorted packed keys of a fixed set of centers, with the queries grids need"""
+
+    def __init__(self, keys):
+        """keys: sorted, de-duplicated packed keys (see Lattice.sorted_keys)"""
+        self.keys = keys
+        self.centers = Lattice.unpack(keys)
+        if len(self.keys):
+            self.low, self.high = self.centers.min(axis=0), self.centers.max(axis=0)
+        else:
+            self.low, self.high = np.zeros(3, dtype=np.int64), np.full(3, -1, dtype=np.int64)
+
+    @classmethod
+    def from_centers(cls, centers):
+        return cls(Lattice.sorted_keys(centers))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def contains(self, points) -> np.ndarray:
+        """Whether each row of an (N, 3) point array is one of the centers"""
+        return Lattice.contains(self.keys, Lattice.pack(points))
+
+    def box(self, low, high) -> np.ndarray:
+        """The centers with low <= center <= high on every axis, in key order. Bounds may be
+        infinite."""
+        low = np.clip(np.ceil(np.asarray(low, dtype=float)), self.low, self.high + 1)
+        high = np.clip(np.floor(np.asarray(high, dtype=float)), self.low - 1, self.high)
+        low, high = low.astype(np.int64), high.astype(np.int64)
+        if (low > high).any():
+            return np.empty((0, 3), dtype=np.int64)
+
+        # Crossing more rows than there are cells, a scan is cheaper than the searches
+        if (high[1] - low[1] + 1) * (high[2] - low[2] + 1) > len(self):
+            return self.centers[((self.centers >= low) & (self.centers <= high)).all(axis=1)]
+
+        y, z = np.meshgrid(np.arange(low[1], high[1] + 1), np.arange(low[2], high[2] + 1))
+        x_low = np.full(y.size, low[0])
+        x_high = np.full(y.size, high[0])
+        return self._rows(x_low, x_high, y.reshape(-1), z.reshape(-1))
+
+    def within(self, center, radius) -> np.ndarray:
+        """The centers at most radius from center in L1 distance, in key order"""
+        cx, cy, cz = (int(c) for c in tuple(center))
+        if (2 * radius + 1) ** 2 > len(self):
+            return self.centers[np.abs(self.centers - (cx, cy, cz)).sum(axis=1) <= radius]
+
+        dy, dz = np.meshgrid(np.arange(-radius, radius + 1), np.arange(-radius, radius + 1))
+        dy, dz = dy.reshape(-1), dz.reshape(-1)
+        reach = radius - np.abs(dy) - np.abs(dz)
+        rows = reach >= 0
+        return self._rows(cx - reach[rows], cx + reach[rows], cy + dy[rows], cz + dz[rows])
+
+    def nearest(self, point, k=1) -> np.ndarray:
+        """The k centers closest to point in L1 distance, nearest first (ties in key order)"""
+        if len(self) == 0 or k <= 0:
+            return np.empty((0, 3), dtype=np.int64)
+        point = np.asarray(tuple(point), dtype=np.int64)
+        farthest = int(np.maximum(np.abs(self.low - point), np.abs(self.high - point)).sum())
+
+        radius = 1
+        while True:
+            found = self.within(point, min(radius, farthest))
+            if len(found) >= k or radius >= farthest:
+                distances = np.abs(found - point).sum(axis=1)
+                return found[np.argsort(distances, kind="stable")[:k]]
+            radius *= 2
+
+    def _rows(self, x_low, x_high, y, z) -> np.ndarray:
+        """The centers in the x ranges of the given (y, z) rows"""
+        inside = ((y >= self.low[1]) & (y <= self.high[1])
+                  & (z >= self.low[2]) & (z <= self.high[2]))
+        x_low = np.maximum(x_low[inside], self.low[0])
+        x_high = np.minimum(x_high[inside], self.high[0])
+        y, z = y[inside], z[inside]
+        if len(y) == 0:
+            return np.empty((0, 3), dtype=np.int64)
+
+        starts = np.searchsorted(self.keys, Lattice.pack(np.stack((x_low, y, z), axis=1)))
+        stops = np.searchsorted(self.keys, Lattice.pack(np.stack((x_high, y, z), axis=1)),
+                                side="right")
+        counts = np.maximum(stops - starts, 0)
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return self.centers[offsets + np.arange(counts.sum())]
@@ -0,0 +1,157 @@
+"""
+Builds grid meshes by stamping pre-rendered cells.
+
+Cells with the same kind and flags render to the same mesh, so each distinct state is rendered
+once and its vertices are tiled out to every center with that state.
+
+stamp_symmetric goes further for grids with symmetry: it trims and stamps one cell per orbit of the
+grid's symmetry group, then produces the rest of the mesh by applying the group's operations to
+that piece.
+"""
+import numpy as np
+import trimesh
+
+from octohedra.grid import Lattice, Symmetry, Trimming
+
+
+def cell_states(kinds, flags) -> np.ndarray:
+    """kind << 16 | flags for each cell, keeping only the flags its kind has"""
+    kinds = np.asarray(kinds).astype(np.uint32)
+    flags = np.asarray(flags).astype(np.uint32)
+    for kind, kind_mask in Lattice.KIND_MASKS.items():
+        flags[kinds == kind] &= kind_mask
+    return (kinds << 16) | flags
+
+
+def stamp(centers, kinds, flags, render_state, config):
+    """
+    Tiles render_state(kind, flags, config) out to every cell.
+
+    Returns (vertices, faces, face_rows), where face_rows is the cell each face belongs to.
+    """
+    states, inverse = np.unique(cell_states(kinds, flags), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    rows_by_state = np.split(np.argsort(inverse, kind="stable"),
+                             np.cumsum(np.bincount(inverse))[:-1])
+    offsets = np.asarray(centers) * (config.cell_size / 4)
+
+    vertices, faces, face_rows = [], [], []
+    vertex_count = 0
+    for state, rows in zip(states.tolist(), rows_by_state):
+        template = render_state(state >> 16, state & 0xFFFF, config)
+        n_vertices = len(template.vertices)
+
+        vertices.append((template.vertices[None] + offsets[rows][:, None]).reshape(-1, 3))
+        bases = vertex_count + n_vertices * np.arange(len(rows))
+        faces.append((template.faces[None] + bases[:, None, None]).reshape(-1, 3))
+        face_rows.append(np.repeat(rows, len(template.faces)))
+        vertex_count += n_vertices * len(rows)
+
+    return np.concatenate(vertices), np.concatenate(faces), np.concatenate(face_rows)
+
+
+def stamp_symmetric(centers, kinds, flags, render_state, config, ops=Symmetry.OCTAHEDRAL,
+                    exact=False):
+    """
+    Same cells as trimming the grid and stamping every cell, but only the cells of a fundamental
+    domain are trimmed and stamped. The rest of the mesh is the domain's mesh under each
+    operation.
+
+    The group used is the part of ops that leaves the grid, its crop flags and the rendered cells
+    unchanged. A cell only counts as unchanged if an operation reproduces its rendered vertices.
+    Mirrored cells can still split their quads along the other diagonal, unless exact is set,
+    which also requires the same triangles.
+
+    flags only needs the crop flags; trim flags are computed here.
+    """
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+    kinds = np.asarray(kinds, dtype=np.uint8)
+    crops = np.asarray(flags, dtype=np.uint16) & Lattice.CROP_MASK
+    occupied = np.unique(Lattice.pack(centers))
+
+    ops = Symmetry.invariant_ops(centers, kinds, crops, ops)
+    while True:
+        reps, canonical = Symmetry.fundamental_domain(centers, ops)
+        rep_flags = crops[reps] | Trimming.trim_flags(centers[reps], kinds[reps],
+                                                      occupied=occupied)
+        failing = _failing_ops(centers[reps], kinds[reps], rep_flags, ops, render_state, config,
+                               exact)
+        if not failing:
+            break
+        ops = np.stack([op for i, op in enumerate(ops) if i not in failing])
+        if len(Symmetry.generate(*ops)) != len(ops):
+            ops = Symmetry.IDENTITY[None]
+
+    vertices, faces, face_rows = stamp(centers[reps], kinds[reps], rep_flags, render_state, config)
+
+    pieces_vertices, pieces_faces = [], []
+    vertex_count = 0
+    for op, rows in zip(ops, canonical):
+        piece_faces = faces[rows[face_rows]]
+        used = np.zeros(len(vertices), dtype=bool)
+        used[piece_faces] = True
+        piece_faces = (np.cumsum(used) - 1)[piece_faces]
+        if np.linalg.det(op) < 0:
+            piece_faces = piece_faces[:, ::-1]
+
+        pieces_vertices.append(vertices[used] @ op.T)
+        pieces_faces.append(piece_faces + vertex_count)
+        vertex_count += int(used.sum())
+
+    return trimesh.Trimesh(np.concatenate(pieces_vertices), np.concatenate(pieces_faces),
+                           process=False)
+
+
+def _failing_ops(centers, kinds, flags, ops, render_state, config, exact):
+    """Indices of the ops that don't reproduce the rendered image of some cell"""
+    states = cell_states(kinds, flags).astype(np.int64)
+    classes = Symmetry.cell_classes(centers, kinds)
+
+    failing = set()
+    for i, op in enumerate(ops[1:], start=1):
+        moved_classes = Symmetry.cell_classes(Symmetry.images(centers, op[None]), kinds)
+        combos = np.unique((states * 3 + classes) * 3 + moved_classes)
+        for combo in combos.tolist():
+            state, source, target = combo // 9, combo // 3 % 3, combo % 3
+            if not _reproduces(op, state >> 16, state & 0xFFFF, source, target, render_state,
+                               config, exact):
+                failing.add(i)
+                break
+    return failing
+
+
+# Results of _reproduces, which only depend on the cell and the operation
+REPRODUCES = dict()
+
+
+def _reproduces(op, kind, flags, source, target, render_state, config, exact):
+    """Whether op maps the rendered cell onto the cell it should become"""
+    key = (op.tobytes(), kind, flags, source, target, config, exact)
+    if key not in REPRODUCES:
+        pairs = Symmetry.flag_map(op, source, target)
+        moved_flags = int(Symmetry.map_flags([flags], pairs, target)[0]) & Lattice.KIND_MASKS[kind]
+        REPRODUCES[key] = _same_mesh(render_state(kind, moved_flags, config),
+                                     render_state(kind, flags, config), op, exact)
+    return REPRODUCES[key]
+
+
+def _same_mesh(expected, actual, op, exact):
+    """Whether op applied to the actual mesh gives the expected one"""
+    moved = np.round(actual.vertices @ op.T, 6)
+    target = np.round(expected.vertices, 6)
+    if not np.array_equal(np.unique(moved, axis=0), np.unique(target, axis=0)):
+        return False
+    if not exact:
+        return True
+
+    faces = actual.faces[:, ::-1] if np.linalg.det(op) < 0 else actual.faces
+    return _triangles(moved[faces]) == _triangles(target[expected.faces])
+
+
+def _triangles(triangles):
+    """Triangles as a sorted list, each rotated to start at its smallest vertex"""
+    canonical = []
+    for triangle in map(lambda t: list(map(tuple, t)), triangles.tolist()):
+        start = triangle.index(min(triangle))
+        canonical.append(tuple(triangle[start:] + triangle[:start]))
+    return sorted(canonical)
@@ -0,0 +1,263 @@
+"""
+Batched symmetry operations on grid coordinates.
+
+Every symmetry the grids use maps lattice points to lattice points with a signed permutation of the
+axes, so an operation is a 3x3 integer matrix and a set of operations is a stack of them. Applying
+a set to a grid is one matrix product over the whole (N, 3) center array, followed by a dedupe on
+packed keys.
+"""
+from itertools import permutations, product
+
+import numpy as np
+
+from octohedra.grid import Lattice, Trimming
+
+IDENTITY = np.eye(3, dtype=np.int64)
+
+
+def operation(permutation=(0, 1, 2), signs=(1, 1, 1)) -> np.ndarray:
+    """The matrix sending (x, y, z) to (s0 * p[p0], s1 * p[p1], s2 * p[p2])"""
+    matrix = np.zeros((3, 3), dtype=np.int64)
+    for row, (axis, sign) in enumerate(zip(permutation, signs)):
+        matrix[row, axis] = sign
+    return matrix
+
+
+def operations(*matrices) -> np.ndarray:
+    """Stacks matrices into an (M, 3, 3) operation set, dropping duplicates but keeping order"""
+    unique = dict()
+    for matrix in matrices:
+        matrix = np.asarray(matrix, dtype=np.int64).reshape(3, 3)
+        unique.setdefault(matrix.tobytes(), matrix)
+    return np.stack(list(unique.values()))
+
+
+def compose(outer, inner) -> np.ndarray:
+    """Every operation of inner followed by one of outer"""
+    return operations(*(a @ b for a in outer for b in inner))
+
+
+def generate(*generators) -> np.ndarray:
+    """The group generated by the given matrices"""
+    group = operations(IDENTITY, *generators)
+    while True:
+        grown = compose(group, group)
+        if len(grown) == len(group):
+            return group
+        group = grown
+
+
+def is_identity(matrix) -> bool:
+    return np.array_equal(matrix, IDENTITY)
+
+
+FLIP_X = operation(signs=(-1, 1, 1))
+FLIP_Y = operation(signs=(1, -1, 1))
+FLIP_Z = operation(signs=(1, 1, -1))
+SWAP_XY = operation((1, 0, 2))
+SWAP_YZ = operation((0, 2, 1))
+SWAP_XZ = operation((2, 1, 0))
+
+# All 48 signed permutations: the full symmetry group of the octahedron, reflections included
+OCTAHEDRAL = operations(*(operation(p, s) for p in permutations(range(3))
+                          for s in product((1, -1), repeat=3)))
+
+# The symmetry group of a square in the xy plane: what four_way applies
+FOUR_WAY = generate(SWAP_XY, FLIP_X, FLIP_Y)
+XY_FLIPS = generate(FLIP_X, FLIP_Y)
+
+# six_way adds the images (x, z, y), (z, y, x) and (x, y, -z) and then goes four ways. That is 32
+# operations rather than the whole octahedral group, which it only matches on shapes that already
+# have some symmetry of their own.
+SIX_WAY_SEEDS = operations(IDENTITY, SWAP_YZ, SWAP_XZ, FLIP_Z)
+SIX_WAY = compose(FOUR_WAY, SIX_WAY_SEEDS)
+
+# full_symmetry copies each cell to (y, x, z), (-x, y, z) and (y, -x, z)
+FULL_SYMMETRY = operations(IDENTITY, SWAP_XY, FLIP_X, SWAP_XY @ FLIP_X)
+
+ORIGIN = (0, 0, 0)
+
+
+def reflection(x=1, y=1, z=1) -> np.ndarray:
+    return operations(IDENTITY, np.diag((x, y, z)))
+
+
+def four_way(origin=ORIGIN):
+    """The (operations, origin) stages of four_way. It swaps x and y about the given origin but
+    reflects through the coordinate planes, so away from zero it takes two passes.
+    """
+    if not any(origin):
+        return [(FOUR_WAY, ORIGIN)]
+    return [(operations(IDENTITY, SWAP_XY), origin), (XY_FLIPS, ORIGIN)]
+
+
+def six_way(origin=ORIGIN):
+    """The (operations, origin) stages of six_way"""
+    if not any(origin):
+        return [(SIX_WAY, ORIGIN)]
+    return [(SIX_WAY_SEEDS, origin)] + four_way(origin)
+
+
+def images(centers, ops, origin=ORIGIN) -> np.ndarray:
+    """Every center under every operation about origin, as an (M * N, 3) array grouped by
+    operation"""
+    origin = np.asarray(tuple(origin), dtype=np.int64)
+    local = np.asarray(centers, dtype=np.int64).reshape(-1, 3) - origin
+    return (np.einsum("mij,nj->mni", ops, local) + origin).reshape(-1, 3)
+
+
+def apply(centers, stages):
+    """
+    Adds the images of every center under each stage's operations about the stage's origin, one
+    stage after another.
+
+    Images are written over the existing cells in operation order, the way inserting each one
+    would, so a cell only stays itself when nothing lands on it.
+
+    Returns (centers, rows, moved), one row per distinct center: rows is the input cell each
+    center comes from, and moved whether it's an image rather than that cell itself.
+    """
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+    rows = np.arange(len(centers))
+    moved = np.zeros(len(centers), dtype=bool)
+
+    for ops, origin in stages:
+        ops = [op for op in ops if not is_identity(op)]
+        n = len(centers)
+        if not ops or n == 0:
+            continue
+
+        everything = np.concatenate((centers, images(centers, np.stack(ops), origin)))
+        kept = last_writes(everything)
+        centers = everything[kept]
+        rows, moved = rows[kept % n], moved[kept % n] | (kept >= n)
+
+    return centers, rows, moved
+
+
+def last_writes(centers) -> np.ndarray:
+    """Row of the last write to each distinct center, in the order the centers first appear"""
+    keys = Lattice.pack(centers)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    last = np.zeros(len(first), dtype=np.int64)
+    np.maximum.at(last, inverse.reshape(-1), np.arange(len(keys)))
+    return last[np.argsort(first, kind="stable")]
+
+
+# Symmetric rendering
+
+# Directions of the crop faces. An operation moves a crop flag to the face its direction maps to.
+CROP_DIRECTIONS = {
+    "crop_east": (1, 0, 0),
+    "crop_west": (-1, 0, 0),
+    "crop_north": (0, 1, 0),
+    "crop_south": (0, -1, 0),
+    "crop_top": (0, 0, 1),
+    "crop_bottom": (0, 0, -1),
+}
+
+OCTO_CLASS, TETRA_UP_CLASS, TETRA_DOWN_CLASS = 0, 1, 2
+
+
+def cell_classes(centers, kinds) -> np.ndarray:
+    """Which trimming stencil each cell uses: octo, or a tetra of either parity"""
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+    classes = np.full(len(centers), OCTO_CLASS, dtype=np.uint8)
+    is_tetra = np.asarray(kinds) == Lattice.TETRA
+    classes[is_tetra] = np.where(centers[is_tetra].sum(axis=1) % 4 == 3,
+                                 TETRA_UP_CLASS, TETRA_DOWN_CLASS)
+    return classes
+
+
+def flag_map(op, source_class, target_class):
+    """
+    How a cell's flags move when op carries it from a cell of source_class to one of target_class,
+    as (source bit, target bit) pairs. None if some trim flag of the target has no counterpart,
+    which happens for operations that turn the up/down asymmetric stencils upside down.
+
+    The tetra 'flip' flag depends only on position, so it isn't mapped; see map_flags.
+    """
+    op = np.asarray(op)
+    source = {(rule, frozenset(offsets)): name for name, rule, offsets in
+              Trimming.STENCILS[source_class]}
+    pairs = []
+    for name, rule, offsets in Trimming.STENCILS[target_class]:
+        pulled = frozenset(tuple((op.T @ offset).tolist()) for offset in offsets)
+        if (rule, pulled) not in source:
+            return None
+        pairs.append((Lattice.FLAGS[source[(rule, pulled)]], Lattice.FLAGS[name]))
+
+    directions = {direction: name for name, direction in CROP_DIRECTIONS.items()}
+    for name, direction in CROP_DIRECTIONS.items():
+        image = directions[tuple((op @ direction).tolist())]
+        pairs.append((Lattice.FLAGS[name], Lattice.FLAGS[image]))
+    return pairs
+
+
+def map_flags(flags, pairs, target_class):
+    """Applies a flag_map to an array of flags"""
+    flags = np.asarray(flags, dtype=np.uint16)
+    mapped = np.zeros_like(flags)
+    for source, target in pairs:
+        mapped[flags & source != 0] |= target
+    if target_class == TETRA_DOWN_CLASS:
+        mapped |= Lattice.FLAGS["flip"]
+    return mapped
+
+
+def invariant_ops(centers, kinds, flags, ops=OCTAHEDRAL) -> np.ndarray:
+    """
+    The operations among ops that map the cells onto themselves, crop flags included, and whose
+    stencils trimming can follow (see flag_map). The identity comes first.
+    """
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+    kinds = np.asarray(kinds)
+    keys = Lattice.pack(centers)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    classes = cell_classes(centers, kinds)
+    crops = np.where(kinds == Lattice.OCTO, np.asarray(flags) & Lattice.CROP_MASK, 0)
+
+    invariant = [IDENTITY]
+    for op in ops:
+        if is_identity(op):
+            continue
+        moved = Lattice.pack(images(centers, op[None]))
+        if not Lattice.contains(sorted_keys, moved).all():
+            continue
+
+        rows = order[np.searchsorted(sorted_keys, moved)]
+        moved_classes = classes[rows]
+        for source, target in set(zip(classes.tolist(), moved_classes.tolist())):
+            pairs = flag_map(op, source, target)
+            selected = (classes == source) & (moved_classes == target)
+            if pairs is None or not np.array_equal(
+                    map_flags(crops[selected], pairs, target) & Lattice.CROP_MASK,
+                    crops[rows[selected]]):
+                break
+        else:
+            invariant.append(op)
+
+    return np.stack(invariant)
+
+
+def fundamental_domain(centers, ops):
+    """
+    Picks one cell from each orbit of ops, whose first operation must be the identity.
+
+    Returns (reps, canonical): the rows of the picked cells, and an (M, len(reps)) mask that is set
+    where ops[m] is the first operation taking that cell to its image. Applying each operation to
+    the cells it's canonical for gives every cell exactly once.
+    """
+    keys = Lattice.pack(images(centers, ops)).reshape(len(ops), -1)
+    reps = np.flatnonzero(keys[0] == keys.min(axis=0))
+
+    rep_keys = keys[:, reps]
+    order = np.argsort(rep_keys, axis=0, kind="stable")
+    ranked = np.take_along_axis(rep_keys, order, axis=0)
+    first = np.ones(ranked.shape, dtype=bool)
+    first[1:] = ranked[1:] != ranked[:-1]
+
+    canonical = np.zeros(rep_keys.shape, dtype=bool)
+    np.put_along_axis(canonical, order, first, axis=0)
+    return reps, canonical
@@ -0,0 +1,138 @@
+"""
+Splits a grid into build-plate sized tiles and exports them in parallel.
+
+Tiles are boxes of the lattice, cut along planes that run through octahedron centers. A cell on a
+cut belongs to the tiles on both sides and is cropped in half in each of them, the way split cuts
+along z. Each tile is trimmed, rendered and exported on its own, in worker processes, so a job
+takes about as long as its slowest tile.
+"""
+import math
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import get_context
+
+import numpy as np
+from trimesh.exchange.export import export_mesh
+
+from octohedra.grid import Lattice
+from octohedra.grid.ColumnarGrid import ColumnarGrid
+
+AXES = "xyz"
+
+# How far an octahedron reaches from its center along each axis, in lattice units
+HALF_WIDTH = 2
+
+
+def tile_span(tile_size, config) -> int:
+    """Lattice units per tile along an axis: the most that fits in tile_size, leaving room for the
+    overlap cells stick out by, and rounded down to an even number so the cuts run through
+    octahedron centers"""
+    render_config = config.derive_render_config()
+    unit = render_config.cell_size / 4
+    span = math.floor((tile_size - render_config.overlap) / unit + 1e-9) // 2 * 2
+    if span < 2:
+        raise ValueError(f"Tiles of size {tile_size} are smaller than a cell.")
+    return span
+
+
+def tile_bounds(centers, span, axes=AXES):
+    """
+    The tiles with any cells in them, as {(i, j, k): (low, high)}.
+
+    Cuts are span apart along each of the given axes, starting from where the outermost cells
+    end. The outermost tiles are unbounded on their outer side, so no cell on the outside of the
+    model is cropped.
+    """
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+    if len(centers) == 0:
+        return dict()
+
+    cut = np.array([axis in axes for axis in AXES])
+    origin = (centers.min(axis=0) - HALF_WIDTH) // 2 * 2
+    extent = centers.max(axis=0) + HALF_WIDTH - origin
+    last = np.where(cut, np.maximum(-(-extent // span) - 1, 0), 0)
+    tile = np.where(cut, np.minimum((centers - origin) // span, last), 0)
+
+    # A cell on the lower cut of its tile is also in the tile below
+    on_cut = (tile > 0) & (centers == origin + tile * span)
+    indices = set()
+    for shift in product((0, 1), repeat=3):
+        moved = np.asarray(shift, dtype=bool)
+        rows = (on_cut | ~moved).all(axis=1)
+        indices.update(map(tuple, (tile[rows] - shift).tolist()))
+
+    bounds = dict()
+    for index in sorted(indices):
+        low = [int(origin[a] + index[a] * span) if cut[a] and index[a] > 0 else -math.inf
+               for a in range(3)]
+        high = [int(origin[a] + (index[a] + 1) * span) if cut[a] and index[a] < last[a]
+                else math.inf for a in range(3)]
+        bounds[index] = (tuple(low), tuple(high))
+    return bounds
+
+
+def tiles(grid, tile_size, config, axes=AXES) -> dict:
+    """
+    Cuts a grid into tiles no bigger than tile_size along the given axes.
+
+    Returns {(i, j, k): ColumnarGrid}. Each tile keeps its cells' flags and gets crop flags on its
+    cut faces. grid can be an OctoGrid or a ColumnarGrid and is left as it is.
+    """
+    columnar = grid if isinstance(grid, ColumnarGrid) else ColumnarGrid.from_grid(grid)
+    bounds = tile_bounds(columnar.centers, tile_span(tile_size, config), axes)
+
+    result = dict()
+    for index, (low, high) in bounds.items():
+        rows = np.searchsorted(columnar.keys, Lattice.pack(columnar.index.box(low, high)))
+        tile = ColumnarGrid.from_arrays(columnar.centers[rows], columnar.kinds[rows],
+                                        columnar.flags[rows])
+        tile.crop(low[0], high[0], low[1], high[1], low[2], high[2])
+        result[index] = tile
+    return result
+
+
+def tile_name(index, file_type="stl") -> str:
+    return "tile_{}_{}_{}.{}".format(*index, file_type)
+
+
+def export_tiles(grid, tile_size, config, path, file_type="stl", axes=AXES, workers=None):
+    """
+    Cuts a grid into tiles, then trims, renders and exports each one in a worker process.
+
+    Writes one file per tile into the directory path, or into a zip archive if path ends in
+    .zip or is a binary file object. Tiles are rendered without the usual 45 degree turn, so
+    each one's footprint stays within tile_size, and in model coordinates, so they fit back
+    together. workers is the number of processes; with 1 (or 0) everything runs in this one.
+
+    Returns the file names written, in tile order.
+    """
+    jobs = {tile_name(index, file_type): (tile.centers, tile.kinds, tile.flags, config, file_type)
+            for index, tile in tiles(grid, tile_size, config, axes).items()}
+
+    if workers is not None and workers <= 1:
+        files = {name: export_tile(*job) for name, job in jobs.items()}
+    else:
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool:
+            futures = {name: pool.submit(export_tile, *job) for name, job in jobs.items()}
+            files = {name: future.result() for name, future in futures.items()}
+
+    if hasattr(path, "write") or os.fspath(path).endswith(".zip"):
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for name, content in files.items():
+            with open(os.path.join(path, name), "wb") as file:
+                file.write(content.encode() if isinstance(content, str) else content)
+    return list(files)
+
+
+def export_tile(centers, kinds, flags, config, file_type="stl"):
+    """Trims, renders and exports one tile's cells. Runs in the worker processes."""
+    tile = ColumnarGrid.from_arrays(centers, kinds, flags)
+    tile.compute_trimming(mode="auto")
+    mesh = tile.render(config, rotate=False)
+    return export_mesh(mesh, file_obj=None, file_type=file_type)
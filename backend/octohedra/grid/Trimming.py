@@ -0,0 +1,252 @@
+"""
+Batch trimming: computes the trim/weld/clip flags of every cell in a grid in one pass.
+
+OctoCell.trim and TetraCell.trim look up a fixed stencil of neighbour offsets around one cell at a
+time. Here the same stencils are written down as tables, one per lattice class, and applied to
+whole columns of cells. Packed keys are linear in the coordinates, so the neighbour keys of every
+cell in a class are a single vector addition away, and membership is a binary search in the
+sorted key column.
+
+For compact grids there is also a dense mode, which holds octo and tetra occupancy in packed
+BitVolumes and derives each flag for the whole volume with shifted ANDs.
+"""
+import numpy as np
+
+from octohedra.grid import Lattice
+from octohedra.grid.BitVolume import MAX_DENSE_BYTES, BitVolume, volume_bytes
+
+SPACING = 2
+
+TRIM_NE = (SPACING, SPACING, 0)
+TRIM_NW = (-SPACING, SPACING, 0)
+TRIM_SW = (-SPACING, -SPACING, 0)
+TRIM_SE = (SPACING, -SPACING, 0)
+
+ATTIC = ((SPACING, 0, SPACING),
+         (0, SPACING, SPACING),
+         (-SPACING, 0, SPACING),
+         (0, -SPACING, SPACING),
+         (0, 0, 2 * SPACING))
+
+BASEMENT = ((SPACING, 0, -SPACING),
+            (0, SPACING, -SPACING),
+            (-SPACING, 0, -SPACING),
+            (0, -SPACING, -SPACING))
+
+# (flag, rule, offsets). A flag is raised when any/all/none of its offsets are occupied.
+OCTO_STENCIL = (
+    ("trim_ne", "any", (TRIM_NE,)),
+    ("trim_nw", "any", (TRIM_NW,)),
+    ("trim_sw", "any", (TRIM_SW,)),
+    ("trim_se", "any", (TRIM_SE,)),
+    ("clip_point_up", "none", ATTIC),
+    ("weld_up", "all", ATTIC),
+    ("weld_down", "all", BASEMENT),
+)
+
+
+def tetra_stencil(flip):
+    """The TetraCell.trim stencil for tetras whose 'flip' sign is +1 (x + y + z = 3 mod 4) or -1.
+    Each trim checks the two octo cells that a corner of the tetra points between.
+    """
+    return (
+        ("trim_sw", "any", ((-3, -1, -flip), (-1, -3, -flip))),
+        ("trim_se", "any", ((3, -1, flip), (1, -3, flip))),
+        ("trim_nw", "any", ((-3, 1, flip), (-1, 3, flip))),
+        ("trim_ne", "any", ((3, 1, -flip), (1, 3, -flip))),
+    )
+
+
+TETRA_UP_STENCIL = tetra_stencil(1)
+TETRA_DOWN_STENCIL = tetra_stencil(-1)
+
+# Indexed by Symmetry's cell classes
+STENCILS = (OCTO_STENCIL, TETRA_UP_STENCIL, TETRA_DOWN_STENCIL)
+
+# Every offset that some stencil looks at
+NEIGHBOUR_OFFSETS = np.array(list(dict.fromkeys(
+    offset for stencil in STENCILS for _, _, group in stencil for offset in group)), dtype=np.int64)
+
+
+def neighbours(centers, direction=1) -> np.ndarray:
+    """
+    The distinct points that the stencils of the centers look at. With direction=-1, the points
+    whose stencils look at one of the centers instead: the cells whose flags can change when one of
+    the centers is inserted or removed.
+    """
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+    reached = centers[:, None] + direction * NEIGHBOUR_OFFSETS[None]
+    return Lattice.unpack(np.unique(Lattice.pack(reached)))
+
+
+RULES = {
+    "any": lambda hits: hits.any(axis=1),
+    "all": lambda hits: hits.all(axis=1),
+    "none": lambda hits: ~hits.any(axis=1),
+}
+
+
+def apply_stencil(stencil, keys, occupied):
+    """Flags for the cells with the given keys, checked against the sorted occupied keys"""
+    offsets = list(dict.fromkeys(offset for _, _, group in stencil for offset in group))
+    hits = {offset: Lattice.contains(occupied, keys + Lattice.pack_offset(offset))
+            for offset in offsets}
+
+    flags = np.zeros(len(keys), dtype=np.uint16)
+    for name, rule, group in stencil:
+        raised = RULES[rule](np.stack([hits[offset] for offset in group], axis=1))
+        flags[raised] |= Lattice.FLAGS[name]
+    return flags
+
+
+def lattice_classes(centers, kinds):
+    """Splits cells into the classes that share a stencil: octos, and tetras of either parity"""
+    parity = centers.sum(axis=1) % 4
+    is_tetra = kinds == Lattice.TETRA
+    return (
+        (OCTO_STENCIL, kinds == Lattice.OCTO),
+        (TETRA_UP_STENCIL, is_tetra & (parity == 3)),
+        (TETRA_DOWN_STENCIL, is_tetra & (parity != 3)),
+    )
+
+
+def apply_stencil_dense(stencil, cells, occupied, parity, centers):
+    """
+    Flags for the given centers, which all share one lattice class and one coordinate parity.
+
+    Each flag is first computed for the whole volume, as the class's cells ANDed with the
+    occupancy shifted by each stencil offset, and then read back at the centers. Volumes are kept
+    at half resolution, one per coordinate parity, so an offset both shifts the volume and may
+    move the lookup into the volume of another parity.
+    """
+    index = cells.index(centers // 2)
+    empty = cells.like()
+
+    flags = np.zeros(len(centers), dtype=np.uint16)
+    for group in dict.fromkeys(group for _, _, group in stencil):
+        shifts = []
+        for offset in group:
+            target = tuple((p + o) % 2 for p, o in zip(parity, offset))
+            half_offset = tuple((p + o) // 2 for p, o in zip(parity, offset))
+            shifts.append(occupied.get(target, empty).shifted(half_offset))
+
+        any_hit, all_hit = shifts[0], shifts[0]
+        for shift in shifts[1:]:
+            any_hit, all_hit = any_hit | shift, all_hit & shift
+
+        for name, rule, flag_group in stencil:
+            if flag_group != group:
+                continue
+            if rule == "any":
+                volume = cells & any_hit
+            elif rule == "all":
+                volume = cells & all_hit
+            else:
+                volume = cells - any_hit
+            flags[volume.gather(index)] |= Lattice.FLAGS[name]
+    return flags
+
+
+def parity_classes(centers):
+    """The coordinate parities present among the centers, and which centers have each one"""
+    parities = centers % 2
+    codes = parities @ np.array((1, 2, 4))
+    return [(tuple(parities[codes == code][0].tolist()), codes == code)
+            for code in np.unique(codes)]
+
+
+def dense_bytes(centers):
+    """Memory needed for the dense trimming volumes of a grid with these centers"""
+    if len(centers) == 0:
+        return 0
+    half = centers // 2
+    return volume_bytes(half.min(axis=0), half.max(axis=0)) * 3 * len(parity_classes(centers))
+
+
+def fits_dense(centers):
+    """Whether a grid with these centers is small enough for dense trimming"""
+    return 0 < dense_bytes(centers) <= MAX_DENSE_BYTES
+
+
+def prefers_dense(centers):
+    """Dense trimming touches every word of the bounding box, sparse trimming does a binary search
+    per cell and neighbour. Prefer dense when the box isn't much emptier than the cell count.
+    """
+    return fits_dense(centers) and dense_bytes(centers) // 8 <= len(centers)
+
+
+def trim_flags_dense(centers, kinds):
+    """
+    Same result as trim_flags, computed from bit volumes instead of per-cell key lookups.
+
+    Octo cells sit on even coordinates and tetras on odd ones, so occupancy is split by coordinate
+    parity into half-resolution volumes. Off-lattice cells just add more parity volumes.
+    """
+    frame = BitVolume.bounding(centers // 2)
+    classes = parity_classes(centers)
+
+    occupied, octo, tetra = {}, {}, {}
+    for parity, rows in classes:
+        half = centers[rows] // 2
+        octo[parity] = frame.like().add(half[kinds[rows] == Lattice.OCTO])
+        tetra[parity] = frame.like().add(half[kinds[rows] == Lattice.TETRA])
+        occupied[parity] = octo[parity] | tetra[parity]
+
+    flags = np.zeros(len(centers), dtype=np.uint16)
+    for stencil, stencil_rows in lattice_classes(centers, kinds):
+        cells = octo if stencil is OCTO_STENCIL else tetra
+        for parity, parity_rows in classes:
+            rows = stencil_rows & parity_rows
+            if rows.any():
+                flags[rows] = apply_stencil_dense(stencil, cells[parity], occupied, parity,
+                                                  centers[rows])
+
+    return flags
+
+
+def trim_flags(centers, kinds, keys=None, occupied=None, mode="sparse"):
+    """
+    Computes the flags that OctoCell.trim / TetraCell.trim would set, for every cell at once.
+
+    centers: (N, 3) integer array of cell centers
+    kinds: (N,) array of Lattice cell kinds
+    keys: Lattice.pack(centers), if you already have it
+    occupied: sorted keys of every occupied center; defaults to the cells being trimmed
+    mode: "sparse" to look neighbours up in the sorted keys, "dense" to use bit volumes (only for
+        grids that fit in MAX_DENSE_BYTES, and only against the cells being trimmed), or "auto"
+        to pick whichever should be faster
+
+    Returns an (N,) uint16 array with only trim-related bits set (see Lattice.TRIM_MASK).
+    """
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 3)
+    kinds = np.asarray(kinds)
+
+    if mode == "auto":
+        mode = "dense" if occupied is None and prefers_dense(centers) else "sparse"
+    if mode == "dense":
+        if occupied is not None:
+            raise ValueError("Dense trimming only checks the cells being trimmed.")
+        if len(centers) == 0:
+            return np.zeros(0, dtype=np.uint16)
+        if not fits_dense(centers):
+            raise ValueError("Grid is too large to trim densely.")
+        return trim_flags_dense(centers, kinds) | _flip_flags(centers, kinds)
+
+    keys = Lattice.pack(centers) if keys is None else np.asarray(keys, dtype=np.int64)
+    occupied = np.unique(keys) if occupied is None else occupied
+
+    # Leave a margin for the largest stencil offset so neighbour keys can't wrap around
+    if len(centers) and np.abs(centers).max() > Lattice.COORD_MAX - 2 * SPACING:
+        raise ValueError("Grid is too large to trim with packed keys.")
+
+    flags = np.zeros(len(centers), dtype=np.uint16)
+    for stencil, rows in lattice_classes(centers, kinds):
+        if rows.any():
+            flags[rows] = apply_stencil(stencil, keys[rows], occupied)
+
+    return flags | _flip_flags(centers, kinds)
+
+
+def _flip_flags(centers, kinds):
+    is_flipped = (kinds == Lattice.TETRA) & (centers.sum(axis=1) % 4 == 1)
+    return np.where(is_flipped, Lattice.FLAGS["flip"], 0).astype(np.uint16)
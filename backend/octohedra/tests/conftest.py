@@ -0,0 +1,22 @@
+"""Helpers shared by the test modules."""
+from octohedra.builders.RecipeBuilder import RecipeBuilder, get_preset_recipe
+from octohedra.grid import Lattice
+
+
+def state(grid):
+    """Every cell's state, by center"""
+    return {center: Lattice.state_of(cell) for center, cell in grid.occ.items()}
+
+
+def render_states(grid):
+    """Every cell's state without the flags its kind doesn't render (see Lattice.render_state), by
+    center as a tuple, for comparing grids of different backends"""
+    return {tuple(map(int, center)): Lattice.render_state(Lattice.state_of(cell))
+            for center, cell in grid.occ.items()}
+
+
+def recipe_builder(name, depth=3):
+    """The RecipeBuilder of a preset recipe, grid parameters included"""
+    recipe = get_preset_recipe(name, depth=depth)
+    return RecipeBuilder(layers=recipe["layers"], grid_depth=recipe.get("grid_depth"),
+                         grid_min_depth=recipe.get("grid_min_depth", 2))
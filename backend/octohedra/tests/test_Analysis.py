@@ -0,0 +1,81 @@
+"""Tests for predicting grid and mesh sizes without building them."""
+import pytest
+from trimesh.exchange.export import export_mesh
+
+from octohedra.builders.FlakeBuilder import FlakeBuilder
+from octohedra.builders.OctoBuilder import clip_box
+from octohedra.builders.OctoSectorBuilder import OctoSectorBuilder
+from octohedra.builders.TowerBuilders import EvilTower
+from octohedra.grid import Analysis, GridExpression
+from octohedra.tests.conftest import recipe_builder
+from octohedra.utils import OctoConfigs
+
+CONFIG = OctoConfigs.config_20_rainbow_speed
+
+
+def rendered(builder):
+    grid = builder.materialize(clip=clip_box(z_min=0))
+    grid.compute_trimming(mode="auto")
+    return grid, grid.render(CONFIG)
+
+
+class TestAnalysis:
+    """Predictions should match what building and rendering gives."""
+
+    def test_index_digits(self):
+        """Average digits of 1..n."""
+        assert Analysis.index_digits(9) == 1
+        assert Analysis.index_digits(10) == pytest.approx(1.1)
+        assert Analysis.index_digits(1000) == pytest.approx((9 + 180 + 2700 + 4) / 1000)
+
+    @pytest.mark.parametrize("depth", [2, 3, 4])
+    def test_flakes(self, depth):
+        """Ground-cropped flakes should be counted exactly, and their meshes nearly so."""
+        grid, mesh = rendered(FlakeBuilder(depth))
+        analysis = FlakeBuilder(depth).analyze(CONFIG, clip=clip_box(z_min=0))
+        obj = export_mesh(mesh, file_obj=None, file_type="obj", include_normals=False, digits=6)
+        stl = export_mesh(mesh, file_obj=None, file_type="stl")
+
+        assert analysis["cells"] == len(grid.occ)
+        assert analysis["low"] == grid.centers.min(axis=0).tolist()
+        assert analysis["high"] == grid.centers.max(axis=0).tolist()
+        assert analysis["obj"]["faces"] == pytest.approx(len(mesh.faces), rel=0.05)
+        assert analysis["obj"]["vertices"] == pytest.approx(len(mesh.vertices), rel=0.05)
+        assert analysis["obj"]["bytes"] == pytest.approx(len(obj), rel=0.05)
+        assert analysis["stl"]["bytes"] == pytest.approx(len(stl), rel=0.05)
+
+    def test_overlaps(self):
+        """Cells that overlapping parts share should be counted once."""
+        grid, mesh = rendered(EvilTower(3))
+        analysis = EvilTower(3).analyze(CONFIG, clip=clip_box(z_min=0))
+
+        assert analysis["cells"] == len(grid.occ) and analysis["exact"]
+        assert analysis["stl"]["faces"] == analysis["obj"]["faces"]
+        assert analysis["stl"]["bytes"] == 84 + 50 * analysis["stl"]["faces"]
+
+    @pytest.mark.parametrize("name", ["temple_complex", "evil_tower"])
+    def test_recipes(self, name):
+        """Recipes' sub-structures overlap too, and should be counted as they're built."""
+        expression = GridExpression.Crop.box(recipe_builder(name).expression(), z_min=0)
+        analysis = Analysis.analyze(expression, CONFIG)
+
+        assert analysis["cells"] == len(expression.evaluate()[0]) and analysis["exact"]
+
+    def test_upper_bound(self):
+        """Expressions that don't compile to an instance plan count shared cells once per part."""
+        cells = GridExpression.Cells([[0, 0, 0], [2, 2, 0]])
+        analysis = Analysis.analyze(GridExpression.Union(cells, cells), CONFIG)
+
+        assert analysis["cells"] == 4 and not analysis["exact"]
+
+    def test_empty(self):
+        """A crop with nothing left should predict nothing."""
+        analysis = FlakeBuilder(2).analyze(CONFIG, clip=clip_box(z_min=100))
+
+        assert analysis["cells"] == 0 and analysis["low"] is None
+        assert analysis["obj"]["bytes"] == 0 and analysis["stl"]["faces"] == 0
+
+    def test_needs_expression(self):
+        """Builders that only build cell by cell can't be analyzed."""
+        with pytest.raises(NotImplementedError):
+            OctoSectorBuilder(iteration=2).analyze(CONFIG)
@@ -0,0 +1,48 @@
+"""Tests for packed BitVolumes."""
+import numpy as np
+import pytest
+
+from octohedra.grid.BitVolume import BitVolume
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    # Wider than one 64-bit word along x, so shifts have to carry between words
+    return rng.integers((-70, -5, -5), (70, 6, 6), size=(300, 3))
+
+
+class TestBitVolume:
+    """Tests for setting, reading and shifting bits."""
+
+    def test_add_and_get(self, points):
+        """Every added point should be set, and nothing else."""
+        volume = BitVolume.bounding(points).add(points)
+        others = points + (0, 0, 100)
+
+        assert volume.get(points).all()
+        assert not volume.get(others).any()
+        assert volume.count() == len(np.unique(points, axis=0))
+
+    @pytest.mark.parametrize("offset", [(1, 0, 0), (-1, 0, 0), (63, 2, -1), (-65, -3, 4),
+                                        (130, 0, 0), (0, 11, 0), (-3, -1, -1)])
+    def test_shifted(self, points, offset):
+        """A shifted volume should have p set exactly when the original has p + offset set."""
+        volume = BitVolume.bounding(points).add(points)
+        occupied = {tuple(p) for p in points.tolist()}
+
+        lower, upper = volume.origin, volume.origin + np.array(volume.shape)
+        axes = [np.arange(lo, hi) for lo, hi in zip(lower, upper)]
+        box = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+        expected = [tuple(p) in occupied for p in (box + offset).tolist()]
+
+        assert np.array_equal(volume.shifted(offset).get(box), expected)
+
+    def test_shift_does_not_leak_into_padding(self, points):
+        """Bits shifted past the end of a row shouldn't come back on a later shift."""
+        volume = BitVolume.bounding(points).add(points)
+
+        round_trip = volume.shifted((-5, 0, 0)).shifted((5, 0, 0))
+
+        assert round_trip.count() <= volume.count()
+        assert not (round_trip - volume).count()
@@ -0,0 +1,127 @@
+"""Tests for the structure-of-arrays ColumnarGrid backend.
+
+ColumnarGrid has to be a drop-in replacement for OctoGrid, so most of these build the same shape
+with both backends and compare the results cell by cell.
+"""
+import numpy as np
+import pytest
+
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.grid.ColumnarGrid import ColumnarGrid
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.tests.conftest import render_states
+from octohedra.utils import OctoConfigs
+
+
+def build_both(layers, six_way=False):
+    grid = RecipeBuilder(layers=layers).materialize()
+    columnar = ColumnarGrid.from_grid(grid)
+
+    for g in (grid, columnar):
+        if six_way:
+            g.six_way()
+        g.crop(z_min=0)
+        g.compute_trimming()
+
+    return grid, columnar
+
+
+RECIPES = [
+    pytest.param([{"depth": 2}], True, id="six_way_flake"),
+    pytest.param([{"depth": 2, "shape": "solid"}], False, id="solid"),
+    pytest.param([{"depth": 3, "spawn": ["out", "in", "side"]}, {"depth": 2}], False,
+                 id="evil_tower"),
+]
+
+
+class TestColumnarGridParity:
+    """ColumnarGrid should produce exactly what OctoGrid produces."""
+
+    @pytest.mark.parametrize("layers, six_way", RECIPES)
+    def test_same_cells_and_flags(self, layers, six_way):
+        """Cropping, symmetry and trimming should leave identical cells and flags."""
+        grid, columnar = build_both(layers, six_way)
+
+        assert render_states(columnar) == render_states(grid)
+
+    @pytest.mark.parametrize("layers, six_way", RECIPES)
+    def test_same_mesh(self, layers, six_way):
+        """Stamped rendering should produce the same geometry as per-cell rendering."""
+        grid, columnar = build_both(layers, six_way)
+        config = OctoConfigs.giant_debug
+
+        mesh = grid.render(config)
+        columnar_mesh = columnar.render(config)
+
+        assert columnar_mesh.vertices.shape == mesh.vertices.shape
+        assert columnar_mesh.faces.shape == mesh.faces.shape
+        assert np.array_equal(np.unique(columnar_mesh.vertices.round(6), axis=0),
+                              np.unique(mesh.vertices.round(6), axis=0))
+
+
+class TestColumnarGridStorage:
+    """Tests for the column storage itself."""
+
+    def test_last_insert_wins(self):
+        """Re-inserting a center should replace the cell, like assigning into OctoGrid.occ."""
+        grid = ColumnarGrid()
+        grid.insert_cell(OctoVector(0, 0, 0))
+        grid.crop(z_min=0)
+        assert grid.occ[OctoVector(0, 0, 0)].crop_bottom
+
+        grid.insert_cell(OctoVector(0, 0, 0))
+
+        assert len(grid.occ) == 1
+        assert not grid.occ[OctoVector(0, 0, 0)].crop_bottom
+
+    def test_occ_view(self):
+        """The occ view should support the dict operations builders and tests rely on."""
+        grid = ColumnarGrid()
+        grid.insert_cell(OctoVector(0, 0, 0))
+        grid.insert_cell(OctoVector(1, 1, 1))
+
+        assert OctoVector(1, 1, 1) in grid.occ
+        assert OctoVector(2, 0, 0) not in grid.occ
+        assert set(grid.occ) == {OctoVector(0, 0, 0), OctoVector(1, 1, 1)}
+        assert type(grid.occ[OctoVector(1, 1, 1)]).__name__ == "TetraCell"
+
+    def test_merge_with_octogrid(self):
+        """Both backends should merge into each other."""
+        grid = OctoGrid()
+        grid.insert_cell(OctoVector(0, 0, 0))
+        columnar = ColumnarGrid()
+        columnar.insert_cell(OctoVector(2, 0, 0))
+
+        columnar.merge(grid)
+        grid.merge(columnar)
+
+        assert len(columnar) == 2
+        assert set(grid.occ) == set(columnar.occ)
+
+    def test_memory_per_cell(self):
+        """A cell should cost a few dozen bytes at most."""
+        grid = ColumnarGrid.from_grid(RecipeBuilder(layers=[{"depth": 3}]).materialize())
+
+        assert grid.nbytes / len(grid) < 32
+
+    @pytest.mark.parametrize("operation", ["union", "intersection", "difference",
+                                           "symmetric_difference"])
+    def test_set_algebra(self, operation):
+        """Set operations should agree with OctoGrid's, against either backend."""
+        def grids():
+            first, second = OctoGrid(), OctoGrid()
+            first.fill(6, OctoVector(0, 0, 0))
+            second.fill(5, OctoVector(4, 2, 0))
+            second.crop(z_min=0)
+            return first, second
+
+        grid, other = grids()
+        getattr(grid, operation)(other)
+
+        first, second = grids()
+        columnar = getattr(ColumnarGrid.from_grid(first), operation)(ColumnarGrid.from_grid(second))
+        mixed = getattr(ColumnarGrid.from_grid(first), operation)(second)
+
+        assert render_states(columnar) == render_states(grid)
+        assert render_states(mixed) == render_states(grid)
@@ -0,0 +1,120 @@
+"""Tests for the array flake kernel."""
+import numpy as np
+import pytest
+
+from octohedra.builders import FlakeKernel
+from octohedra.builders.FlakeBuilder import FlakeBuilder
+from octohedra.builders.OctoBuilder import clip_box
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.builders.TowerBuilders import EvilTower, HollowTower
+from octohedra.grid import Lattice
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.tests.conftest import state
+from octohedra.utils.OctoUtil import DOWN, UP, E, N, S, W, p2
+
+
+def reference_flake(grid, i, c, scale=0):
+    """FlakeBuilder's recursion, one insert_cell or fill per leaf"""
+    if i == 0:
+        grid.insert_cell(c)
+        return
+    elif i <= scale:
+        grid.fill(p2(i + 1), c)
+        return
+
+    for direction in (E, N, W, S, UP, DOWN):
+        reference_flake(grid, i - 1, c + p2(i - 1) * 2 * direction, scale)
+
+
+class TestFlakeKernel:
+    """The kernel should insert the same cells as recursing down to every leaf."""
+
+    @pytest.mark.parametrize("depth", range(5))
+    @pytest.mark.parametrize("scale", [0, 1, 2])
+    @pytest.mark.parametrize("center", [OctoVector(), OctoVector(4, -2, 6), OctoVector(1, 1, 3)])
+    def test_matches_recursion(self, depth, scale, center):
+        """Flakes of every depth and scale, off the origin and off the lattice too, should match."""
+        expected = OctoGrid()
+        reference_flake(expected, depth, center, scale)
+
+        grid = FlakeKernel.insert_flake(OctoGrid(), center, depth, scale=scale)
+
+        assert state(grid) == state(expected)
+
+    def test_solid(self):
+        """A solid flake should fill the extent of the fractal one."""
+        offsets = FlakeKernel.flake_offsets(3, "solid")
+        fractal = FlakeKernel.flake_offsets(3)
+
+        assert np.array_equal(np.sort(Lattice.pack(offsets)), Lattice.pack(offsets))
+        assert Lattice.contains(Lattice.pack(offsets), Lattice.pack(fractal)).all()
+        assert np.abs(offsets).sum(axis=1).max() == np.abs(fractal).sum(axis=1).max()
+
+    def test_cached(self):
+        """Offsets should be expanded once per depth, shape and scale, and not be writable."""
+        offsets = FlakeKernel.flake_offsets(4)
+
+        assert FlakeKernel.flake_offsets(4) is offsets
+        assert len(offsets) == 6 ** 4
+        with pytest.raises(ValueError):
+            offsets[0, 0] = 1
+
+    def test_many_centers(self):
+        """flake_centers should translate one flake to every center."""
+        centers = np.array([[0, 0, 0], [40, 0, 0], [0, 40, 8]])
+
+        cells = FlakeKernel.flake_centers(centers, 2)
+
+        assert np.array_equal(cells.reshape(3, -1, 3) - centers[:, None],
+                              np.broadcast_to(FlakeKernel.flake_offsets(2), (3, 36, 3)))
+
+    def test_builders(self):
+        """FlakeBuilder and RecipeBuilder layers should be the kernel's flakes."""
+        flake = FlakeBuilder(3, center=OctoVector(2, 0, 0)).materialize()
+        layer = RecipeBuilder(layers=[{"depth": 3}]).materialize()
+
+        assert np.array_equal(np.sort(Lattice.pack(flake.centers)),
+                              Lattice.pack(FlakeKernel.flake_offsets(3) + (2, 0, 0)))
+        assert np.array_equal(np.sort(Lattice.pack(layer.centers)),
+                              Lattice.pack(FlakeKernel.flake_offsets(3)))
+
+
+BOXES = [clip_box(z_min=0), clip_box(x_min=-5, z_min=3, z_max=40), clip_box(x_min=7, x_max=7),
+         clip_box(z_min=500)]
+
+BUILDERS = {
+    "flake": lambda: FlakeBuilder(4, OctoVector(1, 1, 3), scale=1),
+    "evil_tower": lambda: EvilTower(4),
+    "hollow_tower": lambda: HollowTower(3),
+    "recipe": lambda: RecipeBuilder(layers=[{"depth": 3, "spawn": ["out", "side"], "bloom": True},
+                                            {"depth": 2}]),
+}
+
+
+class TestClip:
+    """Clipped flakes and builders should give the same cells as cropping afterwards."""
+
+    @pytest.mark.parametrize("shape, scale", [("fractal", 0), ("fractal", 2), ("solid", 0)])
+    @pytest.mark.parametrize("box", BOXES)
+    def test_flake_centers(self, shape, scale, box):
+        """Only the cells inside the box should be left, bounds included."""
+        centers = np.array([[0, 0, 0], [1, 1, 3]])
+        cells = FlakeKernel.flake_centers(centers, 4, shape, scale)
+        inside = cells[FlakeKernel.in_box(cells, *box)]
+
+        clipped = FlakeKernel.flake_centers(centers, 4, shape, scale, clip=box)
+
+        assert np.array_equal(np.sort(Lattice.pack(clipped)), np.sort(Lattice.pack(inside)))
+
+    @pytest.mark.parametrize("builder", BUILDERS.values(), ids=BUILDERS.keys())
+    @pytest.mark.parametrize("box", BOXES)
+    def test_builders(self, builder, box):
+        """materialize with a clip box should crop, flags included, like OctoGrid.crop."""
+        (x_min, y_min, z_min), (x_max, y_max, z_max) = box
+        expected = builder().materialize().crop(x_min, x_max, y_min, y_max, z_min, z_max)
+        eager = builder().materialize_additive(clip=box)
+        eager.crop(x_min, x_max, y_min, y_max, z_min, z_max)
+
+        assert state(builder().materialize(clip=box)) == state(expected)
+        assert state(eager) == state(expected)
@@ -0,0 +1,124 @@
+"""Tests for lazy grid expressions."""
+import numpy as np
+import pytest
+
+from octohedra.builders.FlakeBuilder import FlakeBuilder
+from octohedra.grid import GridExpression, Lattice, Symmetry
+from octohedra.grid.ColumnarGrid import ColumnarGrid
+from octohedra.grid.GridExpression import Crop, Flake, Symmetric, Translate, Union
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.tests.conftest import recipe_builder, state
+
+
+def evaluated(expression):
+    return expression.materialize_into(OctoGrid())
+
+
+class TestGridExpression:
+    """Expressions should evaluate to the cells eager building and grid operations give."""
+
+    @pytest.mark.parametrize("name", ["flake", "tower", "evil_tower", "flower", "temple_complex"])
+    def test_recipes_match(self, name):
+        """A recipe's expression should build the same cells as materialize_into."""
+        expected = recipe_builder(name).materialize_into(OctoGrid())
+        assert state(evaluated(recipe_builder(name).expression())) == state(expected)
+
+    def test_flake_builder(self):
+        """materialize should go through the expression and still give the same cells."""
+        builder = FlakeBuilder(3, center=OctoVector(4, -2, 6), scale=1)
+        assert state(builder.materialize()) == state(builder.materialize_additive())
+
+    @pytest.mark.parametrize("name", ["flake", "evil_tower", "temple_complex"])
+    @pytest.mark.parametrize("six_way", [False, True])
+    def test_symmetry_and_crop_match(self, name, six_way):
+        """Symmetries and crops should match the grid operations, crop flags included."""
+        expected = recipe_builder(name).materialize_into(OctoGrid())
+        expression = recipe_builder(name).expression()
+        if six_way:
+            expected.six_way()
+            expression = Symmetric(expression, Symmetry.six_way())
+        expected.crop(x_min=-6, z_min=0, z_max=24)
+
+        actual = evaluated(Crop.box(expression, x_min=-6, z_min=0, z_max=24))
+        assert state(actual) == state(expected)
+
+    def test_crop_through_symmetry(self):
+        """A crop should move below a symmetry that keeps its box, and give the same cells."""
+        stages = Symmetry.four_way((2, 0, 0))
+        expression = Crop.box(Symmetric(recipe_builder("evil_tower").expression(), stages),
+                              z_min=0)
+        expected = recipe_builder("evil_tower").materialize_into(OctoGrid())
+        expected.four_way(OctoVector(2, 0, 0))
+        expected.crop(z_min=0)
+
+        simplified = expression.simplified()
+        assert isinstance(simplified, Symmetric) and simplified.copies
+        assert state(evaluated(expression)) == state(expected)
+
+    def test_crop_pruning(self):
+        """Crops should vanish from sub-trees clear of their faces, along with sub-trees outside."""
+        flake = Flake.of(2)
+        assert Crop.box(flake, z_min=100).simplified() is GridExpression.EMPTY
+        assert Crop.box(flake, z_min=-100).simplified() is flake
+
+        simplified = Crop.box(Translate(flake, [(0, 0, 0), (0, 0, 40), (0, 0, 200)]),
+                              z_max=40).simplified()
+        inside, across = simplified.children
+        assert inside is flake
+        assert isinstance(across.child, Crop) and across.offsets.tolist() == [[0, 0, 40]]
+        assert len(simplified) == len(flake) + np.count_nonzero(flake.evaluate()[0][:, 2] <= 0)
+
+    def test_union_folds_translations(self):
+        """A union of one sub-tree at several places should become one translation."""
+        offsets = [(8, 0, 0), (0, 8, 0), (-8, 0, 0)]
+        union = Union(*(Translate(Flake.of(2), [offset]) for offset in offsets))
+        simplified = union.simplified()
+
+        assert isinstance(simplified, Translate) and simplified.child is Flake.of(2)
+        assert len(simplified.offsets) == 3
+        assert np.array_equal(simplified.evaluate()[0], union.evaluate()[0])
+
+    def test_bounds_hold_cells(self):
+        """bounds should hold every cell, through symmetries and crops."""
+        expression = Crop.box(Symmetric(recipe_builder("flower").expression(),
+                                        Symmetry.six_way()), z_min=0)
+        centers, _ = expression.evaluate()
+        low, high = expression.bounds()
+        assert (centers >= low).all() and (centers <= high).all()
+
+    def test_columnar(self):
+        """Expressions should materialize into a ColumnarGrid with the same cells and flags."""
+        expression = Crop.box(recipe_builder("flower").expression(), z_min=0)
+        columnar = expression.materialize_into(ColumnarGrid())
+        grid = evaluated(expression)
+
+        assert np.array_equal(columnar.keys, np.sort(Lattice.pack(grid.centers)))
+        assert columnar.flags.tolist() == [Lattice.flags_of(grid.occ[OctoVector(*center)])
+                                           for center in columnar.centers.tolist()]
+
+    @pytest.mark.parametrize("name", ["flake", "evil_tower", "temple_complex"])
+    @pytest.mark.parametrize("six_way", [False, True])
+    def test_profile(self, name, six_way):
+        """Profiles should count every cell at its height, and only overlaps more than once."""
+        expression = recipe_builder(name).expression()
+        if six_way:
+            expression = Symmetric(expression, Symmetry.six_way())
+        expression = Crop.box(expression, z_min=0)
+        centers, _ = expression.evaluate()
+
+        z, counts = expression.profile()
+        exact = np.bincount(centers[:, 2] - z, minlength=len(counts))
+        assert z == centers[:, 2].min() and len(counts) == len(exact)
+        assert (counts >= exact).all()
+        assert (counts == exact).all() == (name == "flake" or six_way)
+
+    def test_profile_of_translations(self):
+        """Separate copies should add up, by height."""
+        flake = Flake.of(2)
+        copies = Crop.box(Translate(flake, [(0, 0, 0), (40, 0, 3), (0, 40, 3)]), z_max=4)
+
+        z, counts = copies.profile()
+        centers, _ = copies.evaluate()
+        assert copies.count() == len(centers)
+        assert np.array_equal(counts, np.bincount(centers[:, 2] - z))
@@ -0,0 +1,64 @@
+"""Tests for HCVArray, batches of half-integer coordinates."""
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from octohedra.utils.HCVArray import HCVArray
+from octohedra.utils.HCVector import HCV
+
+POINTS = [HCV(1.5, 2, 3), HCV(0.5, -0.5, 5.5), HCV(-4, 0, 0.5)]
+
+
+class TestHCVArray:
+    """HCVArray should give the same results as HCV, one batch at a time."""
+
+    def test_assignment(self):
+        """Numbers, Fractions, strings and HCVs should all be accepted and stored doubled."""
+        assert HCVArray([1.5, "-1", Fraction(1, 2)]).doubled.tolist() == [[3, -2, 1]]
+        assert HCVArray(np.arange(6).reshape(2, 3)).doubled.tolist() == [[0, 2, 4], [6, 8, 10]]
+        assert HCVArray(POINTS).doubled.tolist() == HCVArray.from_hcvs(POINTS).doubled.tolist()
+        assert len(HCVArray()) == 0
+
+    def test_round_trip(self):
+        """Converting to HCVs and back should give the same points."""
+        array = HCVArray.from_hcvs(POINTS)
+
+        assert array.to_hcvs() == POINTS
+        assert list(array) == POINTS
+        assert array[1] == POINTS[1]
+        assert array[1:].to_hcvs() == POINTS[1:]
+
+    @pytest.mark.parametrize("values", [(1.49999, 0, 0), ("abc", 0, 0)])
+    def test_validation(self, values):
+        """Values HCV rejects should be rejected too."""
+        with pytest.raises(ValueError):
+            HCV(*values)
+        with pytest.raises(ValueError):
+            HCVArray(values)
+
+    def test_rounding_accepted(self):
+        """Values very close to half-integers should snap to them, as in HCV."""
+        assert HCVArray((1.000000000001, 0, 0)).to_hcvs() == [HCV(1.000000000001, 0, 0)]
+
+    def test_operations(self):
+        """Add, neg and mul should match HCV point by point."""
+        array = HCVArray.from_hcvs(POINTS)
+        other = [HCV(3, 2, 3), HCV(1, 1, 1), HCV(-0.5, 2, 4)]
+
+        sums = [a + b for a, b in zip(POINTS, other)]
+
+        assert (array + HCVArray.from_hcvs(other)).to_hcvs() == sums
+        assert (array + (1, 0.5, 0)).to_hcvs() == [p + (1, 0.5, 0) for p in POINTS]
+        assert (-array).to_hcvs() == [-p for p in POINTS]
+        assert (2 * array).to_hcvs() == (array * 2).to_hcvs() == [p * 2 for p in POINTS]
+        assert (array * (2, 4, 2)).to_hcvs() == [p * (2, 4, 2) for p in POINTS]
+
+    def test_quarters_raise(self):
+        """Products that land on quarters should raise like HCV does."""
+        with pytest.raises(ValueError):
+            HCV(0.5, 0, 0) * 0.5
+        with pytest.raises(ValueError):
+            HCVArray.from_hcvs(POINTS) * 0.5
+        with pytest.raises(ValueError):
+            HCVArray.from_hcvs(POINTS) * HCVArray.from_hcvs(POINTS)
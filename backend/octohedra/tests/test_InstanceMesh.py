@@ -0,0 +1,86 @@
+"""Tests for rendering instance plans once per template."""
+import math
+
+import numpy as np
+import pytest
+
+from octohedra.builders.CuboctahedronBuilder import CuboctahedronBuilder
+from octohedra.builders.InstancePlan import compile_builder, compile_expression
+from octohedra.builders.StarBuilder import StarBuilder
+from octohedra.builders.TowerBuilders import EvilTower, FlowerTower, Tower
+from octohedra.grid import GridExpression, InstanceMesh
+from octohedra.grid.ColumnarGrid import ColumnarGrid
+from octohedra.tests.conftest import recipe_builder
+from octohedra.utils import OctoConfigs
+
+CONFIG = OctoConfigs.config_20_rainbow_speed
+
+BUILDERS = [Tower(3), EvilTower(3, elevate_base=True), FlowerTower(3), StarBuilder(3),
+            CuboctahedronBuilder(3)]
+
+
+def triangles(mesh):
+    """Every face as its three rounded corners, starting from the lowest, in a sorted list"""
+    faces = []
+    for corners in np.round(mesh.vertices, 5)[mesh.faces].tolist():
+        first = corners.index(min(corners))
+        faces.append(tuple(map(tuple, corners[first:] + corners[:first])))
+    return sorted(faces)
+
+
+def grid_mesh(plan):
+    """The mesh of the plan's grid, trimmed and rendered whole"""
+    grid = plan.materialize_into(ColumnarGrid())
+    grid.compute_trimming(mode="auto")
+    return grid.render(CONFIG)
+
+
+def assert_same_mesh(actual, expected):
+    assert len(actual.vertices) == len(expected.vertices)
+    assert triangles(actual) == triangles(expected)
+
+
+class TestInstanceMesh:
+    """Reusing template meshes should give the mesh of the whole grid, vertex for vertex."""
+
+    @pytest.mark.parametrize("builder", BUILDERS, ids=lambda builder: str(builder))
+    @pytest.mark.parametrize("cropped", [False, True])
+    def test_matches_grid(self, builder, cropped):
+        """Seams between instances and at crop faces should be trimmed against the whole grid."""
+        plan = compile_builder(builder)
+        if cropped and plan.clip is None:
+            plan.clip = ((-math.inf, -math.inf, 0), (math.inf, 6, math.inf))
+        assert_same_mesh(plan.render(CONFIG), grid_mesh(plan))
+
+    @pytest.mark.parametrize("name", ["evil_tower", "flower"])
+    def test_recipes(self, name):
+        """Recipes should compile and render the same way, sub-structures and all."""
+        expression = recipe_builder(name).expression()
+        plan = compile_expression(GridExpression.Crop.box(expression, z_min=0))
+        assert_same_mesh(plan.render(CONFIG), grid_mesh(plan))
+
+    def test_whole_grid_past_seam_share(self, monkeypatch):
+        """Grids that are nearly all seams should be rendered whole, to the same mesh."""
+        plan = compile_builder(EvilTower(3))
+        monkeypatch.setattr(InstanceMesh, "MAX_SEAM_SHARE", 0.0)
+        assert_same_mesh(plan.render(CONFIG), grid_mesh(plan))
+
+    def test_templates_reused(self):
+        """Instances whose translations agree mod 4 should share one template mesh."""
+        InstanceMesh.TEMPLATE_MESHES.clear()
+        plan = compile_builder(Tower(2))
+        plan.instances = {(2, "fractal", 0): np.array([[0, 0, 0], [40, 0, 0], [0, 80, 4]])}
+        plan.render(CONFIG)
+        assert len(InstanceMesh.TEMPLATE_MESHES) == 1
+
+
+class TestSeams:
+    """Seams should hold every cell within reach of another instance."""
+
+    def test_near_blocks(self):
+        """Cells within SEAM_REACH of each other should see each other's values."""
+        reach = InstanceMesh.SEAM_REACH
+        cells = np.array([[0, 0, 0], [reach, -reach, reach], [3 * reach, 0, 0]])
+        low, high = InstanceMesh.near_blocks(cells // reach, np.arange(3))
+        assert low.tolist()[:2] == [0, 0] and high.tolist()[:2] == [1, 1]
+        assert low[2] == high[2] == 2
@@ -0,0 +1,105 @@
+"""Tests for compiling builder trees into flat instance plans."""
+import numpy as np
+import pytest
+
+from octohedra.builders import InstancePlan as plans
+from octohedra.builders.CuboctahedronBuilder import CuboctahedronBuilder
+from octohedra.builders.InstancePlan import InstancePlan, cached_plan, compile_builder, plan_key
+from octohedra.builders.OctoSectorBuilder import OctoSectorBuilder
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.builders.StarBuilder import StarBuilder
+from octohedra.builders.TempleComplexBuilder import TempleComplexBuilder
+from octohedra.builders.TowerBuilders import EvilTower, EvilTowerX, FlowerTower, Tower, TowerX
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.tests.conftest import recipe_builder, state
+from octohedra.utils.LruCache import LruCache
+
+BUILDERS = [
+    (Tower, (3,), {}),
+    (EvilTower, (3,), {"elevate_base": True}),
+    (FlowerTower, (3,), {}),
+    (TowerX, (), {"base_i": 3}),
+    (EvilTowerX, (), {"base_i": 3}),
+    (TempleComplexBuilder, (3, 1), {}),
+    (StarBuilder, (3, OctoVector(2, 0, 0)), {"length": 2}),
+    (CuboctahedronBuilder, (), {"iteration": 2}),
+]
+
+
+class TestCompile:
+    """Plans should build the cells their builders do, with every flake placed once."""
+
+    @pytest.mark.parametrize("cls, args, kwargs", BUILDERS)
+    def test_matches_builder(self, cls, args, kwargs):
+        """Executing the plan should give the builder's own cells, crop flags included."""
+        builder = cls(*args, **kwargs)
+        plan = compile_builder(builder)
+        assert state(plan.materialize_into(OctoGrid())) == state(builder.materialize_additive())
+
+    def test_deduplicated(self):
+        """Flakes placed twice by different branches should be one instance."""
+        tower = Tower(2)
+        tower.add_child(Tower(2))
+        plan = compile_builder(tower)
+        assert len(plan) == len(compile_builder(Tower(2))) == 2
+
+    def test_uncompilable(self):
+        """Builders without an expression can't be flattened."""
+        with pytest.raises(plans.NotCompilable):
+            compile_builder(OctoSectorBuilder(iteration=2))
+
+
+class TestCache:
+    """Plans should be saved per builder parameters and loaded without building again."""
+
+    @pytest.mark.parametrize("cls, args, kwargs", [BUILDERS[2], BUILDERS[-1]])
+    def test_round_trip(self, cls, args, kwargs, tmp_path):
+        """Saving and loading should keep every instance and the crop box."""
+        plan = compile_builder(cls(*args, **kwargs))
+        plan.save(tmp_path / "plan.npz")
+        loaded = InstancePlan.load(tmp_path / "plan.npz")
+
+        assert loaded.clip == plan.clip
+        assert loaded.instances.keys() == plan.instances.keys()
+        assert all(np.array_equal(loaded.instances[t], plan.instances[t]) for t in plan.instances)
+
+    def test_loads_without_building(self, tmp_path, monkeypatch):
+        """A plan on disk should be used as is, without constructing the builder."""
+        monkeypatch.setattr(plans, "PLANS", LruCache(16))
+        expected = cached_plan(EvilTower, 3, plan_dir=tmp_path)
+        assert len(list(tmp_path.glob("*.npz"))) == 1
+
+        monkeypatch.setattr(plans, "PLANS", LruCache(16))
+        monkeypatch.setattr(plans, "compile_builder", None)
+        loaded = cached_plan(EvilTower, 3, plan_dir=tmp_path)
+        assert state(loaded.materialize_into(OctoGrid())) == \
+            state(expected.materialize_into(OctoGrid()))
+
+    def test_recipes(self, tmp_path, monkeypatch):
+        """Recipes should be cached by their layers, as the generation service renders them."""
+        monkeypatch.setattr(plans, "PLANS", LruCache(16))
+        builder = recipe_builder("flower")
+        plan = cached_plan(RecipeBuilder, layers=builder.layers, grid_depth=builder.grid_depth,
+                           grid_min_depth=builder.grid_min_depth, plan_dir=tmp_path)
+
+        assert state(plan.materialize_into(OctoGrid())) == \
+            state(compile_builder(builder).materialize_into(OctoGrid()))
+        assert len(list(tmp_path.glob("*.npz"))) == 1
+
+    def test_plan_key(self):
+        """Keys should follow the parameters, not how they're spelled."""
+        assert plan_key(Tower, 3, OctoVector(1, 0, 0)) == plan_key(Tower, 3, (1, 0, 0))
+        assert plan_key(Tower, 3) != plan_key(Tower, 4)
+        assert plan_key(Tower, 3) != plan_key(TowerX, 3)
+        assert plan_key(FlowerTower, 3, growth_dirs={(1, 0), (0, 1)}) == \
+            plan_key(FlowerTower, 3, growth_dirs={(0, 1), (1, 0)})
+
+    def test_plan_key_follows_source(self, monkeypatch):
+        """Changing the builders' or kernel's code should change every key, so stale plans on
+        disk are never loaded."""
+        key = plan_key(Tower, 3)
+        assert plans.source_hash.__wrapped__() == plans.source_hash()
+
+        monkeypatch.setattr(plans, "source_hash", lambda: "edited")
+        assert plan_key(Tower, 3) != key
@@ -0,0 +1,27 @@
+"""Tests for the bounded memo dict."""
+from octohedra.utils.LruCache import LruCache
+
+
+class TestLruCache:
+    """Only the most recently used entries should stay."""
+
+    def test_evicts_least_recently_used(self):
+        """Reading an entry should keep it over ones that were written later."""
+        cache = LruCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        assert cache["a"] == 1
+
+        cache["c"] = 3
+        assert list(cache) == ["a", "c"]
+
+    def test_get_and_setdefault(self):
+        """get and setdefault should count as uses and never grow past maxsize."""
+        cache = LruCache(2)
+        assert cache.setdefault("a", 1) == 1
+        assert cache.setdefault("a", 5) == 1
+        cache["b"] = 2
+        assert cache.get("a") == 1 and cache.get("z") is None
+
+        cache.setdefault("c", 3)
+        assert list(cache) == ["a", "c"]
@@ -0,0 +1,351 @@
+"""Tests for the array-based operations of the dict-backed OctoGrid."""
+from dataclasses import FrozenInstanceError
+
+import numpy as np
+import pytest
+
+from octohedra.builders.FlakeBuilder import FlakeBuilder
+from octohedra.builders.OctoSectorBuilder import DSW, UNE, USE, OctoSectorBuilder
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.grid import Lattice
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.utils import OctoConfigs
+from octohedra.utils.OctoUtil import p2
+
+
+def cell_kinds(grid):
+    return {center: Lattice.kind_of(cell) for center, cell in grid.occ.items()}
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    return rng.integers(-9, 10, size=(500, 3))
+
+
+class TestInsertCells:
+    """Bulk insertion should match inserting the same centers one at a time."""
+
+    @pytest.mark.parametrize("options", [
+        dict(),
+        dict(strict=True),
+        dict(octo_only=True),
+        dict(tetra_only=True),
+        dict(strict=True, tetra_only=True),
+    ])
+    def test_matches_insert_cell(self, points, options):
+        """Every kind of cell, including the non-strict fallbacks, should match."""
+        expected = OctoGrid()
+        for x, y, z in points.tolist():
+            expected.insert_cell(OctoVector(x, y, z), **options)
+
+        grid = OctoGrid()
+        grid.insert_cells(points, **options)
+
+        assert cell_kinds(grid) == cell_kinds(expected)
+        assert list(grid.occ) == list(expected.occ)
+
+    def test_kind_table_matches_cell_kind(self, points):
+        """The lookup table should agree with the scalar rules on negative coordinates too."""
+        kinds = Lattice.classify(points)
+
+        assert kinds.tolist() == [Lattice.cell_kind(*p) for p in points.tolist()]
+
+    def test_rejects_fractional_centers(self):
+        """Centers that aren't integers can't be classified."""
+        with pytest.raises(ValueError):
+            OctoGrid().insert_cells([(0.5, 0, 0)])
+
+    @pytest.mark.parametrize("radius", [0, 1, 4, 7])
+    def test_fill(self, radius):
+        """fill should cover the open L1 ball around its center."""
+        center = OctoVector(3, -2, 1)
+        expected = OctoGrid()
+        for x in range(-radius, radius + 1):
+            for y in range(-radius, radius + 1):
+                for z in range(-radius, radius + 1):
+                    if abs(x) + abs(y) + abs(z) < radius:
+                        expected.insert_cell(center + OctoVector(x, y, z))
+
+        grid = OctoGrid()
+        grid.fill(radius, center)
+
+        assert cell_kinds(grid) == cell_kinds(expected)
+
+        grid.fill(radius, center, clear=True)
+        assert not grid.occ
+
+    @pytest.mark.parametrize("orientation", [UNE, USE, DSW])
+    def test_fill_sector(self, orientation):
+        """Sectors should hold the octos of the corner simplex in the orientation's axes."""
+        ox, oy, oz = (OctoVector(*axis) for axis in orientation.tolist())
+        center = OctoVector(4, 0, 2)
+        expected = OctoGrid()
+        for x in range(p2(3) + 1):
+            for y in range(p2(3) + 1):
+                for z in range(p2(3) + 1):
+                    if x + y + z < p2(3):
+                        expected.insert_cell(ox * x + oy * y + oz * z + center, octo_only=True)
+
+        grid = OctoGrid()
+        OctoSectorBuilder().fill_sector(grid, 3, center, orientation)
+
+        assert cell_kinds(grid) == cell_kinds(expected)
+
+
+def reference_crop(grid, bounds):
+    """The cell-by-cell crop, for comparison"""
+    x_min, x_max, y_min, y_max, z_min, z_max = bounds
+    faces = (("x", x_min, x_max, "crop_west", "crop_east"),
+             ("y", y_min, y_max, "crop_south", "crop_north"),
+             ("z", z_min, z_max, "crop_bottom", "crop_top"))
+    kept = {}
+    for center, cell in grid.occ.items():
+        inside = True
+        flags = Lattice.flags_of(cell)
+        for axis, low, high, low_flag, high_flag in faces:
+            value = getattr(center, axis)
+            if value == low:
+                flags |= Lattice.FLAGS[low_flag]
+            if value == high:
+                flags |= Lattice.FLAGS[high_flag]
+            inside = inside and low <= value <= high
+        if inside:
+            kept[center] = Lattice.shared_cell(Lattice.kind_of(cell), flags)
+    grid.occ = kept
+    return grid
+
+
+def cell_flags(grid):
+    return {center: Lattice.flags_of(cell) for center, cell in grid.occ.items()}
+
+
+@pytest.fixture
+def ball():
+    grid = OctoGrid()
+    grid.fill(7, OctoVector(1, 1, 1))
+    return grid
+
+
+class TestMasks:
+    """Mask-based crop, carve, keep_octo and split should match the cell-by-cell versions."""
+
+    @pytest.mark.parametrize("bounds", [
+        (-np.inf, np.inf, -np.inf, np.inf, 0, np.inf),
+        (-3, 2, -np.inf, 4, -2, 5),
+        (10, 20, -np.inf, np.inf, -np.inf, np.inf),
+    ])
+    def test_crop(self, ball, bounds):
+        """Crop should drop the same cells and flag the same faces."""
+        expected = OctoGrid()
+        expected.fill(7, OctoVector(1, 1, 1))
+        reference_crop(expected, bounds)
+
+        ball.crop(*bounds)
+
+        assert cell_flags(ball) == cell_flags(expected)
+        assert list(ball.occ) == list(expected.occ)
+
+    def test_carve(self, ball):
+        """Carve should remove exactly the cells inside the prism."""
+        before = set(ball.occ)
+
+        ball.carve(-2, 3, 0, 4, -10, 1)
+
+        assert set(ball.occ) == {c for c in before
+                                 if not (-2 <= c.x <= 3 and 0 <= c.y <= 4 and c.z <= 1)}
+
+    def test_keep_octo(self, ball):
+        """keep_octo should keep the cells within m of the center in both yz and zx."""
+        before = set(ball.occ)
+
+        ball.keep_octo(3, OctoVector(1, 0, 0))
+
+        assert set(ball.occ) == {c for c in before
+                                 if abs(c.y) + abs(c.z) <= 3 and abs(c.z) + abs(c.x - 1) <= 3}
+        assert all(isinstance(center, OctoVector) for center in ball.occ)
+
+    def test_split(self, ball):
+        """Split should crop both halves at the split plane and flag the cut faces."""
+        before = set(ball.occ)
+
+        above, below = ball.split(2)
+
+        assert set(above.occ) == {c for c in before if c.z >= 2}
+        assert set(below.occ) == {c for c in before if c.z <= 2}
+        assert all(getattr(cell, "crop_bottom", False) == (c.z == 2)
+                   for c, cell in above.occ.items())
+        assert all(getattr(cell, "crop_top", False) == (c.z == 2) for c, cell in below.occ.items())
+
+
+class TestMerge:
+    """Merging and materializing write into one grid instead of copying between grids."""
+
+    def test_merge_in_place(self, ball):
+        """Merge should keep the same dict, with the other grid's cells winning."""
+        occ = ball.occ
+        other = OctoGrid()
+        other.insert_cells([(1, 1, 1), (40, 0, 0)])
+
+        ball.merge(other)
+
+        assert ball.occ is occ
+        assert ball.occ[OctoVector(1, 1, 1)] is other.occ[OctoVector(1, 1, 1)]
+        assert OctoVector(40, 0, 0) in ball.occ
+
+    def test_materialize_into(self):
+        """Builders writing into a shared grid should give the same cells as merging their grids."""
+        builders = [RecipeBuilder(layers=[{"depth": 2, "spawn": ["out"], "bloom": True}]),
+                    FlakeBuilder(2, OctoVector(8, 0, 0))]
+
+        expected = OctoGrid()
+        for builder in builders:
+            expected.merge(builder.materialize_additive())
+
+        grid = OctoGrid()
+        for builder in builders:
+            builder.materialize_into(grid)
+
+        assert cell_kinds(grid) == cell_kinds(expected)
+
+
+def trimmed_flags(grid):
+    """Flags from a full trimming pass over a copy of the grid"""
+    copy = OctoGrid()
+    copy.insert_cells(grid.centers)
+    copy.compute_trimming()
+    return {center: Lattice.flags_of(cell) & Lattice.TRIM_MASK for center, cell in copy.occ.items()}
+
+
+class TestUpdateTrimming:
+    """Incremental trimming should keep the same flags as trimming everything again."""
+
+    def test_first_update_trims_everything(self, ball):
+        """Without a previous pass, every cell is trimmed and reported."""
+        assert ball.update_trimming() == set(ball.occ)
+        trimmed = {c: f & Lattice.TRIM_MASK for c, f in cell_flags(ball).items()}
+        assert trimmed == trimmed_flags(ball)
+
+    @pytest.mark.parametrize("edit", [
+        lambda grid: grid.insert_cells([(9, 1, 1), (7, 1, 1), (1, 1, 9), (3, 3, 3)]),
+        lambda grid: grid.carve(-2, 3, 0, 4, -10, 1),
+        lambda grid: grid.crop(z_min=0),
+        lambda grid: grid.fill(3, OctoVector(1, 1, 1), clear=True),
+        lambda grid: grid.merge(FlakeBuilder(2, OctoVector(12, 0, 0)).materialize_additive()),
+        lambda grid: grid.reflect_x(),
+    ])
+    def test_matches_full_trim(self, ball, edit):
+        """After an edit, flags should match a full pass, and every cell whose flags changed
+        should be reported."""
+        ball.compute_trimming()
+        before = cell_flags(ball)
+
+        edit(ball)
+        updated = ball.update_trimming()
+
+        after = cell_flags(ball)
+        assert {c: f & Lattice.TRIM_MASK for c, f in after.items()} == trimmed_flags(ball)
+        assert {c for c, f in after.items() if before.get(c) != f} <= updated
+        assert updated <= set(ball.occ)
+        assert ball.update_trimming() == set()
+
+
+class TestSharedCells:
+    """Cells are shared per state, so changing one center's cell must not change any other."""
+
+    def test_cells_are_shared(self, ball):
+        """A trimmed grid should hold one cell object per distinct state."""
+        ball.compute_trimming()
+
+        states = {Lattice.state_of(cell) for cell in ball.occ.values()}
+        assert len({id(cell) for cell in ball.occ.values()}) == len(states)
+        assert all(Lattice.shared_cell(s >> Lattice.STATE_BITS, s & Lattice.STATE_FLAGS) is cell
+                   for cell in ball.occ.values() for s in (Lattice.state_of(cell),))
+
+    def test_shared_cells(self):
+        """shared_cells should give the same cells as looking each state up on its own."""
+        kinds = np.array([Lattice.OCTO, Lattice.TETRA, Lattice.OCTO, Lattice.OCTO])
+        flags = np.array([0, 0, Lattice.FLAGS["crop_top"], 0])
+
+        cells = Lattice.shared_cells(kinds, flags)
+
+        assert all(cell is Lattice.shared_cell(kind, flag)
+                   for cell, kind, flag in zip(cells, kinds.tolist(), flags.tolist()))
+
+    def test_edits_stay_local(self, ball):
+        """Cropping and trimming one grid should leave another grid's cells alone."""
+        other = OctoGrid()
+        other.fill(7, OctoVector(1, 1, 1))
+        before = cell_flags(other)
+
+        ball.crop(z_min=0)
+        ball.compute_trimming()
+
+        assert cell_flags(other) == before
+        assert not any(before.values())
+
+    def test_shared_cells_are_frozen(self, ball):
+        """Changing a shared cell in place should raise instead of editing every grid's cells."""
+        cell = ball.occ[OctoVector(0, 0, 0)]
+
+        with pytest.raises(FrozenInstanceError):
+            cell.crop_top = True
+        with pytest.raises(FrozenInstanceError):
+            cell.trim(OctoVector(0, 0, 0), set(ball.occ))
+
+        fresh = Lattice.make_cell(Lattice.kind_of(cell), 0)
+        fresh.crop_top = True
+        assert fresh.crop_top and not cell.crop_top
+
+    def test_render_cache_keys(self, ball):
+        """Rendered cells should be cached by state."""
+        ball.crop(z_min=0)
+        ball.compute_trimming()
+
+        ball.render(OctoConfigs.default)
+
+        assert all(isinstance(key, int) for key in ball.cache)
+        assert len(ball.cache) == len({Lattice.render_state(Lattice.state_of(cell))
+                                       for cell in ball.occ.values()})
+
+
+@pytest.fixture
+def other():
+    grid = OctoGrid()
+    grid.fill(5, OctoVector(5, -1, 3))
+    grid.crop(z_min=1)
+    return grid
+
+
+class TestSetAlgebra:
+    """Set operations should match Python set operations on the centers."""
+
+    @pytest.mark.parametrize("operation, expected", [
+        ("union", set.union),
+        ("intersection", set.intersection),
+        ("difference", set.difference),
+        ("symmetric_difference", set.symmetric_difference),
+    ])
+    def test_matches_sets(self, ball, other, operation, expected):
+        """Same centers, with every cell taken from the grid that has it (other's on overlap)."""
+        ours, theirs = dict(ball.occ), dict(other.occ)
+
+        result = getattr(ball, operation)(other)
+
+        assert result is ball
+        assert set(ball.occ) == expected(set(ours), set(theirs))
+        for center, cell in ball.occ.items():
+            assert cell is (theirs[center] if center in theirs and operation != "intersection"
+                            else ours[center])
+
+    def test_operators(self, ball, other):
+        """The operators should be the same operations."""
+        expected = set(ball.occ) - set(other.occ)
+
+        assert set((ball - other).occ) == expected
+
+    def test_contains(self, ball, points):
+        """Batch membership should agree with the dict."""
+        assert ball.contains(points).tolist() == [OctoVector(*p) in ball.occ
+                                                  for p in points.tolist()]
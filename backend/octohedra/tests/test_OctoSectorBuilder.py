@@ -0,0 +1,87 @@
+"""Tests for the array-based sector layout of OctoSectorBuilder."""
+import numpy as np
+import pytest
+
+from octohedra.builders import OctoSectorBuilder as sectors
+from octohedra.builders.OctoSectorBuilder import (DNE, DNW, DSE, DSW, UNE, UNW, USE, USW,
+                                                  OctoSectorBuilder, flip_z, turn_left,
+                                                  turn_right)
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.tests.conftest import state
+from octohedra.utils.OctoUtil import p2
+
+ORIENTATIONS = [UNE, UNW, USW, USE, DNE, DNW, DSW, DSE]
+
+# The old lookup tables the turns replace
+LEFT_OF = {0: 1, 1: 2, 2: 3, 3: 0, 4: 7, 5: 4, 6: 5, 7: 6}
+FLIP_OF = {0: 4, 1: 5, 2: 6, 3: 7, 4: 0, 5: 1, 6: 2, 7: 3}
+
+
+def reference_sector(grid, i, base_i, center, orientation):
+    """The recursion the layout replaces, one sector at a time"""
+    if i == base_i:
+        OctoSectorBuilder().fill_sector(grid, i, center, orientation)
+        return
+    ox, oy, oz = (OctoVector(*axis) * p2(i) for axis in orientation.tolist())
+    for offset, turned in ((ox, orientation), (oy, orientation), (oz, orientation),
+                           (oz, flip_z(orientation)), (oy, turn_right(orientation)),
+                           (ox, turn_left(orientation))):
+        reference_sector(grid, i - 1, base_i, center + offset, turned)
+
+
+class TestOrientations:
+    """Turns should be matrix products that match the old lookup tables."""
+
+    @pytest.mark.parametrize("index", range(8))
+    def test_turns(self, index):
+        """Left, right and flip should take each orientation where the tables did."""
+        orientation = ORIENTATIONS[index]
+        assert np.array_equal(turn_left(orientation), ORIENTATIONS[LEFT_OF[index]])
+        assert np.array_equal(turn_right(ORIENTATIONS[LEFT_OF[index]]), orientation)
+        assert np.array_equal(flip_z(orientation), ORIENTATIONS[FLIP_OF[index]])
+
+    def test_read_only(self):
+        """Shared orientations shouldn't be writable."""
+        assert not any(orientation.flags.writeable for orientation in ORIENTATIONS)
+
+
+class TestSectorLayout:
+    """Expanding a level at a time should give the cells the recursion did."""
+
+    @pytest.mark.parametrize("orientation", [UNE, USW, DNW, DSE])
+    @pytest.mark.parametrize("i, base_i", [(3, 0), (4, 2), (2, 2)])
+    def test_matches_recursion(self, orientation, i, base_i):
+        """materialize_sector should match building sector by sector."""
+        center = OctoVector(4, -2, 6)
+        expected = OctoGrid()
+        reference_sector(expected, i, base_i, center, orientation)
+
+        grid = OctoGrid()
+        OctoSectorBuilder().materialize_sector(grid, i, base_i, center, orientation)
+        assert state(grid) == state(expected)
+
+    def test_layout_size(self):
+        """Each level should split every sector into six."""
+        centers, orientations = sectors.sector_layout(*sectors.as_sectors((0, 0, 0), USE), 4, 1)
+        assert centers.shape == (6 ** 3, 3) and orientations.shape == (6 ** 3, 3, 3)
+
+    def test_detailed_core(self):
+        """The detailed core should be the core sectors filled whole and the rest down to 0."""
+        expected = OctoGrid()
+        for offset in UNE:
+            OctoSectorBuilder().fill_sector(expected, 2, OctoVector(*(8 * offset)), UNE)
+        for offset, turned in ((UNE[2], flip_z(UNE)), (UNE[1], turn_right(UNE)),
+                               (UNE[0], turn_left(UNE))):
+            reference_sector(expected, 2, 0, OctoVector(*(8 * offset)), turned)
+
+        grid = OctoGrid()
+        OctoSectorBuilder().detailed_core_sector(grid, 3, OctoVector(), UNE)
+        assert state(grid) == state(expected)
+
+    def test_materialize(self):
+        """The builder should build its own sector, from its center and orientation."""
+        builder = OctoSectorBuilder(center=OctoVector(2, 0, 0), iteration=3, orientation=DSW)
+        expected = OctoGrid()
+        reference_sector(expected, 3, 0, builder.center, DSW)
+        assert state(builder.materialize()) == state(expected)
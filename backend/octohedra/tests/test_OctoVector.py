@@ -0,0 +1,104 @@
+"""Tests for the tuple-backed OctoVector."""
+import copy
+import pickle
+import timeit
+from dataclasses import astuple, dataclass
+
+import numpy as np
+import pytest
+
+from octohedra.builders.FlakeBuilder import FlakeBuilder
+from octohedra.grid.OctoVector import OctoVector
+
+
+@dataclass(frozen=True)
+class DataclassVector:
+    """The dataclass OctoVector used to be, for comparison"""
+    x: int = 0
+    y: int = 0
+    z: int = 0
+
+    def __add__(self, other):
+        if isinstance(other, DataclassVector):
+            return DataclassVector(self.x + other.x, self.y + other.y, self.z + other.z)
+        return DataclassVector(self.x + other[0], self.y + other[1], self.z + other[2])
+
+    def __mul__(self, other):
+        return DataclassVector(self.x * other, self.y * other, self.z * other)
+
+    __rmul__ = __mul__
+
+    def __iter__(self):
+        return astuple(self).__iter__()
+
+
+def inner_loop(vector_type):
+    """Offsets, sums and dict inserts, the way builders use vectors"""
+    directions = [vector_type(1, 0, 0), vector_type(0, 1, 0), vector_type(0, 0, 1)]
+    cells = dict()
+    center = vector_type()
+    for i in range(2000):
+        for direction in directions:
+            center = center + 2 * direction
+            cells[center] = tuple(center)
+    return cells
+
+
+class TestOctoVector:
+    """OctoVector should keep the dataclass' behaviour while being a plain tuple underneath."""
+
+    def test_construction(self):
+        """Positional, keyword and default construction should all work."""
+        assert OctoVector() == (0, 0, 0)
+        assert OctoVector(z=3, x=1) == (1, 0, 3)
+        assert (OctoVector(1, 2, 3).x, OctoVector(1, 2, 3).y, OctoVector(1, 2, 3).z) == (1, 2, 3)
+        assert repr(OctoVector(1, -2, 3)) == "OctoVector(1, -2, 3)"
+        assert len(OctoVector()) == 3
+
+    def test_arithmetic(self):
+        """Arithmetic should be elementwise and accept vectors, sequences and numbers."""
+        a, b = OctoVector(1, 2, 3), OctoVector(-1, 4, 0)
+
+        assert a + b == OctoVector(0, 6, 3)
+        assert a - b == OctoVector(2, -2, 3)
+        assert (5, 5, 5) - a == OctoVector(4, 3, 2)
+        assert (1, 1, 1) + a == OctoVector(2, 3, 4)
+        assert 2 * a == a * 2 == OctoVector(2, 4, 6)
+        assert a * b == OctoVector(-1, 8, 0)
+        assert -a == OctoVector(-1, -2, -3)
+        assert all(type(v) is OctoVector for v in (a + b, (1, 1, 1) + a, 2 * a, -a))
+
+    @pytest.mark.parametrize("other", [(1, 2), "xyz!", None])
+    def test_bad_operands(self, other):
+        """Operands that aren't three numbers should raise TypeError."""
+        with pytest.raises(TypeError):
+            OctoVector() + other
+
+    def test_hash_and_copies(self):
+        """Vectors should hash like their coordinates and survive pickling and copying."""
+        vector = OctoVector(4, -2, 6)
+
+        assert {vector: True}[OctoVector(4, -2, 6)]
+        assert pickle.loads(pickle.dumps(vector)) == vector
+        assert type(copy.deepcopy(vector)) is OctoVector
+        assert np.array_equal(vector.as_np(), [4, -2, 6])
+        with pytest.raises(AttributeError):
+            vector.x = 1
+
+    def test_same_as_dataclass(self):
+        """The inner loop of a builder should reach the same cells as with the dataclass vector.
+        Run this file to compare their speed."""
+        assert inner_loop(OctoVector).keys() == {tuple(k) for k in inner_loop(DataclassVector)}
+
+    def test_flake(self):
+        """FlakeBuilder should still build the same cells."""
+        grid = FlakeBuilder(3).materialize()
+
+        assert len(grid.occ) == 6 ** 3
+        assert all(type(center) is OctoVector for center in grid.occ)
+
+
+if __name__ == "__main__":
+    for vector_type in (OctoVector, DataclassVector):
+        seconds = min(timeit.repeat(lambda: inner_loop(vector_type), number=1, repeat=5))
+        print(f"{vector_type.__name__}: {seconds * 1000:.1f} ms")
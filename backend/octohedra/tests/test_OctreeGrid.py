@@ -0,0 +1,107 @@
+"""Tests for the hash-consed octree grid."""
+import numpy as np
+import pytest
+
+from octohedra.builders.FlakeBuilder import FlakeBuilder
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.grid import Lattice
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.grid.OctreeGrid import NodeStore, OctreeGrid
+from octohedra.tests.conftest import render_states
+
+
+class TestOctreeGrid:
+    """The octree should hold exactly the cells the dict-backed OctoGrid would."""
+
+    @pytest.mark.parametrize("iteration, center, scale", [
+        (3, OctoVector(), 0),
+        (3, OctoVector(1, 1, 1), 0),
+        (2, OctoVector(0, 1, 0), 0),
+        (4, OctoVector(3, -5, 2), 2),
+    ])
+    def test_flake_matches_builder(self, iteration, center, scale):
+        """Flakes built from translated copies should match FlakeBuilder, kinds included."""
+        reference = FlakeBuilder(iteration=iteration, center=center, scale=scale).materialize()
+
+        octree = OctreeGrid.flake(iteration, center, scale, store=NodeStore())
+
+        assert len(octree) == len(reference.occ)
+        assert render_states(octree) == render_states(reference)
+
+    def test_from_grid_round_trip(self):
+        """Converting a grid should keep every cell and flag."""
+        grid = RecipeBuilder(layers=[{"depth": 2, "spawn": ["out", "side"]}]).materialize()
+        grid.crop(z_min=0)
+
+        octree = OctreeGrid.from_grid(grid, store=NodeStore())
+
+        assert render_states(octree) == render_states(grid)
+        assert render_states(octree.to_columnar()) == render_states(grid)
+
+    def test_crop(self):
+        """Crop should drop the same cells and set the same crop flags as OctoGrid.crop."""
+        reference = FlakeBuilder(iteration=3, center=OctoVector(1, 1, 1)).materialize()
+        octree = OctreeGrid.flake(3, OctoVector(1, 1, 1), store=NodeStore())
+
+        reference.crop(x_max=5, y_min=-7, z_min=-3)
+        octree.crop(x_max=5, y_min=-7, z_min=-3)
+
+        assert render_states(octree) == render_states(reference)
+
+    def test_merge(self):
+        """Merging should union cells, with the merged-in grid winning on overlaps."""
+        store = NodeStore()
+        grid = OctoGrid()
+        grid.fill(3, OctoVector(40, -20, 6))
+        octree = OctreeGrid.flake(2, store=store)
+        other = OctreeGrid.flake(2, OctoVector(8, 0, 0), store=store).crop(z_min=0)
+
+        octree.merge(other).merge(grid)
+
+        reference = FlakeBuilder(iteration=2).materialize()
+        cropped = FlakeBuilder(iteration=2, center=OctoVector(8, 0, 0)).materialize()
+        cropped.crop(z_min=0)
+        reference.merge(cropped).merge(grid)
+        assert render_states(octree) == render_states(reference)
+
+    def test_translate(self):
+        """Translating should move every cell, whatever the offset's alignment."""
+        store = NodeStore()
+        octree = OctreeGrid.flake(3, store=store)
+        centers, _, _ = octree.to_arrays()
+
+        for offset in [(2, 0, 0), (-6, 10, 4), (1000, -998, 2)]:
+            moved, _, _ = octree.translate(offset).to_arrays()
+            assert {tuple(c) for c in moved.tolist()} == \
+                   {tuple(c) for c in (centers + offset).tolist()}
+
+    def test_deep_flakes_share_nodes(self):
+        """Deep flakes should be cheap to build and count, and stay small in memory."""
+        store = NodeStore()
+
+        octree = OctreeGrid.flake(12, store=store)
+
+        assert len(octree) == 6 ** 12
+        assert octree.unique_nodes < 1000
+        assert octree.state_at((0, 0, 0)) is None
+        assert octree.state_at((2 ** 13 - 2 ** 3, 2 ** 2, 2)) >> 16 == Lattice.OCTO
+
+    def test_empty(self):
+        """An empty grid should count, crop and iterate to nothing."""
+        octree = OctreeGrid(store=NodeStore())
+
+        assert len(octree.crop(z_min=0)) == 0
+        assert list(octree.cells()) == []
+        assert octree.to_arrays()[0].shape == (0, 3)
+        assert np.array_equal(octree.translate((2, 2, 2)).to_arrays()[0], np.empty((0, 3)))
+
+    def test_stores_per_grid(self):
+        """Grids should get a store of their own by default, shared with the grids made from
+        them, so nothing outlives a build."""
+        octree = OctreeGrid.flake(3)
+        other = OctreeGrid()
+
+        assert octree.store is not other.store and len(other.store) == 0
+        assert octree.translate((2, 0, 0)).store is octree.store
+        assert len(other.merge(octree)) == len(octree)
@@ -0,0 +1,72 @@
+"""Tests for RecipeBuilder's reuse of identical sub-structures."""
+import pytest
+
+from octohedra.builders import RecipeBuilder as recipes
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.tests.conftest import recipe_builder, state
+
+
+def build(name, depth):
+    return recipe_builder(name, depth).materialize_into(OctoGrid())
+
+
+class TestSubStructures:
+    """Translating a memoized sub-structure should give the same cells as building it again."""
+
+    @pytest.mark.parametrize("name", ["evil_tower", "flower", "temple_complex"])
+    def test_matches_building_every_spawn(self, name, monkeypatch):
+        """Presets should come out the same with and without the memo."""
+        recipes.SUB_STRUCTURES.clear()
+        memoized = build(name, 4)
+        assert recipes.SUB_STRUCTURES
+
+        monkeypatch.setattr(RecipeBuilder, "materialize_translated",
+                            RecipeBuilder.materialize_into)
+        assert state(memoized) == state(build(name, 4))
+
+    def test_siblings_share_entries(self):
+        """Spawns that only differ in where they are should be built once."""
+        recipes.SUB_STRUCTURES.clear()
+        layers = [{"depth": 3, "spawn": ["out", "in", "side"]}, {"depth": 2}]
+
+        RecipeBuilder(layers=layers).materialize_into(OctoGrid())
+        entries = len(recipes.SUB_STRUCTURES)
+        RecipeBuilder(layers=layers).materialize_into(OctoGrid())
+
+        assert entries == 1
+        assert len(recipes.SUB_STRUCTURES) == entries
+
+    def test_structure_key(self):
+        """Keys should ignore the center but not the recipe, and survive reordered layer dicts."""
+        a = RecipeBuilder(layers=[{"depth": 2, "spawn": ["out"]}], origin_dir=(1, 0))
+        b = RecipeBuilder(layers=[{"spawn": ["out"], "depth": 2}], origin_dir=(1, 0),
+                          center=a.center + (4, 0, 0))
+        c = RecipeBuilder(layers=[{"depth": 2, "spawn": ["out"]}], origin_dir=(0, 1))
+        plain = [RecipeBuilder(layers=[{"depth": 2}], origin_dir=d) for d in ((1, 0), (0, 1))]
+
+        assert a.structure_key() == b.structure_key()
+        assert a.structure_key() != c.structure_key()
+        assert plain[0].structure_key() == plain[1].structure_key()
+        hash(a.structure_key())
+
+
+class TestParallelBuild:
+    """Sub-structures built in worker processes should be the ones built in-process."""
+
+    @pytest.mark.parametrize("workers", [0, 2])
+    def test_matches_serial(self, workers):
+        """Prebuilding the sub-structures should leave the grid the same."""
+        recipes.SUB_STRUCTURES.clear()
+        recipes.SUB_EXPRESSIONS.clear()
+        serial = build("temple_complex", 3)
+
+        recipes.SUB_STRUCTURES.clear()
+        recipes.SUB_EXPRESSIONS.clear()
+        builder = recipe_builder("temple_complex")
+        assert builder.build_sub_structures(workers) > 0
+        assert builder.build_sub_structures(workers) == 0
+        assert not any(offsets.flags.writeable for offsets in recipes.SUB_STRUCTURES.values())
+
+        assert state(builder.materialize_into(OctoGrid())) == state(serial)
+        assert state(builder.materialize(workers=workers)) == state(builder.materialize())
@@ -0,0 +1,107 @@
+"""Tests for the sorted-key spatial index and the grid queries built on it."""
+import numpy as np
+import pytest
+
+from octohedra.grid.ColumnarGrid import ColumnarGrid
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.grid.SpatialIndex import SpatialIndex
+
+
+def as_set(centers):
+    return set(map(tuple, np.asarray(centers).tolist()))
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(1)
+    return rng.integers(-20, 20, size=(3000, 3))
+
+
+class TestSpatialIndex:
+    """Queries should match a brute-force scan of the points."""
+
+    @pytest.mark.parametrize("low, high", [
+        ((-3, -5, 0), (4, 2, 9)),
+        ((-np.inf, 0, -np.inf), (np.inf, 0, np.inf)),
+        ((30, 0, 0), (40, 5, 5)),
+        ((-100, -100, -100), (100, 100, 100)),
+    ])
+    def test_box(self, points, low, high):
+        """Box queries include their bounds and accept infinite ones."""
+        index = SpatialIndex.from_centers(points)
+
+        inside = ((points >= low) & (points <= high)).all(axis=1)
+
+        assert as_set(index.box(low, high)) == as_set(points[inside])
+
+    @pytest.mark.parametrize("radius", [0, 3, 8, 40])
+    def test_within(self, points, radius):
+        """Radius queries use L1 distance, radius included."""
+        index = SpatialIndex.from_centers(points)
+        center = (2, -1, 5)
+
+        near = np.abs(points - center).sum(axis=1) <= radius
+
+        assert as_set(index.within(center, radius)) == as_set(points[near])
+
+    @pytest.mark.parametrize("k", [1, 7, 50])
+    def test_nearest(self, points, k):
+        """The k nearest centers come back nearest first."""
+        index = SpatialIndex.from_centers(points)
+        point = (5, 5, -3)
+
+        found = index.nearest(point, k)
+
+        distances = np.sort(np.abs(np.unique(points, axis=0) - point).sum(axis=1))[:k]
+        assert np.abs(found - point).sum(axis=1).tolist() == distances.tolist()
+
+    def test_empty(self):
+        """An empty index answers every query with nothing."""
+        index = SpatialIndex.from_centers(np.empty((0, 3)))
+
+        assert len(index.box((0, 0, 0), (5, 5, 5))) == 0
+        assert len(index.within((0, 0, 0), 5)) == 0
+        assert len(index.nearest((0, 0, 0), 3)) == 0
+
+
+class TestGridQueries:
+    """The grids' queries should see every change made through their methods."""
+
+    @pytest.mark.parametrize("grid_type", [OctoGrid, ColumnarGrid])
+    def test_index_follows_edits(self, grid_type):
+        """Inserts and removals after a query should show up in the next one."""
+        grid = grid_type()
+        grid.fill(5, OctoVector(0, 0, 0))
+        assert OctoVector(0, 0, 40) not in grid.occ
+        assert len(grid.within((0, 0, 40), 2)) == 0
+
+        grid.insert_cell(OctoVector(0, 0, 40))
+        assert as_set(grid.within((0, 0, 40), 2)) == {(0, 0, 40)}
+
+        grid.carve(-10, 10, -10, 10, 30, 50)
+        assert len(grid.within((0, 0, 40), 2)) == 0
+
+    def test_carve_and_split(self):
+        """Carve and split should remove and select the same cells as scanning would."""
+        grid = OctoGrid()
+        grid.fill(7, OctoVector(1, 1, 1))
+        before = set(grid.occ)
+
+        grid.carve(-2, 3, 0, 4, -10, 1)
+        above, below = grid.split(2)
+
+        kept = {c for c in before if not (-2 <= c.x <= 3 and 0 <= c.y <= 4 and c.z <= 1)}
+        assert set(above.occ) == {c for c in kept if c.z >= 2}
+        assert set(below.occ) == {c for c in kept if c.z <= 2}
+
+    def test_index_follows_same_size_edits(self):
+        """An insert and a removal between two queries leave the cell count as it was, and should
+        still show up."""
+        grid = OctoGrid()
+        grid.insert_cells([(0, 0, 0), (2, 0, 4)])
+        assert as_set(grid.box()) == {(0, 0, 0), (2, 0, 4)}
+
+        grid.insert_cell(OctoVector(100, 0, 0))
+        grid.fill(1, (0, 0, 0), clear=True)
+        assert as_set(grid.box()) == {(2, 0, 4), (100, 0, 0)}
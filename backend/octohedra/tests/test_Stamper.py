@@ -0,0 +1,80 @@
+"""Tests for rendering a symmetric grid from one sector."""
+import numpy as np
+import pytest
+
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.grid import Stamper, Symmetry
+from octohedra.grid.ColumnarGrid import ColumnarGrid
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.utils import OctoConfigs
+
+CONFIG = OctoConfigs.config_20_rainbow_speed
+
+
+def six_way_grid(layers, backend=OctoGrid):
+    grid = RecipeBuilder(layers=layers).materialize()
+    if backend is ColumnarGrid:
+        grid = ColumnarGrid.from_grid(grid)
+    grid.six_way()
+    grid.crop(z_min=0)
+    return grid
+
+
+def vertex_set(mesh):
+    return np.unique(np.round(mesh.vertices, 5), axis=0)
+
+
+LAYERS = [
+    pytest.param([{"depth": 2}], id="flake"),
+    pytest.param([{"depth": 2, "spawn": ["out", "side"]}, {"depth": 1}], id="spawned"),
+]
+
+
+class TestStampSymmetric:
+    """A symmetric render should give the same surface as trimming and rendering every cell."""
+
+    @pytest.mark.parametrize("backend", [OctoGrid, ColumnarGrid])
+    @pytest.mark.parametrize("layers", LAYERS)
+    def test_matches_full_render(self, layers, backend):
+        """Same vertices, face count and volume as the plain render."""
+        grid = six_way_grid(layers, backend)
+        symmetric = grid.render(CONFIG, symmetric=True)
+
+        grid.compute_trimming()
+        expected = grid.render(CONFIG)
+
+        np.testing.assert_allclose(vertex_set(symmetric), vertex_set(expected))
+        assert len(symmetric.faces) == len(expected.faces)
+        assert symmetric.volume == pytest.approx(expected.volume)
+
+    def test_invariant_ops(self):
+        """A cropped six_way shape keeps the square's symmetries but none that flip z."""
+        grid = six_way_grid([{"depth": 2}], ColumnarGrid)
+
+        ops = Symmetry.invariant_ops(grid.centers, grid.kinds, grid.flags)
+
+        assert Symmetry.is_identity(ops[0])
+        assert len(ops) == len(Symmetry.FOUR_WAY)
+        assert all(op[2].tolist() == [0, 0, 1] for op in ops)
+
+    def test_fundamental_domain(self):
+        """Every cell should come from exactly one representative and operation."""
+        grid = six_way_grid([{"depth": 2}], ColumnarGrid)
+        ops = Symmetry.invariant_ops(grid.centers, grid.kinds, grid.flags)
+
+        reps, canonical = Symmetry.fundamental_domain(grid.centers, ops)
+
+        placed = np.concatenate([Symmetry.images(grid.centers[reps][rows], op[None])
+                                 for op, rows in zip(ops, canonical)])
+        assert sorted(map(tuple, placed.tolist())) == sorted(map(tuple, grid.centers.tolist()))
+
+    def test_exact(self):
+        """Requiring the same triangles as well can only keep fewer operations, and still gives
+        the same surface."""
+        grid = six_way_grid([{"depth": 2}], ColumnarGrid)
+        config = CONFIG.derive_render_config()
+        stamp = lambda exact: Stamper.stamp_symmetric(grid.centers, grid.kinds, grid.flags,
+                                                      grid._render_state, config, exact=exact)
+
+        np.testing.assert_allclose(vertex_set(stamp(True)), vertex_set(stamp(False)))
+        assert len(stamp(True).faces) == len(stamp(False).faces)
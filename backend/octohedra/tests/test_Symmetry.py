@@ -0,0 +1,112 @@
+"""Tests for the batched symmetry engine."""
+import numpy as np
+import pytest
+
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.grid import Lattice, Symmetry
+from octohedra.grid.ColumnarGrid import ColumnarGrid
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+from octohedra.tests.conftest import state
+
+
+def insert_images(grid, image, origin=OctoVector()):
+    """Inserts the image of every cell one at a time, like the per-cell implementations did"""
+    new_grid = OctoGrid()
+    for center in grid.occ:
+        x, y, z = (center - origin).as_tuple()
+        new_grid.insert_cell(OctoVector(*image(x, y, z)) + origin)
+    grid.merge(new_grid)
+
+
+def reference_four_way(grid, origin):
+    insert_images(grid, lambda x, y, z: (y, x, z), origin)
+    insert_images(grid, lambda x, y, z: (-x, y, z))
+    insert_images(grid, lambda x, y, z: (x, -y, z))
+
+
+def reference_six_way(grid, origin):
+    new_grid = OctoGrid()
+    for center in grid.occ:
+        x, y, z = (center - origin).as_tuple()
+        for image in ((x, z, y), (z, y, x), (x, y, -z)):
+            new_grid.insert_cell(OctoVector(*image) + origin)
+    grid.merge(new_grid)
+    reference_four_way(grid, origin)
+
+
+def spawned_grid():
+    layers = [{"depth": 2, "spawn": ["out", "side"]}, {"depth": 1}]
+    grid = RecipeBuilder(layers=layers).materialize()
+    grid.crop(x_min=-2, z_min=0)
+    return grid
+
+
+class TestSymmetry:
+    """The batched operations should match re-inserting every image cell by cell."""
+
+    def test_groups(self):
+        """The operation sets should have the expected sizes and be made of signed permutations."""
+        assert len(Symmetry.OCTAHEDRAL) == 48
+        assert len(Symmetry.generate(*Symmetry.OCTAHEDRAL)) == 48
+        assert len(Symmetry.FOUR_WAY) == 8
+        assert len(Symmetry.SIX_WAY) == 32
+        assert all(np.abs(op).sum(axis=0).tolist() == [1, 1, 1] for op in Symmetry.OCTAHEDRAL)
+
+    @pytest.mark.parametrize("origin", [OctoVector(), OctoVector(0, 0, 8), OctoVector(2, -4, 6)])
+    def test_six_way(self, origin):
+        """six_way should give the same cells, and keep the flags of cells nothing lands on."""
+        expected = spawned_grid()
+        reference_six_way(expected, origin)
+
+        grid = spawned_grid()
+        grid.six_way(origin)
+
+        assert state(grid) == state(expected)
+
+    @pytest.mark.parametrize("origin", [OctoVector(), OctoVector(4, 2, 0)])
+    def test_four_way(self, origin):
+        """four_way should match, including its reflections through the coordinate planes."""
+        expected = spawned_grid()
+        reference_four_way(expected, origin)
+
+        grid = spawned_grid()
+        grid.four_way(origin)
+
+        assert state(grid) == state(expected)
+
+    def test_reflect(self):
+        """Reflecting about a point should add the mirrored cells."""
+        expected = spawned_grid()
+        insert_images(expected, lambda x, y, z: (x, -y, -z), OctoVector(0, 2, 4))
+
+        grid = spawned_grid()
+        grid.reflect(y=-1, z=-1, center_of_reflection=OctoVector(0, 2, 4))
+
+        assert state(grid) == state(expected)
+
+    def test_full_symmetry_copies_cells(self):
+        """full_symmetry should copy cells, flags included, and keep OctoVector keys."""
+        grid = spawned_grid()
+        before = state(grid)
+
+        grid.full_symmetry()
+
+        for x, y, z in before:
+            for image in ((y, x, z), (-x, y, z), (y, -x, z)):
+                assert OctoVector(*image) in grid.occ
+        assert all(isinstance(center, OctoVector) for center in grid.occ)
+        flags = {cell_state & Lattice.STATE_FLAGS for cell_state in state(grid).values()}
+        assert Lattice.FLAGS["crop_bottom"] in flags
+
+    @pytest.mark.parametrize("method", ["six_way", "four_way", "full_symmetry", "reflect_z"])
+    def test_columnar_matches(self, method):
+        """ColumnarGrid should give the same result as OctoGrid."""
+        grid = spawned_grid()
+        columnar = ColumnarGrid.from_grid(grid)
+
+        getattr(grid, method)()
+        getattr(columnar, method)()
+
+        assert state(columnar) == {center: Lattice.render_state(cell_state)
+                                   for center, cell_state in state(grid).items()}
@@ -0,0 +1,96 @@
+"""Tests for cutting grids into build-plate tiles."""
+import io
+import zipfile
+
+import numpy as np
+import pytest
+import trimesh
+
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.grid import Lattice, Tiling
+from octohedra.grid.ColumnarGrid import ColumnarGrid
+from octohedra.utils import OctoConfigs
+
+CONFIG = OctoConfigs.config_20_rainbow_speed
+
+
+@pytest.fixture(scope="module")
+def grid():
+    layers = [{"depth": 3, "spawn": ["out", "side"]}, {"depth": 2}]
+    grid = RecipeBuilder(layers=layers).materialize()
+    grid.crop(z_min=0)
+    return grid
+
+
+def crops(tile, name):
+    return {tuple(center) for center, flags in zip(tile.centers.tolist(), tile.flags.tolist())
+            if flags & Lattice.FLAGS[name]}
+
+
+class TestTiling:
+    """Tiles should cover the grid, be cropped on their cuts and fit within the tile size."""
+
+    def test_tile_span(self):
+        """Spans should be even and leave room for the overlap."""
+        render_config = CONFIG.derive_render_config()
+        unit = render_config.cell_size / 4
+
+        assert Tiling.tile_span(12 * unit + render_config.overlap, CONFIG) == 12
+        assert Tiling.tile_span(11 * unit + render_config.overlap, CONFIG) == 10
+        with pytest.raises(ValueError):
+            Tiling.tile_span(unit, CONFIG)
+
+    @pytest.mark.parametrize("axes", ["xyz", "xy", "z"])
+    def test_tiles_cover_grid(self, grid, axes):
+        """Every cell should be in some tile, and cells on a cut in the tiles on both sides."""
+        tiles = Tiling.tiles(grid, 3.6, CONFIG, axes)
+        everything = np.concatenate([tile.keys for tile in tiles.values()])
+
+        assert np.array_equal(np.unique(everything), np.sort(Lattice.pack(grid.centers)))
+        assert len(everything) > len(grid.occ)
+        for index in tiles:
+            assert all(i == 0 for axis, i in zip("xyz", index) if axis not in axes)
+
+    def test_cuts_are_cropped(self, grid):
+        """Cells on a cut should be cropped towards it on both sides, and only those cells."""
+        tiles = Tiling.tiles(grid, 3.6, CONFIG, "x")
+        bounds = Tiling.tile_bounds(grid.centers, Tiling.tile_span(3.6, CONFIG), "x")
+
+        for index, tile in tiles.items():
+            (low, _, _), (high, _, _) = bounds[index]
+            assert crops(tile, "crop_west") == {c for c in map(tuple, tile.centers.tolist())
+                                                if c[0] == low}
+            assert crops(tile, "crop_east") == {c for c in map(tuple, tile.centers.tolist())
+                                                if c[0] == high}
+            assert crops(tile, "crop_bottom") == {c for c in map(tuple, tile.centers.tolist())
+                                                  if c[2] == 0 and grid.occ[c].crop_bottom}
+
+    @pytest.mark.parametrize("tile_size", [2.0, 3.6, 5.0])
+    def test_tiles_fit(self, grid, tile_size):
+        """No tile's mesh should be bigger than the tile size along any axis."""
+        for tile in Tiling.tiles(grid, tile_size, CONFIG).values():
+            mesh = trimesh.load(io.BytesIO(Tiling.export_tile(tile.centers, tile.kinds, tile.flags,
+                                                              CONFIG)), file_type="stl")
+            assert (mesh.bounds[1] - mesh.bounds[0] <= tile_size + 1e-6).all()
+
+    def test_columnar_matches(self, grid):
+        """Tiling a ColumnarGrid should give the same tiles."""
+        tiles = Tiling.tiles(grid, 3.6, CONFIG)
+        columnar_tiles = Tiling.tiles(ColumnarGrid.from_grid(grid), 3.6, CONFIG)
+
+        assert tiles.keys() == columnar_tiles.keys()
+        for index, tile in tiles.items():
+            assert np.array_equal(tile.keys, columnar_tiles[index].keys)
+            assert np.array_equal(tile.flags, columnar_tiles[index].flags)
+
+    def test_export(self, grid, tmp_path):
+        """Tiles should be written to a directory or an archive, the same from worker processes."""
+        names = Tiling.export_tiles(grid, 5.0, CONFIG, tmp_path / "tiles", workers=1)
+        archive = io.BytesIO()
+        Tiling.export_tiles(grid, 5.0, CONFIG, archive, workers=2)
+
+        assert sorted(p.name for p in (tmp_path / "tiles").iterdir()) == sorted(names)
+        with zipfile.ZipFile(archive) as files:
+            assert files.namelist() == names
+            for name in names:
+                assert files.read(name) == (tmp_path / "tiles" / name).read_bytes()
@@ -0,0 +1,114 @@
+"""Tests for the batch trimming engine.
+
+The engine must agree exactly with the per-cell OctoCell.trim / TetraCell.trim methods, so each
+test trims a grid both ways and compares every flag.
+"""
+import numpy as np
+import pytest
+
+from octohedra.builders.RecipeBuilder import RecipeBuilder
+from octohedra.grid import Lattice, Trimming
+from octohedra.grid.OctoGrid import OctoGrid
+from octohedra.grid.OctoVector import OctoVector
+
+
+def per_cell_flags(grid):
+    """Trims a copy of each cell with its own trim() method"""
+    centers = set(grid.occ)
+    flags = {}
+    for center, cell in grid.occ.items():
+        cell = Lattice.make_cell(Lattice.kind_of(cell), 0)
+        cell.trim(center, centers)
+        flags[center] = Lattice.flags_of(cell)
+    return flags
+
+
+def batch_flags(grid):
+    grid.compute_trimming()
+    return {center: Lattice.flags_of(cell) & Lattice.TRIM_MASK
+            for center, cell in grid.occ.items()}
+
+
+def recipe_grid(layers, six_way=False):
+    grid = RecipeBuilder(layers=layers).materialize()
+    if six_way:
+        grid.six_way()
+    return grid
+
+
+class TestBatchTrimming:
+    """Batch trimming should match per-cell trimming."""
+
+    @pytest.mark.parametrize("layers, six_way", [
+        ([{"depth": 3}], False),
+        ([{"depth": 2}], True),
+        ([{"depth": 2, "shape": "solid"}], False),
+        ([{"depth": 3, "spawn": ["out", "side"], "bloom": True}, {"depth": 2}], False),
+    ])
+    def test_matches_per_cell_trim(self, layers, six_way):
+        """Every flag of every cell should match the per-cell methods."""
+        grid = recipe_grid(layers, six_way)
+
+        assert batch_flags(grid) == per_cell_flags(grid)
+
+    def test_random_cells(self):
+        """Arbitrary clouds of cells, including off-lattice ones, should also match."""
+        rng = np.random.default_rng(0)
+        grid = OctoGrid()
+        for x, y, z in rng.integers(-6, 7, size=(400, 3)).tolist():
+            grid.insert_cell(OctoVector(x, y, z))
+
+        assert batch_flags(grid) == per_cell_flags(grid)
+
+    def test_tetra_parity_classes(self):
+        """Both tetra parities should get their own stencil and 'flip' only on x+y+z = 1 mod 4."""
+        grid = OctoGrid()
+        grid.insert_cell(OctoVector(1, 1, 1))
+        grid.insert_cell(OctoVector(1, 1, -1))
+        grid.insert_cell(OctoVector(4, 2, 0))
+        grid.insert_cell(OctoVector(2, 4, 2))
+
+        assert batch_flags(grid) == per_cell_flags(grid)
+        assert grid.occ[OctoVector(1, 1, -1)].flip
+        assert not grid.occ[OctoVector(1, 1, 1)].flip
+
+    def test_preserves_crop_flags(self):
+        """Trimming should not touch crop flags."""
+        grid = recipe_grid([{"depth": 2}])
+        grid.crop(z_min=0)
+        cropped = {center for center, cell in grid.occ.items() if cell.crop_bottom}
+
+        grid.compute_trimming()
+
+        assert cropped
+        assert cropped == {center for center, cell in grid.occ.items() if cell.crop_bottom}
+
+    @pytest.mark.parametrize("layers, six_way", [
+        ([{"depth": 3}], True),
+        ([{"depth": 2, "shape": "solid"}], False),
+        ([{"depth": 3, "spawn": ["out", "in", "side"], "echo": True}, {"depth": 2}], False),
+    ])
+    def test_dense_matches_sparse(self, layers, six_way):
+        """Bit-volume trimming should give exactly the same flags as key lookups."""
+        grid = recipe_grid(layers, six_way)
+        centers = np.array([tuple(center) for center in grid.occ])
+        kinds = np.array([Lattice.kind_of(cell) for cell in grid.occ.values()])
+
+        sparse = Trimming.trim_flags(centers, kinds, mode="sparse")
+        dense = Trimming.trim_flags(centers, kinds, mode="dense")
+
+        assert np.array_equal(dense, sparse)
+
+    def test_dense_grid_mode(self):
+        """compute_trimming(mode="dense") should match the per-cell methods."""
+        grid = recipe_grid([{"depth": 2}], six_way=True)
+        grid.compute_trimming(mode="dense")
+
+        assert {center: Lattice.flags_of(cell) & Lattice.TRIM_MASK
+                for center, cell in grid.occ.items()} == per_cell_flags(grid)
+
+    def test_empty_grid(self):
+        """An empty grid should trim to nothing."""
+        flags = Trimming.trim_flags(np.empty((0, 3), dtype=np.int64), np.empty(0, np.uint8))
+
+        assert len(flags) == 0
@@ -0,0 +1,101 @@
+"""
+Batches of half-integer coordinate vectors.
+
+HCV keeps every coordinate as a Fraction and validates it through float and limit_denominator,
+which is fine for a handful of points. HCVArray stores a whole (N, 3) batch as doubled int64
+coordinates, so that half-integers are plain integers and arithmetic is integer NumPy math.
+"""
+from fractions import Fraction
+
+import numpy as np
+
+from octohedra.utils.HCVector import HCV
+
+# How far a doubled coordinate may be from an integer and still count as one. Close to what
+# HCV's limit_denominator lets through.
+TOLERANCE = 1e-6
+
+
+def doubled(values) -> np.ndarray:
+    """Twice the given coordinates as int64, raising ValueError unless they're half-integers"""
+    values = np.asarray(values)
+    if values.dtype.kind in "iub":
+        return values.astype(np.int64) * 2
+    twice = np.asarray(values, dtype=float) * 2
+    rounded = np.rint(twice)
+    if not np.all(np.abs(twice - rounded) <= TOLERANCE):
+        raise ValueError("HVC coordinates may only be integers and half-integers.")
+    return rounded.astype(np.int64)
+
+
+class HCVArray:
+    """(N, 3) half-integer coordinates, stored doubled"""
+
+    # Keeps NumPy from broadcasting its own operators over an HCVArray operand
+    __array_ufunc__ = None
+
+    def __init__(self, values=()):
+        """values: an (N, 3) array-like of numbers or HCVs, or a single point"""
+        self.doubled = doubled(values).reshape(-1, 3)
+
+    @classmethod
+    def from_doubled(cls, doubled_values):
+        """Wraps already doubled integer coordinates without validating them"""
+        array = cls.__new__(cls)
+        array.doubled = np.asarray(doubled_values, dtype=np.int64).reshape(-1, 3)
+        return array
+
+    @classmethod
+    def from_hcvs(cls, hcvs):
+        return cls.from_doubled([[int(2 * c) for c in hcv] for hcv in hcvs])
+
+    def to_hcvs(self) -> list:
+        return [tuple.__new__(HCV, (Fraction(x, 2), Fraction(y, 2), Fraction(z, 2)))
+                for x, y, z in self.doubled.tolist()]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.doubled / 2
+
+    def __len__(self):
+        return len(self.doubled)
+
+    def __iter__(self):
+        return iter(self.to_hcvs())
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return HCVArray.from_doubled(self.doubled[item]).to_hcvs()[0]
+        return HCVArray.from_doubled(self.doubled[item])
+
+    def __repr__(self):
+        return f"HCVArray({self.values.tolist()})"
+
+    def __add__(self, other):
+        return HCVArray.from_doubled(self.doubled + _doubled_vectors(other))
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return HCVArray.from_doubled(-self.doubled)
+
+    def __mul__(self, other):
+        if isinstance(other, HCVArray) or np.ndim(other) > 0:
+            other = _doubled_vectors(other)
+        else:
+            other = doubled(other)
+
+        # Both factors are doubled, so the product is four times the result
+        product = self.doubled * other
+        if (product % 2).any():
+            raise ValueError("HVC coordinates may only be integers and half-integers.")
+        return HCVArray.from_doubled(product // 2)
+
+    __rmul__ = __mul__
+
+
+def _doubled_vectors(other) -> np.ndarray:
+    """Doubled coordinates of one point or an (N, 3) batch"""
+    if isinstance(other, HCVArray):
+        return other.doubled
+    return doubled(other).reshape(-1, 3)
@@ -0,0 +1,37 @@
+import threading
+from collections import OrderedDict
+
+
+class LruCache(OrderedDict):
+    """
+    A dict that keeps only its maxsize most recently used entries, for memos that long-lived
+    processes fill with one entry per request. Reads and writes are safe across threads.
+    """
+
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+        self.lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self.lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.maxsize:
+                self.popitem(last=False)
+
+    def setdefault(self, key, default=None):
+        with self.lock:
+            if key not in self:
+                self[key] = default
+            return self[key]
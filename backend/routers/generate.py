@@ -1,10 +1,18 @@
 from typing import Literal
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import PlainTextResponse, Response
 from pydantic import BaseModel, Field
 
-from services.octohedra_service import AVAILABLE_PRESETS, generate_fractal, generate_stl_from_recipe
+from services.octohedra_service import (
+    AVAILABLE_PRESETS,
+    analyze_recipe,
+    generate_fractal,
+    generate_stl_from_recipe,
+    generate_tiles_from_recipe,
+    get_preset_recipe,
+    query_cells,
+)
 
 router = APIRouter()
 
@@ -113,6 +121,30 @@ class GenerateRequest(BaseModel):
     config: str = Field(default="rainbow_speed", description="Render config preset")
 
 
+def _resolve_recipe(request: GenerateRequest):
+    """(layers, six_way, grid_depth, grid_min_depth) of a request: its own layers, or its preset's
+    with the preset's mirroring and grid parameters, or a flake of its depth."""
+    six_way = request.six_way
+    grid_depth = request.grid_depth
+    grid_min_depth = request.grid_min_depth
+    if request.layers:
+        return [layer.model_dump() for layer in request.layers], six_way, grid_depth, grid_min_depth
+    if request.preset is None:
+        return [{"depth": request.depth}], six_way, grid_depth, grid_min_depth
+
+    recipe_dict = get_preset_recipe(
+        request.preset,
+        depth=request.depth,
+        stack_height=request.stack_height
+    )
+    six_way = six_way or recipe_dict.get("six_way", False)
+    # Get grid parameters from preset
+    if grid_depth is None and recipe_dict.get("grid_depth") is not None:
+        grid_depth = recipe_dict["grid_depth"]
+        grid_min_depth = recipe_dict.get("grid_min_depth", 2)
+    return recipe_dict["layers"], six_way, grid_depth, grid_min_depth
+
+
 @router.post("/generate", response_class=PlainTextResponse)
 async def generate(request: GenerateRequest):
     """Generate a fractal using the recipe system.
@@ -196,30 +228,7 @@ async def generate_stl(request: GenerateRequest):
 
     Same parameters as /generate, but returns binary STL instead of OBJ.
     """
-    from services.octohedra_service import get_preset_recipe
-
-    # Convert Pydantic models to dicts
-    layers_dicts = [layer.model_dump() for layer in request.layers] if request.layers else None
-
-    # Resolve layers from preset if needed
-    six_way = request.six_way
-    grid_depth = request.grid_depth
-    grid_min_depth = request.grid_min_depth
-    if layers_dicts is None:
-        if request.preset is not None:
-            recipe_dict = get_preset_recipe(
-                request.preset,
-                depth=request.depth,
-                stack_height=request.stack_height
-            )
-            layers_dicts = recipe_dict["layers"]
-            six_way = six_way or recipe_dict.get("six_way", False)
-            # Get grid parameters from preset
-            if grid_depth is None and recipe_dict.get("grid_depth") is not None:
-                grid_depth = recipe_dict["grid_depth"]
-                grid_min_depth = recipe_dict.get("grid_min_depth", 2)
-        else:
-            layers_dicts = [{"depth": request.depth}]
+    layers_dicts, six_way, grid_depth, grid_min_depth = _resolve_recipe(request)
 
     stl_content = generate_stl_from_recipe(
         layers=layers_dicts,
@@ -236,6 +245,114 @@ async def generate_stl(request: GenerateRequest):
     )
 
 
+class TileRequest(GenerateRequest):
+    """Request body for cutting a fractal into build-plate sized tiles."""
+    tile_size: float = Field(
+        gt=0, le=1000,
+        description="Largest size of a tile along each cut axis, in the render config's units"
+    )
+    axes: Literal["x", "y", "z", "xy", "xz", "yz", "xyz"] = Field(
+        default="xyz", description="Axes to cut along"
+    )
+    file_type: Literal["stl", "obj"] = Field(default="stl", description="Format of each tile")
+
+
+@router.post("/generate/tiles")
+def generate_tiles(request: TileRequest):
+    """Generate a fractal cut into tiles that each fit on a build plate.
+
+    Same parameters as /generate, plus `tile_size`, the `axes` to cut along and the `file_type`
+    of the tiles. Cut faces are cropped flat. Returns a zip archive with one file per tile, named
+    tile_i_j_k by its position along x, y and z.
+    """
+    layers_dicts, six_way, grid_depth, grid_min_depth = _resolve_recipe(request)
+
+    try:
+        archive = generate_tiles_from_recipe(
+            layers=layers_dicts,
+            tile_size=request.tile_size,
+            config_name=request.config,
+            six_way=six_way,
+            grid_depth=grid_depth,
+            grid_min_depth=grid_min_depth,
+            file_type=request.file_type,
+            axes=request.axes,
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+    return Response(
+        content=archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=octohedra_tiles.zip"},
+    )
+
+
+class CellQueryRequest(GenerateRequest):
+    """Request body for probing which cells a recipe's grid has in a region.
+
+    The region is the box from `low` to `high`, or the L1 ball of `radius` around `center`.
+    """
+    low: list[int | None] | None = Field(
+        default=None, min_length=3, max_length=3,
+        description="Lower [x, y, z] corner of the box, inclusive. null entries are unbounded"
+    )
+    high: list[int | None] | None = Field(
+        default=None, min_length=3, max_length=3,
+        description="Upper [x, y, z] corner of the box, inclusive. null entries are unbounded"
+    )
+    center: list[int] | None = Field(
+        default=None, min_length=3, max_length=3,
+        description="Center of an L1 ball to query instead of a box"
+    )
+    radius: int = Field(default=0, ge=0, le=256, description="L1 radius around center")
+    limit: int = Field(default=10000, ge=0, le=100000, description="Most cells to return")
+
+
+@router.post("/cells")
+def get_cells(request: CellQueryRequest) -> dict:
+    """List the cells of a generated recipe inside a box or ball, without rendering it.
+
+    Coordinates are grid coordinates, after six-way mirroring and cropping at z=0. Returns
+    `count`, whether the list was `truncated` at `limit`, and `cells` as [x, y, z, kind] rows
+    (kind 1 = octahedron, 2 = tetrahedron).
+    """
+    layers_dicts, six_way, grid_depth, grid_min_depth = _resolve_recipe(request)
+
+    return query_cells(
+        layers=layers_dicts,
+        six_way=six_way,
+        grid_depth=grid_depth,
+        grid_min_depth=grid_min_depth,
+        low=request.low,
+        high=request.high,
+        center=request.center,
+        radius=request.radius,
+        limit=request.limit,
+    )
+
+
+@router.post("/analyze")
+def analyze(request: GenerateRequest) -> dict:
+    """Predict the size of a recipe's grid and mesh, without generating either.
+
+    Same parameters as /generate. Returns the number of `cells` and whether that count is
+    `exact` (otherwise it's an upper bound, counting shared cells once per part), the `low` and
+    `high` [x, y, z] grid coordinates of a box around them, their `size` in mm, and the predicted
+    `vertices`, `faces` and `bytes` of the `obj` and `stl` files. Results are cached per recipe
+    and config, so repeated requests skip the work.
+    """
+    layers_dicts, six_way, grid_depth, grid_min_depth = _resolve_recipe(request)
+
+    return analyze_recipe(
+        layers=layers_dicts,
+        config_name=request.config,
+        six_way=six_way,
+        grid_depth=grid_depth,
+        grid_min_depth=grid_min_depth,
+    )
+
+
 @router.get("/presets")
 async def get_presets() -> list[str]:
     """Get list of available preset names."""
@@ -248,8 +365,6 @@ async def get_preset(preset_name: PresetType, depth: int = 3, stack_height: int
 
     This allows the frontend to populate the recipe editor when a preset is selected.
     """
-    from octohedra.builders.RecipeBuilder import get_preset_recipe
-
     recipe = get_preset_recipe(
         name=preset_name,
         depth=depth,
@@ -1,15 +1,99 @@
+import copy
+import math
 import multiprocessing as mp
 
 from octohedra.builders.RecipeBuilder import PRESET_RECIPES, get_preset_recipe
+from octohedra.utils.LruCache import LruCache
 
 # List of available presets
 AVAILABLE_PRESETS = list(PRESET_RECIPES.keys())
 
+# Six-way mirrored recipe expressions by RecipeBuilder.structure_key, the most recently used
+# kept like its SUB_EXPRESSIONS
+SIX_WAY_EXPRESSIONS = LruCache(16)
+# Analyses by (recipe structure, six_way, config name), since counting shared cells takes a while
+ANALYSES = LruCache(64)
 
-def _generate_in_subprocess(queue, layers, config_name, six_way, grid_depth, grid_min_depth, file_type):
-    """Worker function that runs in a subprocess to generate mesh."""
-    from trimesh.exchange.export import export_mesh
+
+def build_expression(layers, six_way=False, grid_depth=None, grid_min_depth=2):
+    """A recipe's grid as a lazy GridExpression: mirrored if asked, cropped at z=0."""
+    from octohedra.builders.RecipeBuilder import RecipeBuilder
+    from octohedra.grid import GridExpression, Symmetry
+
+    builder = RecipeBuilder(
+        layers=layers,
+        grid_depth=grid_depth,
+        grid_min_depth=grid_min_depth,
+    )
+
+    # Shared with every other builder of the same recipe, so it's only worked out once
+    expression = builder.sub_expression()
+    if six_way:
+        key = builder.structure_key()
+        mirrored = SIX_WAY_EXPRESSIONS.get(key)
+        if mirrored is None:
+            mirrored = SIX_WAY_EXPRESSIONS.setdefault(
+                key, GridExpression.Symmetric(expression, Symmetry.six_way()))
+        expression = mirrored
+    return GridExpression.Crop.box(expression, z_min=0)
+
+
+def build_grid(layers, six_way=False, grid_depth=None, grid_min_depth=2):
+    """Materializes a recipe into the grid that gets rendered: mirrored if asked, cropped at z=0."""
+    from octohedra.builders.RecipeBuilder import SUB_EXPRESSIONS, RecipeBuilder
+    from octohedra.config import BUILD_WORKERS, GRID_BACKEND
+    from octohedra.grid.ColumnarGrid import ColumnarGrid
+    from octohedra.grid.OctoGrid import OctoGrid
+
+    if BUILD_WORKERS != 1:
+        builder = RecipeBuilder(layers=layers, grid_depth=grid_depth,
+                                grid_min_depth=grid_min_depth)
+        if builder.structure_key() not in SUB_EXPRESSIONS:
+            builder.build_sub_structures(BUILD_WORKERS)
+
+    # Lazily, so the crop is simplified into the recipe before any cells are built
+    expression = build_expression(layers, six_way, grid_depth, grid_min_depth)
+    return expression.materialize_into(ColumnarGrid() if GRID_BACKEND == "columnar" else OctoGrid())
+
+
+def analyze_recipe(layers, config_name="rainbow_speed", six_way=False, grid_depth=None,
+                   grid_min_depth=2) -> dict:
+    """Predicts the size of a recipe's grid and mesh without building either; see
+    Analysis.analyze. Runs in this process, since nothing big is built. The expressions it
+    evaluates stay in the bounded SIX_WAY_EXPRESSIONS and RecipeBuilder.SUB_EXPRESSIONS, and its
+    results in ANALYSES."""
     from octohedra.builders.RecipeBuilder import RecipeBuilder
+    from octohedra.grid import Analysis
+
+    builder = RecipeBuilder(layers=layers, grid_depth=grid_depth, grid_min_depth=grid_min_depth)
+    key = (builder.structure_key(), six_way, config_name)
+    analysis = ANALYSES.get(key)
+    if analysis is None:
+        expression = build_expression(layers, six_way, grid_depth, grid_min_depth)
+        analysis = ANALYSES.setdefault(key, Analysis.analyze(expression, get_config(config_name)))
+    return copy.deepcopy(analysis)
+
+
+def render_recipe(layers, config, grid_depth=None, grid_min_depth=2):
+    """A recipe's trimmed mesh, cropped at z=0. Each flake template is rendered once and reused for
+    its instances (see InstancePlan.render), unless the recipe holds cells that aren't flakes. Plans
+    are compiled once per recipe and cached in config.PLAN_DIR (see InstancePlan.cached_plan)."""
+    from octohedra.builders import InstancePlan
+    from octohedra.builders.OctoBuilder import clip_box
+    from octohedra.builders.RecipeBuilder import RecipeBuilder
+
+    try:
+        plan = InstancePlan.cached_plan(RecipeBuilder, layers=layers, grid_depth=grid_depth,
+                                        grid_min_depth=grid_min_depth)
+    except InstancePlan.NotCompilable:
+        grid = build_grid(layers, False, grid_depth, grid_min_depth)
+        grid.compute_trimming(mode="auto")
+        return grid.render(config)
+    return InstancePlan.InstancePlan(plan.instances, clip_box(z_min=0)).render(config)
+
+
+def get_config(config_name):
+    """The render config preset with the given name, rainbow_speed if there's none"""
     from octohedra.utils import OctoConfigs
 
     config_map = {
@@ -20,23 +104,21 @@ def _generate_in_subprocess(queue, layers, config_name, six_way, grid_depth, gri
         "debug": OctoConfigs.giant_debug,
     }
 
-    config = config_map.get(config_name, OctoConfigs.config_20_rainbow_speed)
+    return config_map.get(config_name, OctoConfigs.config_20_rainbow_speed)
 
-    builder = RecipeBuilder(
-        layers=layers,
-        grid_depth=grid_depth,
-        grid_min_depth=grid_min_depth,
-    )
-
-    grid = builder.materialize()
 
-    if six_way:
-        grid.six_way()
+def _generate_in_subprocess(queue, layers, config_name, six_way, grid_depth, grid_min_depth, file_type):
+    """Worker function that runs in a subprocess to generate mesh."""
+    from trimesh.exchange.export import export_mesh
 
-    grid.crop(z_min=0)
-    grid.compute_trimming()
+    config = get_config(config_name)
 
-    mesh = grid.render(config)
+    # Symmetric shapes only trim and render one sector; render works out the trimming itself
+    if six_way:
+        mesh = build_grid(layers, six_way, grid_depth, grid_min_depth).render(config,
+                                                                              symmetric=True)
+    else:
+        mesh = render_recipe(layers, config, grid_depth, grid_min_depth)
 
     if file_type == "stl":
         result = export_mesh(mesh, file_obj=None, file_type="stl")
@@ -46,13 +128,52 @@ def _generate_in_subprocess(queue, layers, config_name, six_way, grid_depth, gri
     queue.put(result)
 
 
-def _run_in_subprocess(layers, config_name, six_way, grid_depth, grid_min_depth, file_type):
+def _tiles_in_subprocess(queue, layers, config_name, six_way, grid_depth, grid_min_depth, file_type,
+                        tile_size, axes):
+    """Worker function that runs in a subprocess to cut a mesh into tiles and zip them, rendering
+    them in BUILD_WORKERS processes."""
+    import io
+
+    from octohedra.config import BUILD_WORKERS
+    from octohedra.grid import Tiling
+
+    grid = build_grid(layers, six_way, grid_depth, grid_min_depth)
+    archive = io.BytesIO()
+    Tiling.export_tiles(grid, tile_size, get_config(config_name), archive, file_type, axes,
+                        workers=BUILD_WORKERS)
+    queue.put(archive.getvalue())
+
+
+def _cells_in_subprocess(queue, layers, config_name, six_way, grid_depth, grid_min_depth, file_type,
+                        low, high, center, radius, limit):
+    """Worker function that runs in a subprocess to list a recipe's cells in a region."""
+    from octohedra.grid import Lattice
+
+    grid = build_grid(layers, six_way, grid_depth, grid_min_depth)
+    if center is not None:
+        centers = grid.within(center, radius or 0)
+    else:
+        low = [-math.inf if v is None else v for v in (low or (None,) * 3)]
+        high = [math.inf if v is None else v for v in (high or (None,) * 3)]
+        centers = grid.box(low[0], high[0], low[1], high[1], low[2], high[2])
+
+    shown = centers[:limit]
+    kinds = Lattice.classify(shown)
+    queue.put({
+        "count": len(centers),
+        "truncated": len(centers) > limit,
+        "cells": [[x, y, z, kind] for (x, y, z), kind in zip(shown.tolist(), kinds.tolist())],
+    })
+
+
+def _run_in_subprocess(layers, config_name, six_way, grid_depth, grid_min_depth, file_type,
+                       *extra, target=_generate_in_subprocess):
     """Run mesh generation in a subprocess and return the result."""
     ctx = mp.get_context("spawn")
     queue = ctx.Queue()
     proc = ctx.Process(
-        target=_generate_in_subprocess,
-        args=(queue, layers, config_name, six_way, grid_depth, grid_min_depth, file_type),
+        target=target,
+        args=(queue, layers, config_name, six_way, grid_depth, grid_min_depth, file_type, *extra),
     )
     proc.start()
     result = queue.get()
@@ -88,6 +209,29 @@ def generate_stl_from_recipe(
     return _run_in_subprocess(layers, config_name, six_way, grid_depth, grid_min_depth, "stl")
 
 
+def generate_tiles_from_recipe(
+    layers: list[dict],
+    tile_size: float,
+    config_name: str = "rainbow_speed",
+    six_way: bool = False,
+    grid_depth: int | None = None,
+    grid_min_depth: int = 2,
+    file_type: str = "stl",
+    axes: str = "xyz",
+) -> bytes:
+    """Generate a fractal cut into tiles of at most tile_size along the given axes, and return
+    them as a zip archive with one mesh file per tile.
+
+    Tiles are trimmed, rendered and exported in parallel worker processes (see
+    Tiling.export_tiles). Raises ValueError if tile_size is smaller than a cell.
+    """
+    from octohedra.grid import Tiling
+
+    Tiling.tile_span(tile_size, get_config(config_name))
+    return _run_in_subprocess(layers, config_name, six_way, grid_depth, grid_min_depth, file_type,
+                              tile_size, axes, target=_tiles_in_subprocess)
+
+
 def generate_fractal(
     layers: list[dict] = None,
     preset: str = None,
@@ -142,3 +286,27 @@ def generate_fractal(
         grid_depth=apply_grid_depth,
         grid_min_depth=apply_grid_min_depth,
     )
+
+
+def query_cells(
+    layers: list[dict],
+    six_way: bool = False,
+    grid_depth: int | None = None,
+    grid_min_depth: int = 2,
+    low: tuple | None = None,
+    high: tuple | None = None,
+    center: tuple | None = None,
+    radius: int | None = None,
+    limit: int = 10000,
+) -> dict:
+    """Which cells a recipe's grid has in a region, without rendering it.
+
+    The region is the box from low to high (missing bounds are unbounded), or with center and
+    radius, the cells at most radius from center in L1 distance.
+
+    Returns the number of cells found and up to limit of them as [x, y, z, kind] rows, kind being
+    1 for octahedra and 2 for tetrahedra. Runs in a subprocess like generation, since the grid is
+    built in full.
+    """
+    return _run_in_subprocess(layers, None, six_way, grid_depth, grid_min_depth, None,
+                              low, high, center, radius, limit, target=_cells_in_subprocess)